@@ -0,0 +1,727 @@
+# Copyright (C) 2016 Google Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Benchmarks for the Google Cloud Storage backup driver.
+
+Usage: python benchmark_google.py [benchmark ...] [options]
+
+Without arguments all benchmarks are run. The throughput benchmark backs
+up, restores and deletes synthetic volumes through GoogleBackupDriver
+against a local GCS server; see --help for its options.
+"""
+
+from __future__ import print_function
+
+import argparse
+import ast
+import base64
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import timeit
+import uuid
+
+import mock
+from oslo_utils import timeutils
+from oslo_utils import units
+import six
+
+from cinder.backup.drivers import google as google_dr
+from cinder.tests.unit.backup import fake_google_client
+from cinder.tests.unit.backup import fake_google_server
+
+
+class FakeObjectInsert(object):
+    """Object insert that completes instantly.
+
+    The MD5 is the known md5_hash if given, else it is computed from the
+    media. The number of HTTP requests the upload would take is added to
+    requests.
+    """
+
+    def __init__(self, md5_hash, media_body=None, requests=None):
+        self.md5_hash = md5_hash
+        self.media_body = media_body
+        self.requests = requests
+        self.resumable_progress = 0
+
+    def _count_requests(self):
+        media = self.media_body
+        if media.resumable():
+            # One request opens the session, then one per chunk.
+            chunks = -(-media.size() // media.chunksize())
+            self.requests['resumable'] += 1 + max(chunks, 1)
+        else:
+            self.requests['multipart'] += 1
+
+    def execute(self, *args, **kwargs):
+        md5_hash = self.md5_hash
+        if self.requests is not None:
+            self._count_requests()
+        if md5_hash is None:
+            data = self.media_body.getbytes(0, self.media_body.size())
+            md5_hash = base64.b64encode(hashlib.md5(data).digest())
+        return {u'md5Hash': md5_hash}
+
+    def next_chunk(self, *args, **kwargs):
+        return None, self.execute()
+
+
+class FakeObjects(object):
+    def __init__(self, md5_hash, requests=None):
+        self.md5_hash = md5_hash
+        self.requests = requests
+
+    def insert(self, *args, **kwargs):
+        return FakeObjectInsert(self.md5_hash, kwargs.get('media_body'),
+                                self.requests)
+
+
+class FakeConnection(object):
+    def __init__(self, md5_hash=None, requests=None):
+        self.md5_hash = md5_hash
+        self.requests = requests
+
+    def objects(self):
+        return FakeObjects(self.md5_hash, self.requests)
+
+
+class BaselineObjectWriter(object):
+    """GoogleObjectWriter before the running MD5, for bench_writer_close.
+
+    close() is the original implementation, which hashes the whole
+    buffer after the upload. Only the hash encoding differs, as the
+    original encoded the digest in a way that fails on Python 3.
+    """
+
+    def __init__(self, bucket, object_name, conn, writer_chunk_size,
+                 num_retries, resumable):
+        self.bucket = bucket
+        self.object_name = object_name
+        self.conn = conn
+        self.data = bytearray()
+        self.chunk_size = writer_chunk_size
+        self.num_retries = num_retries
+        self.resumable = resumable
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        media = google_dr.http.MediaIoBaseUpload(
+            six.BytesIO(self.data), 'application/octet-stream',
+            chunksize=self.chunk_size, resumable=self.resumable)
+        resp = self.conn.objects().insert(
+            bucket=self.bucket,
+            name=self.object_name,
+            body={},
+            media_body=media).execute(num_retries=self.num_retries)
+        etag = resp['md5Hash'].encode('utf-8')
+        md5 = base64.b64encode(hashlib.md5(self.data).digest())
+        if etag != md5:
+            raise AssertionError('MD5 of object: %s before: %s and after: '
+                                 '%s is not same.' % (self.object_name,
+                                                      md5, etag))
+        return md5
+
+
+def _median(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2]
+
+
+def _report(name, samples, unit='ms'):
+    print('%-40s %10.2f %s' % (name, _median(samples), unit))
+
+
+def bench_writer_close(object_size=50 * units.Mi, rounds=5):
+    """Per-object GoogleObjectWriter.close() latency.
+
+    The upload itself is instant, so the numbers show the work close()
+    does on the critical path. The original close(), which hashes the
+    whole buffer after the upload, is timed alongside to show the cost
+    the running MD5 removes.
+    """
+    data = os.urandom(object_size)
+    md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode('utf-8')
+    conn = FakeConnection(md5_hash)
+    before = []
+    after = []
+    for _i in range(rounds):
+        for writer_class, samples in (
+                (BaselineObjectWriter, before),
+                (google_dr.GoogleObjectWriter, after)):
+            writer = writer_class('bucket', 'object', conn, 2 * units.Mi,
+                                  0, True)
+            writer.write(data)
+
+            start = timeit.default_timer()
+            writer.close()
+            samples.append((timeit.default_timer() - start) * 1000)
+
+    print('GoogleObjectWriter.close(), %d MiB object' % (object_size //
+                                                         units.Mi))
+    _report('  original close(), md5 at close', before)
+    _report('  running md5', after)
+
+
+def bench_upload_requests(objects=64, object_size=8 * units.Mi,
+                          chunk_size=2 * units.Mi):
+    """HTTP requests per backup with and without multipart uploads.
+
+    Half of the objects compress well, as sparse or zeroed volume areas
+    do, and half not at all. The metadata and sha256 files are uploaded
+    at the end of the backup.
+    """
+    sizes = [8 * units.Ki, object_size] * (objects // 2)
+    sizes += [16 * units.Ki, 256 * units.Ki]
+    data = os.urandom(object_size)
+    threshold = google_dr.CONF.backup_gcs_writer_resumable_threshold
+
+    print('Upload requests per backup, %d objects' % len(sizes))
+    for name, resumable_threshold in (('always resumable', 0),
+                                      ('multipart threshold', threshold)):
+        requests = {'multipart': 0, 'resumable': 0}
+        conn = FakeConnection(requests=requests)
+        for size in sizes:
+            writer = google_dr.GoogleObjectWriter(
+                'bucket', 'object', conn, chunk_size, 0, True,
+                resumable_threshold=resumable_threshold)
+            writer.write(data[:size])
+            writer.close()
+        print('  %-38s %5d requests (%d multipart, %d resumable)' % (
+            name, requests['multipart'] + requests['resumable'],
+            requests['multipart'], requests['resumable']))
+
+
+class SyntheticVolume(object):
+    """Volume file of generated data that needs no memory per GiB.
+
+    Each 1 MiB block is random bytes padded with zeros, compressibility
+    being the zeroed share. The random bytes are slices of a shared pool
+    at offsets varying by block, so blocks do not repeat within the
+    compressors' windows.
+    """
+
+    block_size = units.Mi
+    pool_size = 16 * units.Mi
+
+    def __init__(self, size, compressibility):
+        self.size = size
+        self.compressibility = compressibility
+        self.pool = os.urandom(self.pool_size)
+        self.zeros = b'\0' * int(self.block_size * compressibility)
+        self.offset = 0
+
+    def _block(self, index):
+        start = (index * 65537 * 17) % (self.pool_size - self.block_size)
+        return (self.pool[start:start + self.block_size - len(self.zeros)] +
+                self.zeros)
+
+    def data(self, offset, length):
+        length = max(0, min(length, self.size - offset))
+        pieces = []
+        while length > 0:
+            index, start = divmod(offset, self.block_size)
+            piece = self._block(index)[start:start + length]
+            pieces.append(piece)
+            offset += len(piece)
+            length -= len(piece)
+        return b''.join(pieces)
+
+    def read(self, length=-1):
+        if length < 0:
+            length = self.size - self.offset
+        data = self.data(self.offset, length)
+        self.offset += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        self.offset = offset
+
+    def tell(self):
+        return self.offset
+
+
+class RestoreVerifier(object):
+    """Volume file that compares restored data with a SyntheticVolume."""
+
+    def __init__(self, volume):
+        self.volume = volume
+        self.offset = 0
+        self.written = 0
+        self.mismatches = 0
+
+    def write(self, data):
+        if data != self.volume.data(self.offset, len(data)):
+            self.mismatches += 1
+        self.offset += len(data)
+        self.written += len(data)
+
+    def seek(self, offset, whence=0):
+        self.offset = offset
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def fileno(self):
+        raise IOError('RestoreVerifier has no file descriptor.')
+
+
+class BenchmarkBackup(object):
+    """The backup fields the driver uses, without a database."""
+
+    def __init__(self, volume_id, size):
+        self.id = str(uuid.uuid4())
+        self.volume_id = volume_id
+        self.size = size
+        self.container = None
+        self.service_metadata = None
+        self.parent_id = None
+        self.parent = None
+        self.display_name = 'benchmark'
+        self.display_description = 'throughput benchmark'
+        self.created_at = timeutils.utcnow()
+        self.data_timestamp = self.created_at
+        self.availability_zone = None
+        self.object_count = 0
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def save(self):
+        pass
+
+
+class BenchmarkVolumes(object):
+    """Answers the driver's volume lookups for BenchmarkBackups."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def volume_get(self, context, volume_id):
+        return {'id': volume_id, 'size': self.size}
+
+
+class StepTimer(object):
+    """Wall time, CPU time and peak RSS of the steps of a backup or restore.
+
+    The CPU time is the calling thread's where time.thread_time exists,
+    so uploads running in other threads are not counted in their step.
+    Each timed call restarts peak RSS tracking, and peak_rss keeps the
+    highest peak seen in or between the calls.
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self.peak_rss = 0
+
+    def reset(self):
+        self.steps = {}
+        self.peak_rss = 0
+
+    def wrap(self, step, func):
+        """Return func, timed as part of step."""
+        @functools.wraps(func)
+        def _timed(*args, **kwargs):
+            self.peak_rss = max(self.peak_rss, _peak_rss())
+            _reset_peak_rss()
+            cpu = _thread_cpu_time()
+            start = timeit.default_timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                result = self.steps.setdefault(step, {
+                    'seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss': 0,
+                    'calls': 0})
+                result['seconds'] += timeit.default_timer() - start
+                result['cpu_seconds'] += _thread_cpu_time() - cpu
+                result['peak_rss'] = max(result['peak_rss'], _peak_rss())
+                result['calls'] += 1
+                self.peak_rss = max(self.peak_rss, result['peak_rss'])
+        return _timed
+
+
+class BenchmarkDriver(google_dr.GoogleBackupDriver):
+    """GoogleBackupDriver without database access, timing its steps.
+
+    bench_throughput replaces the usage notifications, which need an RPC
+    notifier. Compression, object uploads and downloads, including the
+    waits for the upload pool, are timed in timer.
+    """
+
+    def __init__(self, volume_size):
+        super(BenchmarkDriver, self).__init__(None)
+        self.db = BenchmarkVolumes(-(-volume_size // units.Gi))
+        self.timer = StepTimer()
+        if self.upload_pool is not None:
+            self.upload_pool.wait = self.timer.wrap('upload',
+                                                    self.upload_pool.wait)
+
+    def _prepare_output_data(self, data):
+        return self.timer.wrap(
+            'compress',
+            super(BenchmarkDriver, self)._prepare_output_data)(data)
+
+    def get_object_writer(self, bucket, object_name, extra_metadata=None):
+        writer = super(BenchmarkDriver, self).get_object_writer(
+            bucket, object_name, extra_metadata)
+        writer.write = self.timer.wrap('upload', writer.write)
+        writer.close = self.timer.wrap('upload', writer.close)
+        return writer
+
+    def get_object_reader(self, bucket, object_name, extra_metadata=None):
+        reader = super(BenchmarkDriver, self).get_object_reader(
+            bucket, object_name, extra_metadata)
+        reader.read = self.timer.wrap('download', reader.read)
+        return reader
+
+
+def _serve(conn, latency, bandwidth, error_rate, crc32c, store):
+    """Run a FakeGoogleServer, answering stats requests over conn."""
+    storage = fake_google_server.FakeGoogleStorage(
+        latency, bandwidth, error_rate, crc32c=crc32c, store=store)
+    server = fake_google_server.FakeGoogleServer(storage).start()
+    conn.send(server.discovery_document())
+    while conn.recv() == 'stats':
+        with storage._lock:
+            objects = [data for bucket in storage.buckets.values()
+                       for _obj, data in bucket.values()]
+        conn.send({'requests': dict(storage.requests),
+                   'bytes_in': storage.bytes_in,
+                   'bytes_out': storage.bytes_out,
+                   'objects': len(objects),
+                   'stored_bytes': sum(len(data) for data in objects)})
+    server.stop()
+    storage.close()
+
+
+class BenchmarkServer(object):
+    """FakeGoogleServer in a child process.
+
+    The server keeps its own CPU time and memory, holding the objects,
+    out of the driver's measurements. store is where it keeps object
+    data, see FakeGoogleStorage.
+    """
+
+    def __init__(self, latency, bandwidth, error_rate, crc32c,
+                 store='memory'):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_serve,
+            args=(child_conn, latency, bandwidth, error_rate, crc32c,
+                  store))
+        self.process.daemon = True
+        self.process.start()
+        self.discovery = self.conn.recv()
+
+    def stats(self):
+        self.conn.send('stats')
+        return self.conn.recv()
+
+    def stop(self):
+        self.conn.send('stop')
+        self.process.join()
+
+
+def _peak_rss():
+    """Return the peak resident set size in bytes."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * units.Ki
+    except IOError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    return maxrss if sys.platform == 'darwin' else maxrss * units.Ki
+
+
+def _reset_peak_rss():
+    """Restart peak RSS tracking at the current RSS, where supported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except IOError:
+        pass
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _thread_cpu_time():
+    # time.thread_time is new in Python 3.7.
+    thread_time = getattr(time, 'thread_time', None)
+    return thread_time() if thread_time else _cpu_time()
+
+
+def _measure(server, timer, func, *args):
+    """Run func, returning its wall time, CPU time, memory and requests.
+
+    The times and memory of the steps timer sees are returned too.
+    """
+    before = server.stats()
+    timer.reset()
+    _reset_peak_rss()
+    cpu = _cpu_time()
+    start = timeit.default_timer()
+    func(*args)
+    seconds = timeit.default_timer() - start
+    cpu = _cpu_time() - cpu
+    after = server.stats()
+    requests = dict((kind, count - before['requests'].get(kind, 0))
+                    for kind, count in after['requests'].items()
+                    if count != before['requests'].get(kind, 0))
+    return {'seconds': seconds,
+            'cpu_seconds': cpu,
+            'peak_rss': max(_peak_rss(), timer.peak_rss),
+            'steps': timer.steps,
+            'requests': requests,
+            'bytes_sent': after['bytes_in'] - before['bytes_in'],
+            'bytes_received': after['bytes_out'] - before['bytes_out'],
+            'stored_bytes': after['stored_bytes'],
+            'stored_objects': after['objects']}
+
+
+def _run_volume(server, size, compressibility, restore=True):
+    volume = SyntheticVolume(size, compressibility)
+    backup = BenchmarkBackup(str(uuid.uuid4()), -(-size // units.Gi))
+    driver = BenchmarkDriver(size)
+    timer = driver.timer
+    # Generating the volume data is timed to tell it from the driver's.
+    volume.read = timer.wrap('read', volume.read)
+    stages = {}
+    stages['backup'] = _measure(server, timer, driver.backup, backup,
+                                volume, False)
+    if restore:
+        verifier = RestoreVerifier(volume)
+        verifier.write = timer.wrap('write', verifier.write)
+        stages['restore'] = _measure(server, timer, driver.restore, backup,
+                                     backup.volume_id, verifier)
+        if verifier.mismatches or verifier.written != size:
+            raise AssertionError('Restored %d of %d bytes with %d '
+                                 'mismatching writes.' % (
+                                     verifier.written, size,
+                                     verifier.mismatches))
+    stages['delete'] = _measure(server, timer, driver.delete, backup)
+    for stage in ('backup', 'restore'):
+        if stage in stages:
+            stages[stage]['throughput'] = size / stages[stage]['seconds']
+    return stages
+
+
+def _print_run(run):
+    print('  %d MiB volume, %d%% zeros, %.1f%% stored' % (
+        run['size'] // units.Mi, run['compressibility'] * 100,
+        100.0 * run['stages']['backup']['stored_bytes'] / run['size']))
+    for stage in ('backup', 'restore', 'delete'):
+        if stage not in run['stages']:
+            continue
+        result = run['stages'][stage]
+        throughput = ''
+        if 'throughput' in result:
+            throughput = '%8.1f MiB/s' % (result['throughput'] / units.Mi)
+        print('    %-8s %14s %8.2f s %6d requests %7.2f s CPU %7d MiB RSS' % (
+            stage, throughput, result['seconds'],
+            sum(result['requests'].values()), result['cpu_seconds'],
+            result['peak_rss'] // units.Mi))
+        steps = result.get('steps', {})
+        for step in ('read', 'compress', 'upload', 'download', 'write'):
+            if step not in steps:
+                continue
+            step_result = steps[step]
+            print('      %-10s %12s %8.2f s %6d calls    %7.2f s CPU '
+                  '%7d MiB RSS' % (
+                      step, '', step_result['seconds'], step_result['calls'],
+                      step_result['cpu_seconds'],
+                      step_result['peak_rss'] // units.Mi))
+
+
+def _compare(runs, baseline_file):
+    """Print the throughput change of each run against stored results."""
+    with open(baseline_file) as f:
+        baseline = dict(((run['size'], run['compressibility']), run)
+                        for run in json.load(f)['runs'])
+    print('Compared with %s' % baseline_file)
+    for run in runs:
+        old = baseline.get((run['size'], run['compressibility']))
+        if old is None:
+            continue
+        for stage in ('backup', 'restore', 'delete'):
+            if stage not in old['stages'] or stage not in run['stages']:
+                continue
+            seconds = old['stages'][stage]['seconds']
+            print('  %d MiB volume, %d%% zeros, %-8s %+7.1f%% time' % (
+                run['size'] // units.Mi, run['compressibility'] * 100,
+                stage, 100.0 * (run['stages'][stage]['seconds'] - seconds) /
+                seconds))
+
+
+def bench_throughput(sizes=(units.Gi,), compressibilities=(0.0, 0.5, 0.9),
+                     latency=0, bandwidth=0, error_rate=0, options=None,
+                     results_file=None, baseline_file=None, store='memory'):
+    """Backup, restore and delete throughput against a local GCS server.
+
+    Synthetic volumes are backed up, restored, verified and deleted
+    through the driver and apiclient, over HTTP to a FakeGoogleServer in
+    a child process with the given latency, bandwidth and error rate.
+    Each stage reports throughput, the GCS requests it sent and the
+    driver's CPU time and peak RSS, and the same for its steps: reading
+    the volume, compressing, uploading, downloading and writing the
+    volume. The server keeps the objects as store says: in memory,
+    needing as much free memory as incompressible volumes, on disk, or
+    nowhere, in which case restores are skipped.
+    """
+    options = dict(options or {})
+    results = {'date': timeutils.utcnow().isoformat(),
+               'python': platform.python_version(),
+               'latency': latency,
+               'bandwidth': bandwidth,
+               'error_rate': error_rate,
+               'store': store,
+               'options': dict(options),
+               'runs': []}
+    conf = google_dr.CONF
+    crc32c = (options.get('backup_gcs_checksum_algorithm',
+                          conf.backup_gcs_checksum_algorithm) != 'md5')
+    server = BenchmarkServer(latency, bandwidth, error_rate, crc32c, store)
+    fd, discovery_file = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        f.write(server.discovery)
+    options.update(backup_gcs_discovery_file=discovery_file,
+                   backup_gcs_bucket='benchmark',
+                   backup_gcs_project_id='benchmark',
+                   backup_gcs_credential_file='benchmark')
+    for name, value in options.items():
+        conf.set_override(name, value)
+
+    print('Backup throughput, latency %g s, bandwidth %s' % (
+        latency, '%d MiB/s' % (bandwidth // units.Mi) if bandwidth
+        else 'unlimited'))
+    runs = results['runs']
+    try:
+        with mock.patch.object(google_dr.client, 'GoogleCredentials',
+                               fake_google_client.FakeGoogleCredentials), \
+                mock.patch.object(google_dr.volume_utils,
+                                  'notify_about_backup_usage'):
+            for size in sizes:
+                for compressibility in compressibilities:
+                    run = {'size': size, 'compressibility': compressibility,
+                           'stages': _run_volume(server, size,
+                                                 compressibility,
+                                                 store != 'discard')}
+                    _print_run(run)
+                    runs.append(run)
+    finally:
+        for name in options:
+            conf.clear_override(name)
+        while google_dr._transports:
+            google_dr._transports.popitem()[1].close()
+        server.stop()
+        os.remove(discovery_file)
+
+    if baseline_file:
+        _compare(runs, baseline_file)
+    if results_file:
+        with open(results_file, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+BENCHMARKS = {
+    'close': bench_writer_close,
+    'throughput': bench_throughput,
+    'upload-requests': bench_upload_requests,
+}
+
+
+def _size(value):
+    """Parse a size such as 512M or 10G into bytes."""
+    multipliers = {'K': units.Ki, 'M': units.Mi, 'G': units.Gi}
+    value = value.upper().rstrip('IB')
+    if value[-1:] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def _option(value):
+    """Parse a NAME=VALUE driver option override."""
+    name, _sep, value = value.partition('=')
+    try:
+        value = ast.literal_eval(value)
+    except (SyntaxError, ValueError):
+        pass
+    return name, value
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks for the Google Cloud Storage backup driver.')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='Benchmarks to run: %s.' % ', '.join(
+                            sorted(BENCHMARKS)))
+    parser.add_argument('--size', type=_size, nargs='+', default=[units.Gi],
+                        help='Volume sizes for throughput, e.g. 1G 10G.')
+    parser.add_argument('--compressibility', type=float, nargs='+',
+                        default=[0.0, 0.5, 0.9],
+                        help='Zeroed shares of the throughput volumes.')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Seconds the GCS server adds to each request.')
+    parser.add_argument('--bandwidth', type=_size, default=0,
+                        help='GCS server bandwidth per second, e.g. 100M.')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Share of GCS requests failing with 429 or 503.')
+    parser.add_argument('--store',
+                        choices=fake_google_server.FakeGoogleStorage.STORES,
+                        default='memory',
+                        help='Where the GCS server keeps object data. With '
+                             'discard, restores are skipped.')
+    parser.add_argument('--option', type=_option, action='append',
+                        default=[], metavar='NAME=VALUE',
+                        help='Driver option to set, e.g. '
+                             'backup_gcs_writer_streaming=True.')
+    parser.add_argument('--results', metavar='FILE',
+                        help='Store throughput results as JSON in FILE.')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Compare throughput with results in FILE.')
+    args = parser.parse_args(argv)
+
+    benchmarks = dict(BENCHMARKS, throughput=functools.partial(
+        bench_throughput, args.size, args.compressibility, args.latency,
+        args.bandwidth, args.error_rate, dict(args.option), args.results,
+        args.compare, args.store))
+    for name in args.benchmarks or sorted(benchmarks):
+        if name not in benchmarks:
+            parser.error('unknown benchmark %s' % name)
+        benchmarks[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -28,12 +28,16 @@ class FakeGoogleObjectInsertExecute(object):
 
     def __init__(self, *args, **kwargs):
         self.container_name = kwargs['bucket']
+        self.resumable_progress = 0
 
     def execute(self, *args, **kwargs):
         if self.container_name == 'gcs_api_failure':
             raise errors.Error
         return {u'md5Hash': u'Z2NzY2luZGVybWQ1'}
 
+    def next_chunk(self, *args, **kwargs):
+        return None, self.execute(*args, **kwargs)
+
 
 class FakeGoogleObjectListExecute(object):
 
@@ -49,16 +53,43 @@ class FakeGoogleObjectListExecute(object):
                           {'name': 'backup_003'}]}
 
 
-class FakeGoogleBucketListExecute(object):
+class FakeGoogleObjectDeleteExecute(object):
+
+    def __init__(self, *args, **kwargs):
+        self.container_name = kwargs['bucket']
+
+    def execute(self, *args, **kwargs):
+        if self.container_name == 'gcs_api_failure':
+            raise errors.HttpError(FakeGoogleResponse(403), b'')
+
+
+class FakeGoogleBatchHttpRequest(object):
+    """Executes the batched requests one at a time."""
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        for request_id, request in self.requests:
+            try:
+                response, err = request.execute(http=http), None
+            except errors.HttpError as e:
+                response, err = None, e
+            self.callback(request_id, response, err)
+
+
+class FakeGoogleBucketGetExecute(object):
 
     def __init__(self, *args, **kwargs):
-        self.container_name = kwargs['prefix']
+        self.container_name = kwargs['bucket']
 
     def execute(self, *args, **kwargs):
         if self.container_name == 'gcs_oauth2_failure':
             raise client.Error
-        return {u'items': [{u'name': u'gcscinderbucket'},
-                           {u'name': u'gcsbucket'}]}
+        return {u'name': self.container_name}
 
 
 class FakeGoogleBucketInsertExecute(object):
@@ -83,11 +114,14 @@ class FakeGoogleObject(object):
     def list(self, *args, **kwargs):
         return FakeGoogleObjectListExecute(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        return FakeGoogleObjectDeleteExecute(*args, **kwargs)
+
 
 class FakeGoogleBucket(object):
 
-    def list(self, *args, **kwargs):
-        return FakeGoogleBucketListExecute(*args, **kwargs)
+    def get(self, *args, **kwargs):
+        return FakeGoogleBucketGetExecute(*args, **kwargs)
 
     def insert(self, *args, **kwargs):
         return FakeGoogleBucketInsertExecute()
@@ -111,6 +145,9 @@ class FakeDiscoveryBuild(object):
     def objects(self):
         return FakeGoogleObject()
 
+    def new_batch_http_request(self, callback=None):
+        return FakeGoogleBatchHttpRequest(callback)
+
     def buckets(self):
         return FakeGoogleBucket()
 
@@ -121,7 +158,17 @@ class FakeGoogleCredentials(object):
 
     @classmethod
     def from_stream(self, *args, **kwargs):
-        pass
+        return FakeGoogleCredentials()
+
+    def create_scoped_required(self):
+        return False
+
+    def authorize(self, http):
+        return http
+
+    def get_access_token(self, http=None):
+        return client.AccessTokenInfo(access_token='fake-token',
+                                      expires_in=3600)
 
 
 class FakeGoogleMediaIoBaseDownload(object):
@@ -146,9 +193,69 @@ class FakeGoogleMediaIoBaseDownload(object):
             metadata_json = json.dumps(metadata, sort_keys=True, indent=2)
             if six.PY3:
                 metadata_json = metadata_json.encode('utf-8')
-            fh.write(metadata_json)
+            data = metadata_json
         else:
-            fh.write(zlib.compress(os.urandom(units.Mi)))
+            data = zlib.compress(os.urandom(units.Mi))
+        self.buffer = bytearray(data)
+        if fh is not None:
+            fh.write(data)
 
     def next_chunk(self, **kwargs):
         return (100, True)
+
+    def fetch_all(self, **kwargs):
+        return bytes(self.buffer)
+
+    def check_hashes(self):
+        pass
+
+
+class FakeGoogleResponse(dict):
+    def __init__(self, status, headers=None):
+        super(FakeGoogleResponse, self).__init__(headers or {})
+        self.status = status
+        self.reason = six.moves.http_client.responses.get(status, '')
+
+
+class FakeGoogleRangeHttp(object):
+    """Serves range requests for a single object from memory."""
+    def __init__(self, data, goog_hash=None):
+        self.data = data
+        self.requests = []
+        self.headers = {}
+        if goog_hash is not None:
+            self.headers['x-goog-hash'] = goog_hash
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        headers = headers or {}
+        self.requests.append(headers)
+        if 'range' not in headers:
+            return FakeGoogleResponse(200, self.headers), self.data
+        start, end = headers['range'].split('=')[1].split('-')
+        start = int(start)
+        end = min(int(end), len(self.data) - 1)
+        content_range = 'bytes %d-%d/%d' % (start, end, len(self.data))
+        resp_headers = dict(self.headers, **{'content-range': content_range})
+        return (FakeGoogleResponse(206, resp_headers),
+                self.data[start:end + 1])
+
+
+class FakeGoogleSequenceHttp(object):
+    """Returns the given responses in order, raising exceptions given."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.requests.append((method, headers))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class FakeGoogleMediaRequest(object):
+    def __init__(self, http, uri='https://fake/o/backup_001?alt=media'):
+        self.http = http
+        self.uri = uri
+        self.headers = {}
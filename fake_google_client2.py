@@ -20,9 +20,31 @@ import tempfile
 
 class FakeGoogleObjectInsertExecute(object):
 
+    def __init__(self, object_path, media_body):
+        self.object_path = object_path
+        self.media_body = media_body
+        self.resumable_progress = 0
+
     def execute(self, *args, **kwargs):
+        with open(self.object_path, 'wb') as object_file:
+            object_file.write(self.media_body.getbytes(
+                0, self.media_body.size()))
+
         return {u'md5Hash': u'Z2NzY2luZGVybWQ1'}
 
+    def next_chunk(self, *args, **kwargs):
+        chunksize = self.media_body.chunksize()
+        data = self.media_body.getbytes(self.resumable_progress, chunksize)
+        mode = 'ab' if self.resumable_progress else 'wb'
+        with open(self.object_path, mode) as object_file:
+            object_file.write(data)
+        self.resumable_progress += len(data)
+
+        if (len(data) < chunksize or
+                self.resumable_progress == self.media_body.size()):
+            return None, {u'md5Hash': u'Z2NzY2luZGVybWQ1'}
+        return None, None
+
 
 class FakeGoogleObjectListExecute(object):
 
@@ -43,11 +65,13 @@ class FakeGoogleObjectListExecute(object):
         return {'items': fake_body}
 
 
-class FakeGoogleBucketListExecute(object):
+class FakeGoogleBucketGetExecute(object):
+
+    def __init__(self, *args, **kwargs):
+        self.container_name = kwargs['bucket']
 
     def execute(self, *args, **kwargs):
-        return {u'items': [{u'name': u'gcscinderbucket'},
-                           {u'name': u'gcsbucket'}]}
+        return {u'name': self.container_name}
 
 
 class FakeGoogleBucketInsertExecute(object):
@@ -66,12 +90,8 @@ class FakeGoogleObject(object):
     def insert(self, *args, **kwargs):
         object_path = (tempfile.gettempdir() + '/' + kwargs['bucket'] + '/' +
                        kwargs['name'])
-        kwargs['media_body']._fd.getvalue()
-        with open(object_path, 'wb') as object_file:
-            kwargs['media_body']._fd.seek(0)
-            object_file.write(kwargs['media_body']._fd.read())
-
-        return FakeGoogleObjectInsertExecute()
+        return FakeGoogleObjectInsertExecute(object_path,
+                                             kwargs['media_body'])
 
     def get_media(self, *args, **kwargs):
         return FakeMediaObject(*args, **kwargs)
@@ -82,8 +102,8 @@ class FakeGoogleObject(object):
 
 class FakeGoogleBucket(object):
 
-    def list(self, *args, **kwargs):
-        return FakeGoogleBucketListExecute()
+    def get(self, *args, **kwargs):
+        return FakeGoogleBucketGetExecute(*args, **kwargs)
 
     def insert(self, *args, **kwargs):
         return FakeGoogleBucketInsertExecute()
@@ -117,7 +137,13 @@ class FakeGoogleCredentials(object):
 
     @classmethod
     def from_stream(self, *args, **kwargs):
-        pass
+        return FakeGoogleCredentials()
+
+    def create_scoped_required(self):
+        return False
+
+    def authorize(self, http):
+        return http
 
 
 class FakeGoogleMediaIoBaseDownload(object):
@@ -125,7 +151,15 @@ class FakeGoogleMediaIoBaseDownload(object):
         object_path = (tempfile.gettempdir() + '/' + req.bucket_name + '/' +
                        req.object_name)
         with open(object_path, 'rb') as object_file:
-            fh.write(object_file.read())
+            self.buffer = bytearray(object_file.read())
+        if fh is not None:
+            fh.write(self.buffer)
 
     def next_chunk(self, **kwargs):
         return (100, True)
+
+    def fetch_all(self, **kwargs):
+        return bytes(self.buffer)
+
+    def check_hashes(self):
+        pass
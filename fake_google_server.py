@@ -0,0 +1,637 @@
+# Copyright (C) 2016 Google Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Local Google Cloud Storage server for the Google backup driver.
+
+Serves, from memory or disk, the part of the GCS JSON API the driver
+uses: bucket get, insert and list, object list, get with Range, delete and
+compose, media, multipart and resumable uploads, and batch requests.
+Latency, shared bandwidth and error rates can be injected, so retries,
+ranges and throughput features can be tested and benchmarked without GCS.
+Object data can also be discarded, keeping only its size and hashes, for
+backup benchmarks larger than memory and disk.
+
+discovery_document() returns a storage v1 discovery document pointing at
+the server, for the driver's backup_gcs_discovery_file option.
+
+Usage: python fake_google_server.py [--port PORT] [--latency SECONDS]
+           [--bandwidth BYTES_PER_SECOND] [--error-rate RATE]
+           [--store {memory,disk,discard}] [--discovery-file PATH]
+"""
+
+from __future__ import print_function
+
+import argparse
+import base64
+import collections
+import email.parser
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import six
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+from six.moves import urllib
+
+from cinder.backup.drivers import google as google_dr
+
+
+def _discovery_method(http_method, path, parameters, request=None,
+                      response=None, **kwargs):
+    method = {'httpMethod': http_method,
+              'path': path,
+              'parameters': {},
+              'parameterOrder': []}
+    for name, location, param_type, required in parameters:
+        method['parameters'][name] = {'type': param_type,
+                                      'location': location,
+                                      'required': required}
+        if required:
+            method['parameterOrder'].append(name)
+    if request:
+        method['request'] = {'$ref': request}
+    if response:
+        method['response'] = {'$ref': response}
+    method.update(kwargs)
+    return method
+
+
+def discovery_document(root_url):
+    """Return a storage v1 discovery document for a server at root_url."""
+    bucket = ('bucket', 'path', 'string', True)
+    obj = ('object', 'path', 'string', True)
+    listing = [('maxResults', 'query', 'integer', False),
+               ('pageToken', 'query', 'string', False),
+               ('prefix', 'query', 'string', False)]
+    upload_path = '/upload/storage/v1/b/{bucket}/o'
+    schemas = dict((name, {'id': name, 'type': 'object'})
+                   for name in ('Bucket', 'Buckets', 'ComposeRequest',
+                                'Object', 'Objects'))
+    document = {
+        'kind': 'discovery#restDescription',
+        'discoveryVersion': 'v1',
+        'id': 'storage:v1',
+        'name': 'storage',
+        'version': 'v1',
+        'rootUrl': root_url,
+        'servicePath': 'storage/v1/',
+        'batchPath': 'batch/storage/v1',
+        'parameters': {
+            'alt': {'type': 'string', 'location': 'query',
+                    'default': 'json'},
+            'fields': {'type': 'string', 'location': 'query'},
+        },
+        'schemas': schemas,
+        'resources': {
+            'buckets': {'methods': {
+                'get': _discovery_method('GET', 'b/{bucket}', [bucket],
+                                         response='Bucket'),
+                'insert': _discovery_method(
+                    'POST', 'b', [('project', 'query', 'string', True)],
+                    request='Bucket', response='Bucket'),
+                'list': _discovery_method(
+                    'GET', 'b',
+                    [('project', 'query', 'string', True)] + listing,
+                    response='Buckets'),
+            }},
+            'objects': {'methods': {
+                'list': _discovery_method('GET', 'b/{bucket}/o',
+                                          [bucket] + listing,
+                                          response='Objects'),
+                'insert': _discovery_method(
+                    'POST', 'b/{bucket}/o',
+                    [bucket, ('name', 'query', 'string', False)],
+                    request='Object', response='Object',
+                    supportsMediaUpload=True,
+                    mediaUpload={'accept': ['*/*'], 'protocols': {
+                        'simple': {'multipart': True, 'path': upload_path},
+                        'resumable': {'multipart': True,
+                                      'path': upload_path}}}),
+                'get': _discovery_method('GET', 'b/{bucket}/o/{object}',
+                                         [bucket, obj], response='Object',
+                                         supportsMediaDownload=True),
+                'delete': _discovery_method('DELETE',
+                                            'b/{bucket}/o/{object}',
+                                            [bucket, obj]),
+                'compose': _discovery_method(
+                    'POST', 'b/{destinationBucket}/o/{destinationObject}/'
+                    'compose',
+                    [('destinationBucket', 'path', 'string', True),
+                     ('destinationObject', 'path', 'string', True)],
+                    request='ComposeRequest', response='Object'),
+            }},
+        },
+    }
+    for resource_name, resource in document['resources'].items():
+        for method_name, method in resource['methods'].items():
+            method['id'] = 'storage.%s.%s' % (resource_name, method_name)
+    return document
+
+
+class GCSError(Exception):
+    def __init__(self, status, message=''):
+        super(GCSError, self).__init__(message)
+        self.status = status
+
+
+class DiskObjectData(object):
+    """Data of an object kept in a file, read back by slices."""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.size = len(data)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        start, stop, _step = index.indices(self.size)
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(max(0, stop - start))
+
+    def delete(self):
+        os.remove(self.path)
+
+
+class DiscardedObjectData(object):
+    """Size of an object whose data was not kept."""
+
+    def __init__(self, data):
+        self.size = len(data)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        raise GCSError(404, 'Object data is not stored')
+
+    def delete(self):
+        pass
+
+
+class FakeGoogleStorage(object):
+    """In-memory GCS with injectable latency, bandwidth and errors.
+
+    latency is added to every HTTP request, bandwidth in bytes per second
+    is shared by all request and response bodies, and error_rate is the
+    share of API requests failing with one of error_codes, by default the
+    rate limit and unavailable statuses GCS returns under load.
+    fail_next() queues statuses for the next requests instead. requests
+    counts the API requests by kind, and bytes_in and bytes_out the body
+    bytes.
+
+    store is where object data is kept: memory, disk, as files in a
+    temporary directory removed by close(), or discard, which keeps only
+    sizes and hashes, so objects cannot be read or composed.
+    """
+
+    STORES = ('memory', 'disk', 'discard')
+
+    def __init__(self, latency=0, bandwidth=0, error_rate=0,
+                 error_codes=(429, 503), crc32c=True, seed=None,
+                 store='memory'):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        # Computing CRC32C without google-crc32c is slow for large objects.
+        self.crc32c = crc32c
+        if store not in self.STORES:
+            raise ValueError('Unknown store: %s' % store)
+        self.store = store
+        self.directory = None
+        if store == 'disk':
+            self.directory = tempfile.mkdtemp(prefix='fake-gcs-')
+        # Set by the server, which knows its address.
+        self.root_url = None
+        self.discovery = None
+        self.buckets = {}
+        self.uploads = {}
+        self.requests = collections.Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._failures = []
+        self._random = random.Random(seed)
+        # Requests are served by several threads. Held when changing
+        # buckets and uploads, and reentrant as batches nest requests.
+        self._lock = threading.RLock()
+        self._link_free = 0
+
+    def close(self):
+        """Remove the object files of a disk store."""
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def fail_next(self, *statuses):
+        """Fail the next API requests with the given HTTP statuses."""
+        with self._lock:
+            self._failures.extend(statuses)
+
+    def count_bytes(self, bytes_in=0, bytes_out=0):
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def throttle(self, nbytes):
+        """Wait until nbytes can pass through the shared link."""
+        if not self.bandwidth or not nbytes:
+            return
+        with self._lock:
+            now = time.time()
+            self._link_free = (max(now, self._link_free) +
+                               float(nbytes) / self.bandwidth)
+            wait = self._link_free - now
+        time.sleep(wait)
+
+    def _inject_error(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+            if self._failures:
+                status = self._failures.pop(0)
+            elif self.error_rate and self._random.random() < self.error_rate:
+                status = self._random.choice(self.error_codes)
+            else:
+                return
+        raise GCSError(status, 'Injected error')
+
+    def _bucket(self, bucket):
+        if bucket not in self.buckets:
+            raise GCSError(404, 'No such bucket: %s' % bucket)
+        return self.buckets[bucket]
+
+    def _object(self, bucket, name):
+        objects = self._bucket(bucket)
+        if name not in objects:
+            raise GCSError(404, 'No such object: %s/%s' % (bucket, name))
+        return objects[name]
+
+    def _store(self, bucket, name, data, component_count=None):
+        obj = {'kind': 'storage#object', 'bucket': bucket, 'name': name,
+               'size': str(len(data)),
+               'contentType': 'application/octet-stream',
+               'generation': str(int(time.time() * 1000000))}
+        if component_count is None:
+            obj['md5Hash'] = base64.b64encode(
+                hashlib.md5(data).digest()).decode('utf-8')
+        else:
+            obj['componentCount'] = component_count
+        if self.crc32c:
+            obj['crc32c'] = google_dr._encode_crc32c(
+                google_dr._crc32c(data)).decode('utf-8')
+        if self.store == 'disk':
+            data = DiskObjectData(
+                os.path.join(self.directory, uuid.uuid4().hex), data)
+        elif self.store == 'discard':
+            data = DiscardedObjectData(data)
+        with self._lock:
+            objects = self._bucket(bucket)
+            old = objects.get(name)
+            objects[name] = (obj, data)
+        if old is not None:
+            self._delete_data(old[1])
+        return obj
+
+    def _delete_data(self, data):
+        if not isinstance(data, six.binary_type):
+            data.delete()
+
+    def handle(self, method, path, query, headers, body):
+        """Serve an API request, returning status, headers and body."""
+        segments = [urllib.parse.unquote(segment)
+                    for segment in path.strip('/').split('/')]
+        try:
+            if segments[:4] == ['discovery', 'v1', 'apis', 'storage']:
+                return 200, {}, self.discovery
+            if segments[:3] == ['batch', 'storage', 'v1']:
+                return self._batch(headers, body)
+            if segments[:3] == ['upload', 'storage', 'v1']:
+                return self._upload(method, segments[3:], query, headers,
+                                    body)
+            if segments[:2] == ['storage', 'v1']:
+                return self._api(method, segments[2:], query, headers, body)
+            raise GCSError(404, 'Not found: %s' % path)
+        except GCSError as err:
+            return err.status, {}, json.dumps(
+                {'error': {'code': err.status, 'message': str(err)}})
+
+    def _api(self, method, segments, query, headers, body):
+        if segments == ['b'] and method == 'GET':
+            self._inject_error('buckets.list')
+            with self._lock:
+                names = sorted(self.buckets)
+            return self._json({'items': [{'name': name} for name in names]})
+        if segments == ['b'] and method == 'POST':
+            self._inject_error('buckets.insert')
+            bucket = json.loads(body.decode('utf-8'))
+            with self._lock:
+                if bucket['name'] in self.buckets:
+                    raise GCSError(409, 'Bucket exists')
+                self.buckets[bucket['name']] = {}
+            return self._json(bucket)
+        if len(segments) == 2 and method == 'GET':
+            self._inject_error('buckets.get')
+            self._bucket(segments[1])
+            return self._json({'name': segments[1]})
+        if len(segments) == 3 and method == 'GET':
+            self._inject_error('objects.list')
+            return self._list(segments[1], query)
+        if len(segments) == 4 and method == 'GET':
+            if query.get('alt') == 'media':
+                self._inject_error('objects.get_media')
+                return self._get_media(segments[1], segments[3], headers)
+            self._inject_error('objects.get')
+            return self._json(self._object(segments[1], segments[3])[0])
+        if len(segments) == 4 and method == 'DELETE':
+            self._inject_error('objects.delete')
+            with self._lock:
+                self._object(segments[1], segments[3])
+                _obj, data = self.buckets[segments[1]].pop(segments[3])
+            self._delete_data(data)
+            return 204, {}, b''
+        if (len(segments) == 5 and segments[4] == 'compose' and
+                method == 'POST'):
+            self._inject_error('objects.compose')
+            return self._compose(segments[1], segments[3],
+                                 json.loads(body.decode('utf-8')))
+        raise GCSError(404, 'Not found: %s' % '/'.join(segments))
+
+    def _json(self, value, status=200):
+        return status, {'Content-Type': 'application/json'}, json.dumps(value)
+
+    def _list(self, bucket, query):
+        prefix = query.get('prefix', '')
+        start = int(query.get('pageToken', 0))
+        end = start + int(query.get('maxResults', 1000))
+        with self._lock:
+            objects = self._bucket(bucket)
+            names = sorted(name for name in objects
+                           if name.startswith(prefix))
+            page = {'items': [objects[name][0]
+                              for name in names[start:end]]}
+        if end < len(names):
+            page['nextPageToken'] = str(end)
+        return self._json(page)
+
+    def _get_media(self, bucket, name, headers):
+        obj, data = self._object(bucket, name)
+        resp_headers = {'Content-Type': 'application/octet-stream'}
+        hashes = ['%s=%s' % (field, obj[key])
+                  for field, key in (('crc32c', 'crc32c'), ('md5', 'md5Hash'))
+                  if key in obj]
+        if hashes:
+            resp_headers['x-goog-hash'] = ','.join(hashes)
+        match = re.match(r'bytes=(\d+)-(\d*)$', headers.get('range', ''))
+        if not match:
+            return 200, resp_headers, data[:]
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(data) - 1), len(data) - 1)
+        if start >= len(data):
+            raise GCSError(416, 'Requested range not satisfiable')
+        resp_headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end,
+                                                            len(data))
+        return 206, resp_headers, data[start:end + 1]
+
+    def _compose(self, bucket, name, compose):
+        sources = compose['sourceObjects']
+        if not 0 < len(sources) <= 32:
+            raise GCSError(400, 'Between 1 and 32 source objects needed')
+        data = b''.join(self._object(bucket, source['name'])[1][:]
+                        for source in sources)
+        return self._json(self._store(bucket, name, data, len(sources)))
+
+    def _upload(self, method, segments, query, headers, body):
+        if len(segments) != 3:
+            raise GCSError(404, 'Not found')
+        bucket = segments[1]
+        upload_type = query.get('uploadType')
+        if method == 'PUT' and upload_type == 'resumable':
+            self._inject_error('objects.insert.resumable_chunk')
+            return self._upload_chunk(query['upload_id'], headers, body)
+        if method != 'POST':
+            raise GCSError(405, 'Method not allowed')
+        self._inject_error('objects.insert.%s' % upload_type)
+        self._bucket(bucket)
+        if upload_type == 'media':
+            return self._json(self._store(bucket, query['name'], body))
+        if upload_type == 'multipart':
+            metadata, data = self._parse_related(headers, body)
+            name = query.get('name') or metadata.get('name')
+            return self._json(self._store(bucket, name, data))
+        if upload_type == 'resumable':
+            metadata = json.loads(body.decode('utf-8') or '{}')
+            upload_id = uuid.uuid4().hex
+            with self._lock:
+                self.uploads[upload_id] = {
+                    'bucket': bucket, 'data': bytearray(),
+                    'name': query.get('name') or metadata.get('name')}
+            location = '%supload/storage/v1/b/%s/o?%s' % (
+                self.root_url, urllib.parse.quote(bucket, safe=''),
+                urllib.parse.urlencode({'uploadType': 'resumable',
+                                        'upload_id': upload_id}))
+            return 200, {'Location': location}, b''
+        raise GCSError(400, 'Unknown uploadType: %s' % upload_type)
+
+    def _upload_chunk(self, upload_id, headers, body):
+        match = re.match(r'bytes (\*|(\d+)-(\d+))/(\*|\d+)$',
+                         headers.get('content-range', ''))
+        if not match:
+            raise GCSError(400, 'Bad Content-Range')
+        with self._lock:
+            if upload_id not in self.uploads:
+                raise GCSError(404, 'No such upload')
+            upload = self.uploads[upload_id]
+            data = upload['data']
+            if match.group(2) is not None:
+                start = int(match.group(2))
+                if start > len(data):
+                    raise GCSError(400, 'Upload chunk leaves a gap')
+                # A chunk may be sent again after an error, keep one copy.
+                data[start:] = body
+            complete = (match.group(4) != '*' and
+                        len(data) == int(match.group(4)))
+            if complete:
+                del self.uploads[upload_id]
+            received = len(data)
+        if complete:
+            return self._json(self._store(upload['bucket'], upload['name'],
+                                          bytes(data)))
+        resp_headers = {}
+        if received:
+            resp_headers['Range'] = 'bytes=0-%d' % (received - 1)
+        return 308, resp_headers, b''
+
+    def _parse_related(self, headers, body):
+        boundary = re.search(r'boundary="?([^";]+)"?',
+                             headers.get('content-type', '')).group(1)
+        delimiter = b'--' + boundary.encode('utf-8')
+        parts = []
+        for part in body.split(delimiter)[1:-1]:
+            # Drop the line break after the delimiter and before the next.
+            part = re.sub(b'^\r?\n', b'', part)
+            part = re.sub(b'\r?\n$', b'', part)
+            part_headers, _sep, part_body = re.split(b'(\r?\n\r?\n)', part,
+                                                     1)
+            parts.append(part_body)
+        return json.loads(parts[0].decode('utf-8') or '{}'), parts[1]
+
+    def _batch(self, headers, body):
+        self._inject_error('batch')
+        parser = email.parser.FeedParser()
+        parser.feed('Content-Type: %s\r\n\r\n' % headers['content-type'])
+        parser.feed(body.decode('utf-8'))
+        response_boundary = uuid.uuid4().hex
+        response = []
+        for part in parser.close().get_payload():
+            # Long Content-IDs are folded over several lines. Unfold them
+            # only, apiclient splits the id at the spaces around its '+'.
+            content_id = re.sub(r'\r?\n\s+', ' ', part['Content-ID'])[1:-1]
+            request = part.get_payload()
+            request_line, _sep, rest = request.partition('\n')
+            method, url = request_line.split(' ')[:2]
+            request_headers, _sep, request_body = re.split(
+                r'(\r?\n\r?\n|$)', rest, 1)
+            split = urllib.parse.urlsplit(url)
+            query = dict(urllib.parse.parse_qsl(split.query))
+            status, resp_headers, resp_body = self.handle(
+                method, split.path, query, {},
+                request_body.encode('utf-8'))
+            if isinstance(resp_body, six.binary_type):
+                resp_body = resp_body.decode('utf-8')
+            reason = BaseHTTPServer.BaseHTTPRequestHandler.responses.get(
+                status, ('',))[0]
+            response.append(
+                '--%s\r\nContent-Type: application/http\r\n'
+                'Content-ID: <response-%s>\r\n\r\n'
+                'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                'Content-Length: %d\r\n\r\n%s\r\n' % (
+                    response_boundary, content_id, status, reason,
+                    len(resp_body), resp_body))
+        response.append('--%s--\r\n' % response_boundary)
+        return 200, {'Content-Type': 'multipart/mixed; boundary=%s' %
+                     response_boundary}, ''.join(response)
+
+
+class FakeGoogleRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        storage = self.server.storage
+        if storage.latency:
+            time.sleep(storage.latency)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        storage.throttle(len(body))
+        split = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(split.query))
+        headers = dict((key.lower(), value)
+                       for key, value in self.headers.items())
+        status, resp_headers, resp_body = storage.handle(
+            self.command, split.path, query, headers, body)
+        if not isinstance(resp_body, six.binary_type):
+            resp_body = resp_body.encode('utf-8')
+        storage.throttle(len(resp_body))
+        storage.count_bytes(len(body), len(resp_body))
+        self.send_response(status)
+        for key, value in resp_headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(resp_body)))
+        self.end_headers()
+        self.wfile.write(resp_body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGoogleServer(socketserver.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+    """Serves a FakeGoogleStorage over HTTP from a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, storage=None, host='127.0.0.1', port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+                                           FakeGoogleRequestHandler)
+        self.storage = storage or FakeGoogleStorage()
+        self.root_url = 'http://%s:%d/' % self.server_address[:2]
+        self.storage.root_url = self.root_url
+        self.storage.discovery = json.dumps(
+            discovery_document(self.root_url))
+        self._thread = None
+
+    def discovery_document(self):
+        return self.storage.discovery
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Seconds added to every request.')
+    parser.add_argument('--bandwidth', type=int, default=0,
+                        help='Shared bandwidth in bytes per second.')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Share of API requests that fail.')
+    parser.add_argument('--error-codes', type=int, nargs='+',
+                        default=[429, 503],
+                        help='HTTP statuses of failures.')
+    parser.add_argument('--store', choices=FakeGoogleStorage.STORES,
+                        default='memory', help='Where object data is kept.')
+    parser.add_argument('--discovery-file',
+                        help='Write the discovery document to this file.')
+    args = parser.parse_args(argv)
+    storage = FakeGoogleStorage(args.latency, args.bandwidth,
+                                args.error_rate, args.error_codes,
+                                store=args.store)
+    server = FakeGoogleServer(storage, args.host, args.port)
+    if args.discovery_file:
+        with open(args.discovery_file, 'w') as discovery_file:
+            discovery_file.write(server.discovery_document())
+    print('Serving GCS at %s' % server.root_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        storage.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -27,21 +27,44 @@ Server-centric flow is used for authentication.
 """
 
 import base64
+import bz2
+import collections
+import contextlib
+import email.utils
+import functools
 import hashlib
-import httplib2
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import time
 
 from apiclient import discovery
 from apiclient import errors
 from apiclient import http
+import eventlet
+from eventlet import greenpool
+import httplib2
 from oauth2client import client
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_service import loopingcall
+from oslo_utils import encodeutils
+from oslo_utils import excutils
 from oslo_utils import timeutils
 import six
 
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
 from cinder.backup import chunkeddriver
 from cinder import exception
-from cinder.i18n import _
+from cinder.i18n import _, _LI, _LW
+from cinder.volume import utils as volume_utils
 
 
 LOG = logging.getLogger(__name__)
@@ -60,17 +83,158 @@ gcsbackup_service_opts = [
     cfg.IntOpt('backup_gcs_reader_chunk_size',
                default=2097152,
                help='GCS object will be downloaded in chunks of bytes.'),
+    cfg.BoolOpt('backup_gcs_reader_adaptive_chunk_size',
+                default=False,
+                help='Tune the size of sequential GCS download requests '
+                     'while restoring. The size starts at '
+                     'backup_gcs_reader_chunk_size, grows by that amount '
+                     'while throughput improves and is halved when a '
+                     'request fails.'),
+    cfg.IntOpt('backup_gcs_reader_max_chunk_size',
+               default=67108864,
+               help='Largest GCS download request size in bytes when '
+                    'backup_gcs_reader_adaptive_chunk_size is enabled.'),
+    cfg.BoolOpt('backup_gcs_reader_streaming',
+                default=False,
+                help='Restore GCS objects chunk by chunk as they are '
+                     'downloaded, decompressing each chunk and writing it '
+                     'to the volume before the next one is fetched, '
+                     'instead of downloading whole objects first.'),
+    cfg.IntOpt('backup_gcs_download_workers',
+               default=1,
+               help='Number of concurrent range requests used to download '
+                    'a GCS object. Once the first chunk has returned the '
+                    'object size, the remaining chunks of '
+                    'backup_gcs_reader_chunk_size bytes are fetched in '
+                    'parallel.'),
+    cfg.IntOpt('backup_gcs_prefetch_objects',
+               default=0,
+               help='Number of GCS objects downloaded in the background '
+                    'ahead of the object being restored. 0 disables '
+                    'read-ahead.'),
+    cfg.IntOpt('backup_gcs_prefetch_max_bytes',
+               default=209715200,
+               help='Maximum number of bytes held by objects downloaded '
+                    'ahead during a restore. At least one object is always '
+                    'downloaded ahead when read-ahead is enabled.'),
     cfg.IntOpt('backup_gcs_writer_chunk_size',
                default=2097152,
                help='GCS object will be uploaded in chunks of bytes. '
                     'Pass in a value of -1 if the file '
                     'is to be uploaded as a single chunk.'),
+    cfg.IntOpt('backup_gcs_writer_resumable_threshold',
+               default=5242880,
+               help='GCS objects of up to this many bytes are uploaded '
+                    'with a single multipart request instead of a '
+                    'resumable upload session, which needs an extra '
+                    'request to open.'),
+    cfg.BoolOpt('backup_gcs_writer_streaming',
+                default=False,
+                help='Upload GCS objects while they are being written. '
+                     'The resumable upload session is opened on the first '
+                     'write and data is sent in pieces of '
+                     'backup_gcs_writer_chunk_size bytes, so only about '
+                     'one writer chunk per object is kept in memory. '
+                     'Ignored if backup_gcs_writer_chunk_size is -1.'),
+    cfg.IntOpt('backup_gcs_writer_composite_parts',
+               default=1,
+               max=32,
+               help='Number of parts uploaded concurrently for GCS objects '
+                    'larger than backup_gcs_writer_composite_threshold. '
+                    'The parts are joined into the object with a GCS '
+                    'compose request and checked with CRC32C, so the '
+                    'google-crc32c package must be installed, composite '
+                    'uploads are disabled without it. 1 uploads every '
+                    'object in one piece.'),
+    cfg.IntOpt('backup_gcs_writer_composite_threshold',
+               default=16777216,
+               help='GCS objects larger than this many bytes are uploaded '
+                    'as composite objects when '
+                    'backup_gcs_writer_composite_parts is more than 1.'),
+    cfg.StrOpt('backup_gcs_checksum_algorithm',
+               default='md5',
+               choices=['md5', 'crc32c', 'both'],
+               help='Hash used to check GCS objects after they are uploaded '
+                    'and downloaded. CRC32C is much cheaper to compute '
+                    'than MD5 when the google-crc32c package is '
+                    'installed, and is the only hash GCS keeps for '
+                    'composite objects.'),
+    cfg.StrOpt('backup_gcs_transport',
+               default='apiclient',
+               choices=['apiclient', 'asyncio'],
+               help='HTTP transport for GCS requests. asyncio sends the '
+                    'requests of bucket checks, listings, deletes, object '
+                    'uploads and ranged downloads from one asyncio event '
+                    'loop, so many can be in flight at once. It needs '
+                    'Python 3 and aiohttp.'),
+    cfg.IntOpt('backup_gcs_asyncio_concurrency',
+               default=64,
+               min=1,
+               help='Maximum number of GCS requests in flight at once with '
+                    'the asyncio transport.'),
+    cfg.BoolOpt('backup_gcs_resume',
+                default=False,
+                help='When a backup that already has an object prefix is '
+                     'run again, for example after it failed, reuse the '
+                     'prefix and skip uploading objects that are already '
+                     'stored in GCS with the same hash.'),
+    cfg.IntOpt('backup_gcs_upload_workers',
+               default=1,
+               help='Number of GCS objects uploaded concurrently during a '
+                    'backup. A finished object is handed to a free worker '
+                    'and the backup waits while all workers are busy, so '
+                    'at most this many objects are held in memory for '
+                    'upload. With the asyncio transport the uploads run on '
+                    'its event loop.'),
+    cfg.IntOpt('backup_gcs_http_pool_size',
+               default=16,
+               help='Maximum number of idle authorized http connections to '
+                    'GCS kept open per credential file for reuse by later '
+                    'requests and backups in this process.'),
+    cfg.IntOpt('backup_gcs_bucket_cache_ttl',
+               default=300,
+               help='Number of seconds to remember that a GCS bucket '
+                    'exists, so backups to it skip the bucket check. '
+                    '0 disables the cache.'),
+    cfg.IntOpt('backup_gcs_list_page_size',
+               default=1000,
+               help='Maximum number of object names to request per page '
+                    'when listing a backup\'s objects in GCS.'),
+    cfg.IntOpt('backup_gcs_delete_batch_size',
+               default=1,
+               max=100,
+               help='Number of object deletes sent to GCS in one batch '
+                    'request when deleting a backup. 1 deletes objects one '
+                    'request at a time.'),
+    cfg.IntOpt('backup_gcs_delete_workers',
+               default=1,
+               help='Number of delete requests, or delete batch requests, '
+                    'sent to GCS concurrently when deleting a backup.'),
+    cfg.IntOpt('backup_gcs_delete_rate_limit',
+               default=0,
+               help='Maximum number of objects deleted from GCS per second '
+                    'when deleting a backup. 0 means no limit.'),
     cfg.IntOpt('backup_gcs_num_retries',
                default=3,
                help='Number of times to retry.'),
     cfg.ListOpt('backup_gcs_retry_error_codes',
                 default=['429'],
                 help='List of GCS error codes.'),
+    cfg.FloatOpt('backup_gcs_retry_base_delay',
+                 default=1.0,
+                 help='Minimum number of seconds to wait before retrying a '
+                      'failed GCS request.'),
+    cfg.FloatOpt('backup_gcs_retry_max_delay',
+                 default=32.0,
+                 help='Maximum number of seconds to wait before retrying a '
+                      'failed GCS request, unless GCS asks for a longer '
+                      'wait with a Retry-After header.'),
+    cfg.IntOpt('backup_gcs_retry_budget',
+               default=0,
+               help='Number of retries a backup driver may make before it '
+                    'stops retrying failed GCS requests. Each successful '
+                    'request earns back a tenth of a retry. 0 means no '
+                    'budget.'),
     cfg.StrOpt('backup_gcs_bucket_location',
                default='US',
                help='Location of GCS bucket.'),
@@ -79,6 +243,11 @@ gcsbackup_service_opts = [
                help='Storage class of GCS bucket.'),
     cfg.StrOpt('backup_gcs_credential_file',
                help='Absolute path of GCS service account credential file.'),
+    cfg.StrOpt('backup_gcs_discovery_file',
+               help='Absolute path of a GCS storage v1 discovery document. '
+                    'If set, the GCS client is built from this file instead '
+                    'of fetching the document from Google once per '
+                    'process.'),
     cfg.StrOpt('backup_gcs_project_id',
                help='Owner project id for GCS bucket.'),
     cfg.StrOpt('backup_gcs_user_agent',
@@ -95,11 +264,36 @@ gcsbackup_service_opts = [
 CONF = cfg.CONF
 CONF.register_opts(gcsbackup_service_opts)
 
+GCS_SCOPES = ['https://www.googleapis.com/auth/devstorage.read_write']
+GCS_DISCOVERY_URI = ('https://www.googleapis.com/discovery/v1/apis/'
+                     'storage/v1/rest')
+
+_discovery_document = None
+_credentials = {}
+_buckets = {}
+_transports = {}
+# Warnings logged once per process.
+_warnings = set()
+# Resumable upload sessions of failed uploads by bucket and object name,
+# with the hash and size of their data, for the next attempt to continue.
+_upload_sessions = collections.OrderedDict()
+_MAX_UPLOAD_SESSIONS = 256
+
+# GCS object fields holding the hashes each checksum algorithm checks.
+CHECKSUM_FIELDS = {
+    'md5': ('md5Hash',),
+    'crc32c': ('crc32c',),
+    'both': ('md5Hash', 'crc32c'),
+}
+
 
 def gcs_logger(func):
     def func_wrapper(self, *args, **kwargs):
         try:
             return func(self, *args, **kwargs)
+        except exception.BackupDriverException:
+            # Already mapped, e.g. by the asyncio transport.
+            raise
         except errors.Error as err:
             raise exception.GCSApiFailure(reason=err)
         except client.Error as err:
@@ -110,9 +304,187 @@ def gcs_logger(func):
     return func_wrapper
 
 
+def _build_http(credentials):
+    """Return a new authorized http connection to GCS."""
+    gcs_http = httplib2.Http()
+    # GCS answers unfinished resumable uploads with 308 and no Location,
+    # which newer httplib2 versions would follow as a redirect.
+    if hasattr(gcs_http, 'redirect_codes'):
+        gcs_http.redirect_codes = gcs_http.redirect_codes - {308}
+    gcs_http = http.set_user_agent(gcs_http, CONF.backup_gcs_user_agent)
+    return credentials.authorize(gcs_http)
+
+
+def _get_credentials(credential_file):
+    """Return cached credentials and connection pool for a credential file.
+
+    The cache entry is replaced when the file's mtime changes, so rotated
+    keys are picked up without restarting the service.
+    """
+    try:
+        mtime = os.path.getmtime(credential_file)
+    except OSError:
+        mtime = None
+    cached = _credentials.get(credential_file)
+    if cached is None or cached[0] != mtime:
+        credentials = client.GoogleCredentials.from_stream(credential_file)
+        if credentials.create_scoped_required():
+            credentials = credentials.create_scoped(GCS_SCOPES)
+        http_pool = GoogleHttpPool(CONF.backup_gcs_http_pool_size,
+                                   functools.partial(_build_http,
+                                                     credentials))
+        cached = (mtime, credentials, http_pool)
+        _credentials[credential_file] = cached
+    return cached[1], cached[2]
+
+
+def _get_discovery_document(gcs_http):
+    """Return the storage v1 discovery document, fetched once per process.
+
+    The document is read from backup_gcs_discovery_file if it is set.
+    """
+    global _discovery_document
+    if _discovery_document is None:
+        if CONF.backup_gcs_discovery_file:
+            with open(CONF.backup_gcs_discovery_file) as discovery_file:
+                document = discovery_file.read()
+        else:
+            resp, document = gcs_http.request(GCS_DISCOVERY_URI)
+            if resp.status >= 400:
+                raise errors.HttpError(resp, document, uri=GCS_DISCOVERY_URI)
+            document = encodeutils.safe_decode(document)
+        # Cache the text, build_from_document() modifies a parsed document.
+        _discovery_document = document
+    return _discovery_document
+
+
+def _make_crc32c_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _i in range(8):
+            crc = (crc >> 1) ^ (0x82F63B78 if crc & 1 else 0)
+        table.append(crc)
+    return table
+
+
+_CRC32C_TABLE = _make_crc32c_table()
+# Largest piece of a buffer copied at once to hash it with google-crc32c.
+_CRC32C_COPY_SIZE = 1024 * 1024
+
+
+def _warn_once(message):
+    if message not in _warnings:
+        _warnings.add(message)
+        LOG.warning(message)
+
+
+def _warn_slow_crc32c():
+    if google_crc32c is None:
+        _warn_once(_LW('The google-crc32c package is not installed, '
+                       'checking GCS objects with CRC32C in Python is slow '
+                       'and blocks other operations.'))
+
+
+def _crc32c(data, crc=0):
+    """Return the CRC32C of data, continuing from crc.
+
+    Uses google-crc32c when it is installed, which is much faster than the
+    Python fallback.
+    """
+    if google_crc32c is not None:
+        if isinstance(data, bytes):
+            return google_crc32c.extend(crc, data)
+        # google-crc32c only takes bytes, so other buffers such as views
+        # of writer and download buffers are copied a piece at a time.
+        view = memoryview(data)
+        for start in range(0, len(view), _CRC32C_COPY_SIZE):
+            crc = google_crc32c.extend(
+                crc, view[start:start + _CRC32C_COPY_SIZE].tobytes())
+        return crc
+    table = _CRC32C_TABLE
+    crc ^= 0xffffffff
+    for byte in bytearray(data):
+        crc = table[(crc ^ byte) & 0xff] ^ (crc >> 8)
+    return crc ^ 0xffffffff
+
+
+def _encode_crc32c(crc):
+    """Return crc encoded the way GCS stores CRC32C hashes."""
+    return base64.b64encode(struct.pack('>I', crc))
+
+
+def _parse_goog_hash(value):
+    """Return the hashes of an x-goog-hash header by GCS object field."""
+    names = {'md5': 'md5Hash', 'crc32c': 'crc32c'}
+    hashes = {}
+    for item in value.split(','):
+        name, _sep, object_hash = item.strip().partition('=')
+        if name in names:
+            hashes[names[name]] = encodeutils.safe_encode(object_hash)
+    return hashes
+
+
+class GoogleChecksum(object):
+    """Running MD5 and/or CRC32C of GCS object data.
+
+    fields names the GCS object fields to compute, md5Hash and crc32c.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.md5 = hashlib.md5() if 'md5Hash' in self.fields else None
+        self.crc32c = 0 if 'crc32c' in self.fields else None
+
+    def update(self, data):
+        if self.md5 is not None:
+            self.md5.update(data)
+        if self.crc32c is not None:
+            self.crc32c = _crc32c(data, self.crc32c)
+
+    def hashes(self):
+        """Return the hashes encoded as GCS returns them, by field."""
+        hashes = {}
+        if self.md5 is not None:
+            hashes['md5Hash'] = base64.b64encode(
+                encodeutils.safe_encode(self.md5.digest()))
+        if self.crc32c is not None:
+            hashes['crc32c'] = _encode_crc32c(self.crc32c)
+        return hashes
+
+
+@contextlib.contextmanager
+def _check_bucket(bucket):
+    """Forget a cached bucket when a request on it returns 404."""
+    try:
+        yield
+    except errors.HttpError as err:
+        if err.resp.status == 404:
+            _buckets.pop(bucket, None)
+        raise
+
+
+@contextlib.contextmanager
+def _pooled_http(http_pool, gcs_http=None):
+    """Check out a connection unless one is given or there is no pool.
+
+    A None connection makes apiclient requests use their own http.
+    """
+    if gcs_http is not None or http_pool is None:
+        yield gcs_http
+    else:
+        with http_pool.get() as gcs_http:
+            yield gcs_http
+
+
 class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
     """Provides backup, restore and delete of backup objects within GCS."""
 
+    # Set while _restore_objects() streams a restore.
+    restore_streaming = False
+    # Set while delete() runs.
+    deleting = False
+
     def __init__(self, context, db_driver=None):
         self.check_gcs_options()
         backup_bucket = CONF.backup_gcs_bucket
@@ -126,19 +498,81 @@ class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
                                                  backup_bucket,
                                                  enable_progress_timer,
                                                  db_driver)
-        credentials = client.GoogleCredentials.from_stream(backup_credential)
+        credentials, self.http_pool = _get_credentials(backup_credential)
         self.reader_chunk_size = CONF.backup_gcs_reader_chunk_size
         self.writer_chunk_size = CONF.backup_gcs_writer_chunk_size
         self.bucket_location = CONF.backup_gcs_bucket_location
         self.storage_class = CONF.backup_gcs_storage_class
         self.num_retries = CONF.backup_gcs_num_retries
-        http_user_agent = http.set_user_agent(httplib2.Http(),
-                                              CONF.backup_gcs_user_agent)
-        self.conn = discovery.build('storage',
-                                    'v1',
-                                    http=http_user_agent,
-                                    credentials=credentials)
+        self.retry_policy = GoogleRetryPolicy(self.num_retries,
+                                              CONF.backup_gcs_retry_budget)
+        self.list_page_size = CONF.backup_gcs_list_page_size
+        self.delete_batch_size = CONF.backup_gcs_delete_batch_size
+        self.delete_workers = CONF.backup_gcs_delete_workers
+        self.delete_rate_limit = CONF.backup_gcs_delete_rate_limit
+        self.download_workers = CONF.backup_gcs_download_workers
+        self.reader_streaming = CONF.backup_gcs_reader_streaming
+        self.prefetch_objects = CONF.backup_gcs_prefetch_objects
+        self.prefetch_max_bytes = CONF.backup_gcs_prefetch_max_bytes
+        self.prefetcher = None
+        self.object_sizes = {}
+        self.chunk_sizer = None
+        if CONF.backup_gcs_reader_adaptive_chunk_size:
+            self.chunk_sizer = GoogleChunkSizer(
+                self.reader_chunk_size, CONF.backup_gcs_reader_max_chunk_size)
+        with self.http_pool.get() as gcs_http:
+            document = _get_discovery_document(gcs_http)
+        self.conn = discovery.build_from_document(
+            document, http=_build_http(credentials))
         self.resumable = self.writer_chunk_size != -1
+        self.streaming = CONF.backup_gcs_writer_streaming and self.resumable
+        self.resumable_threshold = CONF.backup_gcs_writer_resumable_threshold
+        self.composite_parts = CONF.backup_gcs_writer_composite_parts
+        if self.composite_parts > 1 and google_crc32c is None:
+            # Checking composite objects with the Python CRC32C would
+            # block all other greenthreads for seconds per object.
+            _warn_once(_LW('Composite GCS uploads are disabled, they need '
+                           'the google-crc32c package to check objects.'))
+            self.composite_parts = 1
+        self.composite_threshold = CONF.backup_gcs_writer_composite_threshold
+        self.checksum_algorithm = CONF.backup_gcs_checksum_algorithm
+        if self.checksum_algorithm != 'md5':
+            _warn_slow_crc32c()
+        self.resume = CONF.backup_gcs_resume
+        self.stored_hashes = {}
+        self.transport = None
+        if CONF.backup_gcs_transport == 'asyncio':
+            self.transport = self._get_asyncio_transport(backup_credential,
+                                                         credentials,
+                                                         document)
+        self.upload_pool = None
+        upload_workers = CONF.backup_gcs_upload_workers
+        if upload_workers > 1 and self.transport is not None:
+            self.upload_pool = self.transport.get_upload_pool(upload_workers)
+        elif upload_workers > 1:
+            self.upload_pool = GoogleWorkerPool(upload_workers,
+                                                self.http_pool)
+
+    def _get_asyncio_transport(self, credential_file, credentials, document):
+        """Return the asyncio transport shared by drivers of the process.
+
+        Each transport runs an event loop thread and keeps its connections
+        open, so one is kept for each credential file and GCS endpoint.
+        """
+        # Imported only when used, since it needs Python 3 and aiohttp.
+        from cinder.backup.drivers import google_asyncio
+        root_url = json.loads(document).get('rootUrl',
+                                            google_asyncio.GCS_ROOT_URL)
+        key = (credential_file, root_url)
+        if key not in _transports:
+            _transports[key] = google_asyncio.GoogleAsyncioTransport(
+                credentials, self.gcs_project_id, self.num_retries,
+                CONF.backup_gcs_retry_budget,
+                CONF.backup_gcs_asyncio_concurrency, root_url,
+                CONF.backup_gcs_user_agent)
+        # Pick up rotated keys, like _get_credentials.
+        _transports[key].credentials = credentials
+        return _transports[key]
 
     def check_gcs_options(self):
         required_options = ('backup_gcs_bucket', 'backup_gcs_credential_file',
@@ -153,28 +587,75 @@ class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
     @gcs_logger
     def put_container(self, bucket):
         """Create the bucket if not exists."""
-        buckets = self.conn.buckets().list(
-            project=self.gcs_project_id,
-            prefix=bucket,
-            fields="items(name)").execute(
-                num_retries=self.num_retries).get('items', [])
-        if not any(b.get('name') == bucket for b in buckets):
-            self.conn.buckets().insert(
-                project=self.gcs_project_id,
-                body={'name': bucket,
-                      'location': self.bucket_location,
-                      'storageClass': self.storage_class}).execute(
-                num_retries=self.num_retries)
+        if _buckets.get(bucket, 0) > timeutils.utcnow_ts():
+            return
+        if self.transport is not None:
+            self.transport.put_container(bucket, self.bucket_location,
+                                         self.storage_class)
+        else:
+            self._put_container(bucket)
+        if CONF.backup_gcs_bucket_cache_ttl > 0:
+            _buckets[bucket] = (timeutils.utcnow_ts() +
+                                CONF.backup_gcs_bucket_cache_ttl)
+
+    def _put_container(self, bucket):
+        with self.http_pool.get() as gcs_http:
+            try:
+                self.retry_policy.execute(self.conn.buckets().get(
+                    bucket=bucket,
+                    fields="name"), gcs_http)
+            except errors.HttpError as err:
+                if err.resp.status != 404:
+                    raise
+                self.retry_policy.execute(self.conn.buckets().insert(
+                    project=self.gcs_project_id,
+                    body={'name': bucket,
+                          'location': self.bucket_location,
+                          'storageClass': self.storage_class}), gcs_http)
 
-    @gcs_logger
     def get_container_entries(self, bucket, prefix):
-        """Get bucket entry names."""
-        obj_list_dict = self.conn.objects().list(
-            bucket=bucket,
-            fields="items(name)",
-            prefix=prefix).execute(num_retries=self.num_retries).get(
-            'items', [])
-        return [obj_dict.get('name') for obj_dict in obj_list_dict]
+        """Get bucket entry names.
+
+        Names are yielded as each page of the listing arrives, so callers
+        can start working before the whole bucket has been listed.
+        """
+        for obj_dict in self._iter_objects(bucket, prefix, 'name'):
+            yield obj_dict.get('name')
+
+    def _get_object_hashes(self, bucket, prefix):
+        """Return the hash of each object stored under prefix, by name.
+
+        The hash is the MD5, or the CRC32C if only CRC32C is checked.
+        """
+        field = CHECKSUM_FIELDS[self.checksum_algorithm][0]
+        return dict((obj_dict.get('name'), obj_dict.get(field))
+                    for obj_dict in self._iter_objects(bucket, prefix,
+                                                       'name,' + field))
+
+    def _iter_objects(self, bucket, prefix, fields):
+        if self.transport is not None:
+            for obj_dict in self.transport.list_objects(
+                    bucket, prefix, fields, self.list_page_size):
+                yield obj_dict
+            return
+        page_token = None
+        while True:
+            page = self._list_objects(bucket, prefix, fields, page_token)
+            for obj_dict in page.get('items', []):
+                yield obj_dict
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+
+    @gcs_logger
+    def _list_objects(self, bucket, prefix, fields, page_token=None):
+        with self.http_pool.get() as gcs_http:
+            return self.retry_policy.execute(self.conn.objects().list(
+                bucket=bucket,
+                fields="items(%s),nextPageToken" % fields,
+                maxResults=self.list_page_size,
+                pageToken=page_token,
+                prefix=prefix), gcs_http)
 
     def get_object_writer(self, bucket, object_name, extra_metadata=None):
         """Return a writer object.
@@ -182,10 +663,26 @@ class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
         Returns a writer object that stores a chunk of volume data in a
         GCS object store.
         """
+        stored_hash = self.stored_hashes.get(object_name)
+        if self.transport is not None:
+            return self.transport.get_object_writer(
+                bucket, object_name, self.checksum_algorithm, stored_hash,
+                self.upload_pool, self.writer_chunk_size,
+                self.resumable_threshold)
+        # A stored object may not need uploading, so do not stream it.
         return GoogleObjectWriter(bucket, object_name, self.conn,
                                   self.writer_chunk_size,
                                   self.num_retries,
-                                  self.resumable)
+                                  self.resumable,
+                                  self.streaming and stored_hash is None,
+                                  self.upload_pool,
+                                  self.http_pool,
+                                  self.retry_policy,
+                                  self.resumable_threshold,
+                                  stored_hash,
+                                  self.composite_parts,
+                                  self.composite_threshold,
+                                  self.checksum_algorithm)
 
     def get_object_reader(self, bucket, object_name, extra_metadata=None):
         """Return reader object.
@@ -193,16 +690,237 @@ class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
         Returns a reader object that retrieves a chunk of backed-up volume data
         from a GCS object store.
         """
-        return GoogleObjectReader(bucket, object_name, self.conn,
-                                  self.reader_chunk_size,
-                                  self.num_retries)
+        if self.transport is not None:
+            reader = self.transport.get_object_reader(
+                bucket, object_name, self.reader_chunk_size,
+                self.checksum_algorithm)
+        else:
+            reader = GoogleObjectReader(bucket, object_name, self.conn,
+                                        self.reader_chunk_size,
+                                        self.num_retries,
+                                        self.download_workers,
+                                        self.http_pool,
+                                        self.prefetcher,
+                                        self.retry_policy,
+                                        self.chunk_sizer,
+                                        self.object_sizes.get(object_name),
+                                        self.checksum_algorithm)
+        if self.restore_streaming:
+            return GoogleStreamingObjectReader(reader)
+        return reader
+
+    def _prefetch_object(self, bucket, object_name, gcs_http):
+        reader = GoogleObjectReader(bucket, object_name, self.conn,
+                                    self.reader_chunk_size,
+                                    self.num_retries,
+                                    self.download_workers,
+                                    self.http_pool,
+                                    retry_policy=self.retry_policy,
+                                    chunk_sizer=self.chunk_sizer,
+                                    object_size=self.object_sizes.get(
+                                        object_name),
+                                    checksum_algorithm=self.checksum_algorithm)
+        return reader._download(gcs_http)
 
     @gcs_logger
-    def delete_object(self, bucket, object_name):
+    def delete_object(self, bucket, object_name, gcs_http=None):
         """Deletes a backup object from a GCS object store."""
-        self.conn.objects().delete(
-            bucket=bucket,
-            object=object_name).execute(num_retries=self.num_retries)
+        if self.transport is not None:
+            return self.transport.delete_object(bucket, object_name)
+        with _pooled_http(self.http_pool, gcs_http) as gcs_http:
+            self.retry_policy.execute(self.conn.objects().delete(
+                bucket=bucket,
+                object=object_name), gcs_http)
+
+    @gcs_logger
+    def delete_objects(self, bucket, object_names, gcs_http=None):
+        """Deletes backup objects from a GCS object store in one batch.
+
+        Deletes that fail with a retryable error are sent again in a new
+        batch; objects that are already gone count as deleted.
+        """
+        if self.transport is not None:
+            return self.transport.delete_objects(bucket, object_names)
+        failed = {}
+
+        def _deleted(request_id, response, err):
+            if err is not None and err.resp.status != 404:
+                failed[request_id] = err
+
+        pending = list(object_names)
+
+        def _delete_batch():
+            failed.clear()
+            batch = self.conn.new_batch_http_request(callback=_deleted)
+            for object_name in pending:
+                batch.add(self.conn.objects().delete(bucket=bucket,
+                                                     object=object_name),
+                          request_id=object_name)
+            batch.execute(http=gcs_http)
+
+            pending[:] = [object_name for object_name in pending
+                          if object_name in failed]
+            for object_name in pending:
+                if not self.retry_policy.is_retryable(failed[object_name]):
+                    raise failed[object_name]
+            if pending:
+                raise failed[pending[0]]
+
+        self.retry_policy.call(_delete_batch)
+
+    def delete(self, backup):
+        """Delete the given backup.
+
+        Object deletes are spread over backup_gcs_delete_workers workers,
+        batched and rate limited as configured, with progress notifications
+        sent like those of a running backup.
+
+        As in ChunkedBackupDriver.delete, an error while listing the
+        backup's objects is logged and the delete continues with the
+        objects listed so far.
+        """
+        self.deleting = True
+        try:
+            self._delete_backup(backup)
+        finally:
+            self.deleting = False
+
+    def _delete_backup(self, backup):
+        if (self.delete_batch_size <= 1 and self.delete_workers <= 1 and
+                self.delete_rate_limit <= 0):
+            return super(GoogleBackupDriver, self).delete(backup)
+
+        container = backup['container']
+        object_prefix = backup['service_metadata']
+        LOG.debug('delete started, backup: %(id)s, container: %(cont)s, '
+                  'prefix: %(pre)s.',
+                  {'id': backup['id'],
+                   'cont': container,
+                   'pre': object_prefix})
+        if container is not None and object_prefix is not None:
+            rate_limiter = None
+            if self.delete_rate_limit > 0:
+                rate_limiter = GoogleRateLimiter(self.delete_rate_limit)
+            delete_meta = {'objects_deleted': 0, 'objects_total': 0}
+
+            def _delete(object_names, gcs_http):
+                if rate_limiter is not None:
+                    rate_limiter.acquire(len(object_names))
+                if self.delete_batch_size > 1:
+                    self.delete_objects(container, object_names, gcs_http)
+                else:
+                    self.delete_object(container, object_names[0], gcs_http)
+                sent_num = delete_meta['objects_deleted']
+                delete_meta['objects_deleted'] += len(object_names)
+                if (delete_meta['objects_deleted'] // self.data_block_num >
+                        sent_num // self.data_block_num):
+                    self._send_delete_progress(backup, delete_meta)
+
+            def _notify_progress():
+                self._send_delete_progress(backup, delete_meta)
+
+            timer = loopingcall.FixedIntervalLoopingCall(_notify_progress)
+            if self.enable_progress_timer:
+                timer.start(interval=self.backup_timer_interval)
+
+            pool = GoogleWorkerPool(self.delete_workers, self.http_pool)
+            try:
+                object_names = []
+                for object_name in self._generate_object_names(backup):
+                    delete_meta['objects_total'] += 1
+                    object_names.append(object_name)
+                    if len(object_names) == self.delete_batch_size:
+                        pool.spawn(functools.partial(_delete, object_names))
+                        object_names = []
+                if object_names:
+                    pool.spawn(functools.partial(_delete, object_names))
+                pool.wait()
+            finally:
+                timer.stop()
+            self._send_delete_progress(backup, delete_meta)
+        LOG.debug('delete %s finished.', backup['id'])
+
+    def _generate_object_names(self, backup):
+        object_names = super(GoogleBackupDriver, self)._generate_object_names(
+            backup)
+        if self.deleting:
+            return self._ignore_listing_errors(object_names)
+        return object_names
+
+    def _ignore_listing_errors(self, object_names):
+        """Yield object names, ending the listing at the first error.
+
+        get_container_entries() lists lazily, so errors are raised while
+        delete iterates the names, outside the parent's try block.
+        """
+        try:
+            for object_name in object_names:
+                yield object_name
+        except Exception:
+            LOG.warning(_LW('Error while listing objects, continuing'
+                            ' with delete.'))
+
+    def _send_delete_progress(self, backup, delete_meta):
+        """Notify how many of the listed objects have been deleted.
+
+        objects_total grows while the backup's objects are still being
+        listed.
+        """
+        delete_percent = 100
+        if delete_meta['objects_total']:
+            delete_percent = (delete_meta['objects_deleted'] * 100 //
+                              delete_meta['objects_total'])
+        extra_usage_info = dict(delete_meta, delete_percent=delete_percent)
+        volume_utils.notify_about_backup_usage(
+            self.context, backup, 'deleteprogress',
+            extra_usage_info=extra_usage_info)
+
+    def backup(self, backup, volume_file, backup_metadata=True):
+        """Backup the given volume to GCS.
+
+        With backup_gcs_resume, objects that a previous attempt of this
+        backup already stored are not uploaded again.
+        """
+        if self.resume and backup['service_metadata']:
+            container = backup['container'] or self.backup_default_container
+            self.stored_hashes = self._get_object_hashes(
+                container, backup['service_metadata'])
+            LOG.info(_LI('Resuming backup %(id)s, %(count)d objects are '
+                         'already stored in GCS.'),
+                     {'id': backup['id'], 'count': len(self.stored_hashes)})
+        try:
+            return super(GoogleBackupDriver, self).backup(backup, volume_file,
+                                                          backup_metadata)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._wait_for_uploads()
+        finally:
+            self.stored_hashes = {}
+
+    def _wait_for_uploads(self):
+        """Wait for the uploads a failed backup left queued.
+
+        They would otherwise keep storing objects after the backup failed.
+        Their errors are only logged, the backup's own error is raised.
+        """
+        if self.upload_pool is None:
+            return
+        try:
+            self.upload_pool.wait()
+        except Exception:
+            LOG.warning(_LW('Error uploading objects of a failed backup.'),
+                        exc_info=True)
+
+    def _send_progress_end(self, context, backup, object_meta):
+        """Report the backup complete once its queued uploads finish.
+
+        This runs before _backup_metadata, which deletes the backup if it
+        fails, so no upload is left to race the delete.
+        """
+        if self.upload_pool is not None:
+            self.upload_pool.wait()
+        super(GoogleBackupDriver, self)._send_progress_end(context, backup,
+                                                           object_meta)
 
     def _generate_object_name_prefix(self, backup):
         """Generates a GCS backup object name prefix.
@@ -213,7 +931,11 @@ class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
         timestamp is time in UTC with format of YearMonthDateHourMinuteSecond.
         saz is storage_availability_zone.
         bakid is backup id for volid.
+
+        A resumed backup keeps the prefix of its previous attempt.
         """
+        if self.resume and backup['service_metadata']:
+            return backup['service_metadata']
         az = 'az_%s' % self.az
         backup_name = '%s_backup_%s' % (az, backup.id)
         volume = 'volume_%s' % (backup.volume_id)
@@ -222,6 +944,75 @@ class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
         LOG.debug('generate_object_name_prefix: %s', prefix)
         return prefix
 
+    def _restore_v1(self, backup, volume_id, metadata, volume_file):
+        """Restore a v1 backup, reading ahead the next objects.
+
+        The object lengths in the metadata let readers download small
+        objects with a single request.
+        """
+        self.object_sizes = dict(
+            (object_name, obj['length'])
+            for metadata_object in metadata['objects']
+            for object_name, obj in metadata_object.items()
+            if 'length' in obj)
+        try:
+            # The asyncio transport already downloads ranges concurrently.
+            if self.prefetch_objects and self.transport is None:
+                objects = [(object_name, obj.get('length', 0))
+                           for metadata_object in metadata['objects']
+                           for object_name, obj in metadata_object.items()]
+                download = functools.partial(self._prefetch_object,
+                                             backup['container'])
+                self.prefetcher = GoogleObjectPrefetcher(
+                    download, objects, self.prefetch_objects,
+                    self.prefetch_max_bytes, self.http_pool)
+            self._restore_objects(backup, volume_id, metadata, volume_file)
+        finally:
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+                self.prefetcher = None
+            self.object_sizes = {}
+
+    def _restore_objects(self, backup, volume_id, metadata, volume_file):
+        """Run ChunkedBackupDriver._restore_v1, streaming if configured.
+
+        With backup_gcs_reader_streaming, readers return each object as
+        GoogleStreamedData, which the decompressors from _get_compressor()
+        and the wrapped volume file consume chunk by chunk. Only a few
+        download chunks and their decompressed data are held in memory at
+        once.
+        """
+        if not self.reader_streaming:
+            return super(GoogleBackupDriver, self)._restore_v1(
+                backup, volume_id, metadata, volume_file)
+        self.restore_streaming = True
+        try:
+            super(GoogleBackupDriver, self)._restore_v1(
+                backup, volume_id, metadata,
+                GoogleStreamingVolumeFile(volume_file))
+        finally:
+            self.restore_streaming = False
+
+    def _get_compressor(self, algorithm):
+        compressor = super(GoogleBackupDriver, self)._get_compressor(
+            algorithm)
+        if self.restore_streaming and compressor is not None:
+            return GoogleStreamingDecompressor(compressor)
+        return compressor
+
+    def _finalize_backup(self, backup, container, object_meta, object_sha256):
+        """Write metadata and sha256 files after all objects are stored."""
+        if self.upload_pool is None:
+            return super(GoogleBackupDriver, self)._finalize_backup(
+                backup, container, object_meta, object_sha256)
+        self.upload_pool.wait()
+        upload_pool, self.upload_pool = self.upload_pool, None
+        try:
+            super(GoogleBackupDriver, self)._finalize_backup(
+                backup, container, object_meta, object_sha256)
+        finally:
+            self.upload_pool = upload_pool
+
     def update_container_name(self, backup, bucket):
         """Use the bucket name as provided - don't update."""
         return
@@ -233,7 +1024,10 @@ class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
 
 class GoogleObjectWriter(object):
     def __init__(self, bucket, object_name, conn, writer_chunk_size,
-                 num_retries, resumable):
+                 num_retries, resumable, streaming=False, upload_pool=None,
+                 http_pool=None, retry_policy=None, resumable_threshold=0,
+                 stored_hash=None, composite_parts=1, composite_threshold=0,
+                 checksum_algorithm='md5'):
         self.bucket = bucket
         self.object_name = object_name
         self.conn = conn
@@ -241,6 +1035,34 @@ class GoogleObjectWriter(object):
         self.chunk_size = writer_chunk_size
         self.num_retries = num_retries
         self.resumable = resumable
+        self.resumable_threshold = resumable_threshold
+        self.composite_parts = composite_parts
+        self.composite_threshold = composite_threshold
+        self.streaming = streaming
+        self.upload_pool = upload_pool
+        self.http_pool = http_pool
+        self.retry_policy = retry_policy or GoogleRetryPolicy(num_retries)
+        self.checksum_algorithm = checksum_algorithm
+        # Parts of composite objects have no checksum, the composed object
+        # is checked instead.
+        self.checksum = GoogleChecksum(
+            CHECKSUM_FIELDS[checksum_algorithm] if checksum_algorithm
+            else ())
+        # Composite objects are checked with a CRC32C, computed as the data
+        # is written when the checksum does not include one.
+        self.composite_checksum = None
+        if (composite_parts > 1 and not streaming and
+                'crc32c' not in self.checksum.fields):
+            self.composite_checksum = GoogleChecksum(('crc32c',))
+        # Hash of the object already stored in GCS, if any.
+        self.stored_hash = stored_hash
+        # The resumable upload session, kept across close() attempts and in
+        # _upload_sessions for later writers of the object, so a failed
+        # upload continues where GCS stopped receiving it.
+        self.media = None
+        self.request = None
+        if self.streaming:
+            self.media = GoogleStreamingMediaUpload(self.chunk_size)
 
     def __enter__(self):
         return self
@@ -248,48 +1070,642 @@ class GoogleObjectWriter(object):
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
 
+    @gcs_logger
     def write(self, data):
-        self.data += data
+        self.checksum.update(data)
+        if self.composite_checksum is not None:
+            self.composite_checksum.update(data)
+        if not self.streaming:
+            self.data += data
+            return
+        self.media.append(data)
+        try:
+            # Keep at least one byte back so that the final request, which
+            # carries the object size, always has a payload.
+            while self.media.buffered() > self.chunk_size:
+                with _pooled_http(self.http_pool) as gcs_http:
+                    self._upload_chunk(gcs_http)
+        finally:
+            self.media.keep()
+
+    def _write_view(self, data):
+        """Take data without copying it, the caller must not change it."""
+        self.checksum.update(data)
+        self.data = data
+
+    def _upload_chunk(self, gcs_http=None):
+        if self.request is None:
+            self.request = self.conn.objects().insert(
+                bucket=self.bucket,
+                name=self.object_name,
+                body={},
+                media_body=self.media)
+        # After a failed request apiclient asks GCS how much of the object
+        # it received and continues from there.
+        with _check_bucket(self.bucket):
+            status, resp = self.retry_policy.call(self.request.next_chunk,
+                                                  http=gcs_http)
+        if self.streaming:
+            self.media.discard(self.request.resumable_progress)
+        return resp
 
-    @gcs_logger
     def close(self):
-        media = http.MediaIoBaseUpload(six.BytesIO(self.data),
-                                       'application/octet-stream',
-                                       chunksize=self.chunk_size,
-                                       resumable=self.resumable)
-        resp = self.conn.objects().insert(
+        if self.upload_pool is not None:
+            self.upload_pool.spawn(self._upload)
+        else:
+            with _pooled_http(self.http_pool) as gcs_http:
+                return self._upload(gcs_http)
+
+    @gcs_logger
+    def _upload(self, gcs_http=None):
+        hashes = self.checksum.hashes()
+        object_hash = None
+        if self.checksum.fields:
+            object_hash = hashes[self.checksum.fields[0]]
+        if (self.stored_hash is not None and
+                encodeutils.safe_encode(self.stored_hash) == object_hash):
+            LOG.debug('Object %(object_name)s with hash %(hash)s is already '
+                      'stored in GCS.',
+                      {'object_name': self.object_name, 'hash': object_hash})
+            return object_hash
+        if self.streaming:
+            self.media.close()
+            size = self.media.size()
+        else:
+            size = len(self.data)
+            if (self.composite_parts > 1 and self.request is None and
+                    size > self.composite_threshold):
+                self._upload_composite(hashes, gcs_http)
+                return object_hash
+        # Small objects skip the request that opens a resumable session.
+        if self.request is None and not (
+                self.resumable and size > self.resumable_threshold):
+            if self.streaming:
+                data = self.media.getbytes(0, size)
+            else:
+                data = self.data
+            media = GoogleMemoryMediaUpload(data, self.chunk_size, False)
+            with _check_bucket(self.bucket):
+                resp = self.retry_policy.execute(self.conn.objects().insert(
+                    bucket=self.bucket,
+                    name=self.object_name,
+                    body={},
+                    media_body=media), gcs_http)
+        else:
+            if self.media is None:
+                self.media = GoogleMemoryMediaUpload(
+                    self.data, self.chunk_size, True)
+            resp = None
+            if self.request is None and not self.streaming:
+                resp = self._resume_session(object_hash, size, gcs_http)
+            try:
+                while resp is None:
+                    resp = self._upload_chunk(gcs_http)
+            except Exception:
+                self._save_session(object_hash, size)
+                raise
+        self._check_hashes(resp, hashes)
+        return object_hash
+
+    def _save_session(self, object_hash, size):
+        """Keep the session of a failed upload for the next attempt.
+
+        Streaming writers drop the data they sent, so only the sessions of
+        other writers can be continued, and only if they hash their data.
+        """
+        if (self.streaming or object_hash is None or self.request is None or
+                not self.request.resumable_uri):
+            return
+        key = (self.bucket, self.object_name)
+        _upload_sessions.pop(key, None)
+        _upload_sessions[key] = (self.request.resumable_uri, object_hash,
+                                 size)
+        while len(_upload_sessions) > _MAX_UPLOAD_SESSIONS:
+            _upload_sessions.popitem(last=False)
+
+    def _resume_session(self, object_hash, size, gcs_http=None):
+        """Continue the session a failed upload of the same data left.
+
+        GCS is asked how much of the object it received and the upload
+        continues from there. Returns the object resource if the upload
+        turns out to be complete, else None.
+        """
+        session = _upload_sessions.pop((self.bucket, self.object_name),
+                                       None)
+        if session is None or session[1:] != (object_hash, size):
+            return None
+        session_uri = session[0]
+        request = self.conn.objects().insert(
             bucket=self.bucket,
             name=self.object_name,
             body={},
-            media_body=media).execute(num_retries=self.num_retries)
-        etag = resp['md5Hash']
-        md5 = hashlib.md5(self.data).digest()
-        if six.PY3:
-            md5 = md5.encode('utf-8')
-            etag = etag.encode('utf-8')
-        md5 = base64.b64encode(md5)
-        if etag != md5:
-            err = _('MD5 of object: %(object_name)s before: '
-                    '%(md5)s and after: %(etag)s is not same.') % {
-                'object_name': self.object_name,
-                'md5': md5, 'etag': etag, }
-            raise exception.InvalidBackup(reason=err)
-        else:
-            LOG.debug('MD5 before: %(md5)s and after: %(etag)s '
-                      'writing object: %(object_name)s in GCS.',
-                      {'etag': etag, 'md5': md5,
-                       'object_name': self.object_name, })
-            return md5
+            media_body=self.media)
+        try:
+            resp, content = (gcs_http or request.http).request(
+                session_uri, method='PUT',
+                headers={'Content-Range': 'bytes */%d' % size,
+                         'Content-Length': '0'})
+        except Exception as err:
+            LOG.warning(_LW('Failed to query the upload session of GCS '
+                            'object %(object_name)s, uploading it again: '
+                            '%(err)s'),
+                        {'object_name': self.object_name, 'err': err})
+            return None
+        if resp.status in (200, 201):
+            return json.loads(encodeutils.safe_decode(content))
+        if resp.status != 308:
+            LOG.info(_LI('Upload session of GCS object %(object_name)s has '
+                         'expired, uploading it again.'),
+                     {'object_name': self.object_name})
+            return None
+        offset = 0
+        if 'range' in resp:
+            offset = int(resp['range'].rsplit('-', 1)[1]) + 1
+        request.resumable_uri = session_uri
+        request.resumable_progress = offset
+        self.request = request
+        LOG.info(_LI('Continuing the upload of GCS object %(object_name)s '
+                     'at byte %(offset)d of %(size)d.'),
+                 {'object_name': self.object_name, 'offset': offset,
+                  'size': size})
+        return None
+
+    def _check_hashes(self, resp, hashes):
+        for field, value in sorted(hashes.items()):
+            etag = encodeutils.safe_encode(resp[field])
+            if etag != value:
+                err = _('%(field)s of object: %(object_name)s before: '
+                        '%(hash)s and after: %(etag)s is not same.') % {
+                    'field': field, 'object_name': self.object_name,
+                    'hash': value, 'etag': etag, }
+                raise exception.InvalidBackup(reason=err)
+        LOG.debug('Hashes %(hashes)s match writing object: %(object_name)s '
+                  'in GCS.',
+                  {'hashes': hashes, 'object_name': self.object_name, })
+
+    def _upload_composite(self, hashes, gcs_http=None):
+        """Upload the object as concurrent parts joined by GCS.
+
+        The parts are not hashed, which would take a pass over the data
+        while close() waits. Composite objects have no MD5, so the composed
+        object is checked with the CRC32C of all of its data, computed as
+        it was written.
+        """
+        size = len(self.data)
+        part_size = -(-size // self.composite_parts)
+        data = memoryview(self.data)
+        pool = GoogleWorkerPool(self.composite_parts, self.http_pool)
+        part_names = []
+        uploaded = []
+
+        def _upload_part(part, gcs_http):
+            part._upload(gcs_http)
+            uploaded.append(part.object_name)
+
+        try:
+            for offset in range(0, size, part_size):
+                part_name = '%s.part-%02d' % (self.object_name,
+                                              len(part_names))
+                part_names.append(part_name)
+                part = GoogleObjectWriter(
+                    self.bucket, part_name, self.conn, self.chunk_size,
+                    self.num_retries, self.resumable,
+                    http_pool=self.http_pool, retry_policy=self.retry_policy,
+                    resumable_threshold=self.resumable_threshold,
+                    checksum_algorithm=None)
+                part._write_view(data[offset:offset + part_size])
+                pool.spawn(functools.partial(_upload_part, part))
+            pool.wait()
+            with _check_bucket(self.bucket):
+                resp = self.retry_policy.execute(self.conn.objects().compose(
+                    destinationBucket=self.bucket,
+                    destinationObject=self.object_name,
+                    body={'sourceObjects': [{'name': part_name}
+                                            for part_name in part_names],
+                          'destination': {
+                              'contentType': 'application/octet-stream'}}),
+                    gcs_http)
+        finally:
+            # After an error, let the parts still uploading finish so that
+            # they are deleted too. The error raised first is reported.
+            try:
+                pool.wait()
+            except Exception:
+                pass
+            self._delete_parts(uploaded, gcs_http)
+
+        crc32c = (hashes.get('crc32c') or
+                  self.composite_checksum.hashes()['crc32c'])
+        self._check_hashes(resp, {'crc32c': crc32c})
+        LOG.debug('Composed object %(object_name)s in GCS from %(parts)d '
+                  'parts.',
+                  {'object_name': self.object_name,
+                   'parts': len(part_names)})
+
+    def _delete_parts(self, part_names, gcs_http=None):
+        for part_name in part_names:
+            try:
+                self.retry_policy.execute(self.conn.objects().delete(
+                    bucket=self.bucket, object=part_name), gcs_http)
+            except Exception as err:
+                LOG.warning(_LW('Failed to delete %(part_name)s, a part of '
+                                'GCS object %(object_name)s: %(err)s'),
+                            {'part_name': part_name,
+                             'object_name': self.object_name, 'err': err})
+
+
+class GoogleWorkerPool(object):
+    """Runs GCS requests concurrently, such as object uploads or ranges.
+
+    spawn() blocks while all workers are busy, which bounds the number of
+    finished objects waiting in memory for upload. Each worker checks out
+    its own connection from the http pool since httplib2 connections must
+    not be shared.
+    """
+
+    def __init__(self, workers, http_pool):
+        self._pool = greenpool.GreenPool(workers)
+        self._http_pool = http_pool
+        self._error = None
+
+    def _call(self, func):
+        with _pooled_http(self._http_pool) as gcs_http:
+            return func(gcs_http)
+
+    def _run(self, func):
+        try:
+            self._call(func)
+        except Exception:
+            if self._error is None:
+                self._error = sys.exc_info()
+
+    def _reraise(self):
+        if self._error is not None:
+            exc_info, self._error = self._error, None
+            six.reraise(*exc_info)
+
+    def spawn(self, func):
+        """Run func(gcs_http) on a free worker."""
+        self._reraise()
+        self._pool.spawn_n(self._run, func)
+
+    def submit(self, func):
+        """Run func(gcs_http) on a free worker and return its GreenThread.
+
+        Errors are raised by the GreenThread's wait() instead of wait().
+        """
+        return self._pool.spawn(self._call, func)
+
+    def wait(self):
+        """Wait for all requests and raise the first error, if any."""
+        self._pool.waitall()
+        self._reraise()
+
+
+def _get_retry_after(err):
+    """Return the seconds to wait asked for by a Retry-After header."""
+    resp = getattr(err, 'resp', None)
+    retry_after = resp.get('retry-after') if resp is not None else None
+    if not retry_after:
+        return 0
+    try:
+        return max(0, float(retry_after))
+    except ValueError:
+        date = email.utils.parsedate_tz(retry_after)
+        if date is None:
+            return 0
+        return max(0, email.utils.mktime_tz(date) - time.time())
+
+
+class GoogleRetryPolicy(object):
+    """Retries failed GCS requests for reads, writes, lists and deletes.
+
+    Waits between attempts grow exponentially with decorrelated jitter up
+    to backup_gcs_retry_max_delay, or longer if GCS sends Retry-After, so
+    concurrent backups hitting rate limits do not retry in lockstep.
+
+    The optional budget is shared by everything using the policy: each
+    retry spends one token and each successful request earns back a
+    tenth of one. Once it is spent, failed requests are not retried.
+    """
+
+    def __init__(self, num_retries, budget=0):
+        self.num_retries = num_retries
+        self.base_delay = CONF.backup_gcs_retry_base_delay
+        self.max_delay = CONF.backup_gcs_retry_max_delay
+        self.error_codes = CONF.backup_gcs_retry_error_codes
+        self.budget = budget
+        self._tokens = budget
+
+    def is_retryable(self, err):
+        if isinstance(err, errors.HttpError):
+            return err.resp.status >= 500 or (
+                six.text_type(err.resp.status) in self.error_codes)
+        return isinstance(err, socket.error)
+
+    def _spend(self):
+        if self.budget <= 0:
+            return True
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _earn(self):
+        if self.budget > 0:
+            self._tokens = min(self.budget, self._tokens + 0.1)
+
+    def _backoff(self, delay):
+        return min(self.max_delay,
+                   random.uniform(self.base_delay, delay * 3))
+
+    def call(self, func, *args, **kwargs):
+        """Call func, retrying it on retryable errors."""
+        delay = self.base_delay
+        retry_num = 0
+        while True:
+            try:
+                result = func(*args, **kwargs)
+            except Exception as err:
+                if (retry_num >= self.num_retries or
+                        not self.is_retryable(err) or not self._spend()):
+                    raise
+                retry_num += 1
+                delay = self._backoff(delay)
+                wait = max(delay, _get_retry_after(err))
+                LOG.warning(_LW('Retrying GCS request in %(wait).1f seconds '
+                                'after error: %(err)s'),
+                            {'wait': wait, 'err': err})
+                eventlet.sleep(wait)
+            else:
+                self._earn()
+                return result
+
+    def execute(self, request, gcs_http=None):
+        """Execute an apiclient request, retrying it on retryable errors."""
+        return self.call(request.execute, http=gcs_http)
+
+
+class GoogleChunkSizer(object):
+    """Tunes the size of sequential download requests, AIMD style.
+
+    The size grows by the initial chunk size after every request that was
+    at least as fast as the one before it, and is halved when a request
+    fails, so restores converge on the best request size for the link.
+    """
+
+    min_chunk_size = 262144
+
+    def __init__(self, chunk_size, max_chunk_size):
+        self.step = chunk_size
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max(chunk_size, max_chunk_size)
+        self._throughput = 0
+
+    def update(self, size, elapsed):
+        """Record a request of size bytes that took elapsed seconds."""
+        if size < self.chunk_size:
+            # The last chunk of an object says nothing about the link.
+            return
+        throughput = size / max(elapsed, 1e-6)
+        if throughput >= self._throughput:
+            self.chunk_size = min(self.chunk_size + self.step,
+                                  self.max_chunk_size)
+        self._throughput = throughput
+
+    def shrink(self):
+        """Halve the request size after a failed request."""
+        self.chunk_size = max(self.chunk_size // 2,
+                              min(self.step, self.min_chunk_size))
+        self._throughput = 0
+
+
+class GoogleRateLimiter(object):
+    """Spaces out GCS operations to at most ops_per_sec per second.
+
+    Each caller reserves the next free time slot before sleeping, so the
+    limit holds across all greenthreads sharing the limiter.
+    """
+
+    def __init__(self, ops_per_sec):
+        self._interval = 1.0 / ops_per_sec
+        self._next = 0
+
+    def acquire(self, ops=1):
+        """Wait until ops more operations are allowed."""
+        now = time.time()
+        start = max(now, self._next)
+        self._next = start + ops * self._interval
+        if start > now:
+            eventlet.sleep(start - now)
+
+
+class GoogleHttpPool(object):
+    """Pool of authorized http connections to GCS.
+
+    httplib2 keeps its connections alive, so a connection returned to the
+    pool lets the next request skip the TCP and TLS handshakes. A
+    connection is only used by one caller at a time. Up to size idle
+    connections are kept, callers never wait for a free one.
+    """
+
+    def __init__(self, size, http_factory):
+        self._size = size
+        self._http_factory = http_factory
+        self._idle = collections.deque()
+
+    @contextlib.contextmanager
+    def get(self):
+        try:
+            gcs_http = self._idle.pop()
+        except IndexError:
+            gcs_http = self._http_factory()
+        try:
+            yield gcs_http
+        finally:
+            if len(self._idle) < self._size:
+                self._idle.append(gcs_http)
+
+
+class GoogleObjectPrefetcher(object):
+    """Downloads the next objects of a restore in the background.
+
+    Objects are fetched in restore order, up to depth objects ahead, as
+    long as their lengths stay within max_bytes. The length stored in the
+    backup metadata is the uncompressed size, an upper bound of the object
+    size.
+    """
+
+    def __init__(self, download, objects, depth, max_bytes, http_pool):
+        self._download = download
+        self._pending = collections.deque(objects)
+        self._depth = depth
+        self._max_bytes = max_bytes
+        self._pool = GoogleWorkerPool(depth, http_pool)
+        self._fetching = collections.OrderedDict()
+        self._buffered_bytes = 0
+        self._schedule()
+
+    def _schedule(self):
+        while self._pending and len(self._fetching) < self._depth:
+            object_name, length = self._pending[0]
+            if (self._fetching and
+                    self._buffered_bytes + length > self._max_bytes):
+                break
+            self._pending.popleft()
+            thread = self._pool.submit(
+                functools.partial(self._download, object_name))
+            self._fetching[object_name] = (thread, length)
+            self._buffered_bytes += length
+
+    def get(self, object_name):
+        """Return the object data, or None if it is not read ahead."""
+        if object_name not in self._fetching:
+            self._pending = collections.deque(
+                obj for obj in self._pending if obj[0] != object_name)
+            return None
+        thread, length = self._fetching.pop(object_name)
+        try:
+            return thread.wait()
+        finally:
+            self._buffered_bytes -= length
+            self._schedule()
+
+    def close(self):
+        """Stop reading ahead.
+
+        Fetches that have not started are cancelled. Running ones are left
+        to finish and their results dropped, since killing them could
+        return a pooled connection in the middle of a response.
+        """
+        self._pending.clear()
+        for thread, length in self._fetching.values():
+            thread.cancel()
+        self._fetching.clear()
+        self._buffered_bytes = 0
+        self._pool.wait()
+
+
+class GoogleMemoryMediaUpload(http.MediaUpload):
+    """Media upload of data in memory, read without copying it first.
+
+    http.MediaIoBaseUpload needs a file object, and wrapping the data in
+    a BytesIO copies all of it. Only the requested bytes are copied here.
+    """
+
+    def __init__(self, data, chunksize, resumable,
+                 mimetype='application/octet-stream'):
+        self._data = memoryview(data)
+        self._chunksize = chunksize
+        self._resumable = resumable
+        self._mimetype = mimetype
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return len(self._data)
+
+    def resumable(self):
+        return self._resumable
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        return self._data[begin:begin + length].tobytes()
+
+
+class GoogleStreamingMediaUpload(http.MediaUpload):
+    """Resumable media upload fed incrementally by GoogleObjectWriter.
+
+    Only the bytes not yet committed by the server are kept. Appended data
+    is uploaded straight from a view of the caller's buffer, and keep()
+    copies just the remaining tail, less than a chunk, once the caller is
+    done with it. The total size is reported as unknown until close() is
+    called, which lets the resumable session be opened before all data
+    has been written.
+    """
+
+    def __init__(self, chunksize, mimetype='application/octet-stream'):
+        self._chunksize = chunksize
+        self._mimetype = mimetype
+        self._buffer = bytearray()
+        # View of appended data that is not copied into _buffer yet.
+        self._pending = memoryview(b'')
+        self._offset = 0
+        self._size = None
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        start = begin - self._offset
+        data = self._buffer[start:start + length]
+        if len(data) < length:
+            start = max(0, start - len(self._buffer))
+            data += self._pending[start:start + length - len(data)]
+        return bytes(data)
+
+    def append(self, data):
+        self.keep()
+        self._pending = memoryview(data)
+
+    def keep(self):
+        """Copy the appended data that is still needed into the buffer."""
+        if len(self._pending):
+            self._buffer += self._pending
+        self._pending = memoryview(b'')
+
+    def buffered(self):
+        return len(self._buffer) + len(self._pending)
+
+    def discard(self, offset):
+        """Drop buffered bytes before offset, they are stored in GCS."""
+        if offset > self._offset:
+            count = offset - self._offset
+            self._pending = self._pending[max(0, count - len(self._buffer)):]
+            del self._buffer[:count]
+            self._offset = offset
+
+    def close(self):
+        self.keep()
+        self._size = self._offset + len(self._buffer)
 
 
 class GoogleObjectReader(object):
     def __init__(self, bucket, object_name, conn, reader_chunk_size,
-                 num_retries):
+                 num_retries, download_workers=1, http_pool=None,
+                 prefetcher=None, retry_policy=None, chunk_sizer=None,
+                 object_size=None, checksum_algorithm='md5'):
         self.bucket = bucket
         self.object_name = object_name
         self.conn = conn
         self.chunk_size = reader_chunk_size
         self.num_retries = num_retries
+        self.download_workers = download_workers
+        self.http_pool = http_pool
+        self.prefetcher = prefetcher
+        self.retry_policy = retry_policy or GoogleRetryPolicy(num_retries)
+        self.chunk_sizer = chunk_sizer
+        # Upper bound of the object size, if known.
+        self.object_size = object_size
+        self.checksum_algorithm = checksum_algorithm
 
     def __enter__(self):
         return self
@@ -297,59 +1713,352 @@ class GoogleObjectReader(object):
     def __exit__(self, exc_type, exc_value, traceback):
         pass
 
+    def read(self, gcs_http=None):
+        """Return the object data.
+
+        On Python 3 this is the bytearray the download was written into,
+        so the object is not copied again after it is received.
+        """
+        data = self._read_buffer(gcs_http)
+        if six.PY2:
+            data = bytes(data)
+        return data
+
+    def read_view(self, gcs_http=None):
+        """Return a memoryview of the object data without copying it."""
+        return memoryview(self._read_buffer(gcs_http))
+
+    def read_iter(self, gcs_http=None):
+        """Yield the object data chunk by chunk as it is downloaded.
+
+        Each range response is yielded as soon as it arrives, so callers
+        can decompress and write the object without holding all of it.
+        """
+        if self.prefetcher is not None:
+            data = self.prefetcher.get(self.object_name)
+            if data is not None:
+                yield data
+                return
+        if self._is_small():
+            yield self._download(gcs_http)
+            return
+        chunks = GoogleChunkQueue()
+        with _pooled_http(self.http_pool, gcs_http) as gcs_http:
+            downloader = self._get_downloader(chunks, gcs_http)
+            done = False
+            while not done:
+                done = self._next_chunk(downloader)
+                if done:
+                    # Hold back the last chunk until the object is checked.
+                    downloader.check_hashes()
+                while chunks:
+                    yield chunks.popleft()
+        LOG.debug('GCS Object download Complete.')
+
     @gcs_logger
-    def read(self):
+    def _next_chunk(self, downloader):
+        status, done = downloader.next_chunk(num_retries=self.num_retries)
+        return done
+
+    def _get_downloader(self, fd, gcs_http=None):
         req = self.conn.objects().get_media(
             bucket=self.bucket,
             object=self.object_name)
-        fh = six.BytesIO()
-        downloader = GoogleMediaIoBaseDownload(
-            fh, req, chunksize=self.chunk_size)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk(num_retries=self.num_retries)
+        if gcs_http is not None:
+            req.http = gcs_http
+        downloader = GoogleMediaIoBaseDownload(fd, req,
+                                               chunksize=self.chunk_size)
+        downloader.retry_policy = self.retry_policy
+        downloader.chunk_sizer = self.chunk_sizer
+        downloader.checksum_algorithm = self.checksum_algorithm
+        return downloader
+
+    def _is_small(self):
+        return (self.object_size is not None and
+                self.object_size <= self.chunk_size)
+
+    def _read_buffer(self, gcs_http=None):
+        if self.prefetcher is not None:
+            data = self.prefetcher.get(self.object_name)
+            if data is not None:
+                return data
+        return self._download(gcs_http)
+
+    def _download(self, gcs_http=None):
+        """Download the object and check it against the hash GCS stores."""
+        data, downloader = self._fetch_object(gcs_http)
+        downloader.check_hashes()
+        return data
+
+    @gcs_logger
+    def _fetch_object(self, gcs_http=None):
+        with _pooled_http(self.http_pool, gcs_http) as gcs_http:
+            downloader = self._get_downloader(None, gcs_http)
+            if self._is_small():
+                data = downloader.fetch_all(num_retries=self.num_retries)
+                return data, downloader
+            status, done = downloader.next_chunk(
+                num_retries=self.num_retries)
+            if not done and self.download_workers > 1:
+                self._read_ranges(downloader)
+                done = True
+            while not done:
+                status, done = downloader.next_chunk(
+                    num_retries=self.num_retries)
         LOG.debug('GCS Object download Complete.')
-        return fh.getvalue()
+        return downloader.buffer, downloader
+
+    def _read_ranges(self, downloader):
+        """Download the rest of the object with concurrent range requests.
+
+        The object size is known from the first response, so every range
+        is written straight to its offset in the download buffer.
+        """
+        total_size = downloader.total_size
+        pool = GoogleWorkerPool(self.download_workers, self.http_pool)
+
+        def _fetch_range(start, gcs_http):
+            end = min(start + self.chunk_size, total_size) - 1
+            resp, content = downloader.fetch_range(
+                start, end, gcs_http=gcs_http, num_retries=self.num_retries)
+            downloader.write(start, content)
+
+        for start in range(downloader.progress, total_size, self.chunk_size):
+            pool.spawn(functools.partial(_fetch_range, start))
+        pool.wait()
+
+
+class GoogleChunkQueue(collections.deque):
+    """File-like target that queues each downloaded chunk."""
+
+    def write(self, content):
+        self.append(content)
+
+
+class GoogleStreamedData(object):
+    """Object data that is consumed chunk by chunk as it is produced."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+class GoogleStreamingObjectReader(object):
+    """Reader returning the object as GoogleStreamedData from read()."""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __enter__(self):
+        self.reader.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.reader.__exit__(exc_type, exc_value, traceback)
+
+    def read(self):
+        return GoogleStreamedData(self.reader.read_iter())
+
+
+class GoogleStreamingDecompressor(object):
+    """Decompresses GoogleStreamedData lazily, chunk by chunk."""
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def decompress(self, data):
+        if not isinstance(data, GoogleStreamedData):
+            return self.compressor.decompress(data)
+        return GoogleStreamedData(self._decompress(data))
+
+    def _decompress(self, data):
+        if self.compressor is bz2:
+            decompressor = bz2.BZ2Decompressor()
+        else:
+            decompressor = self.compressor.decompressobj()
+        for chunk in data:
+            yield decompressor.decompress(chunk)
+        if hasattr(decompressor, 'flush'):
+            yield decompressor.flush()
+
+
+class GoogleStreamingVolumeFile(object):
+    """Volume file writing GoogleStreamedData chunk by chunk."""
+
+    def __init__(self, volume_file):
+        self.volume_file = volume_file
+
+    def write(self, data):
+        if not isinstance(data, GoogleStreamedData):
+            return self.volume_file.write(data)
+        for chunk in data:
+            self.volume_file.write(chunk)
+
+    def __getattr__(self, name):
+        return getattr(self.volume_file, name)
 
 
 class GoogleMediaIoBaseDownload(http.MediaIoBaseDownload):
+    """Downloads a GCS object in chunks.
 
-    @http.util.positional(1)
-    def next_chunk(self, num_retries=None):
-        error_codes = CONF.backup_gcs_retry_error_codes
-        headers = {'range': 'bytes=%d-%d' %
-                   (self._progress, self._progress + self._chunksize)}
-
-        gcs_http = self._request.http
-        for retry_num in range(num_retries + 1):
-            if retry_num > 0:
-                self._sleep(self._rand() * 2 ** retry_num)
-
-            resp, content = gcs_http.request(self._uri, headers=headers)
-            if resp.status < 500 and (six.text_type(resp.status)
-                                      not in error_codes):
-                break
-        if resp.status in [200, 206]:
-            if 'content-location' in resp and (
-                    resp['content-location'] != self._uri):
-                self._uri = resp['content-location']
-            self._progress += len(content)
+    If no file object is given the object is written into buffer, a
+    bytearray allocated from the size in the first response, so each
+    received chunk is copied exactly once.
+
+    If checksum_algorithm is set, each chunk is hashed as it is received
+    and check_hashes() compares the result with the x-goog-hash header.
+    """
+
+    buffer = None
+    retry_policy = None
+    chunk_sizer = None
+    checksum_algorithm = None
+    # Hashes of the object from the x-goog-hash response header.
+    stored_hashes = {}
+
+    def __init__(self, fd, request, chunksize=http.DEFAULT_CHUNK_SIZE):
+        super(GoogleMediaIoBaseDownload, self).__init__(fd, request,
+                                                        chunksize=chunksize)
+        self.checksum = None
+        # The object is hashed up to this offset. Ranges received out of
+        # order wait in the buffer, by offset, until the gap is filled.
+        self._checksum_offset = 0
+        self._checksum_pending = {}
+
+    @property
+    def progress(self):
+        return self._progress
+
+    @property
+    def total_size(self):
+        return self._total_size
+
+    def write(self, offset, content):
+        """Store content received for the given offset of the object."""
+        if self._fd is not None:
+            self._update_checksum(offset, content)
             self._fd.write(content)
+            return
+        if self.buffer is None:
+            self.buffer = bytearray(self._total_size or len(content))
+        self.buffer[offset:offset + len(content)] = content
+        self._update_checksum(offset, content)
 
-            if 'content-range' in resp:
-                content_range = resp['content-range']
-                length = content_range.rsplit('/', 1)[1]
-                self._total_size = int(length)
-            elif 'content-length' in resp:
-                self._total_size = int(resp['content-length'])
+    def _update_checksum(self, offset, content):
+        if self.checksum_algorithm is None:
+            return
+        if self.checksum is None:
+            # Composite objects only have a CRC32C, so fall back to
+            # whichever hash GCS has if it has none of the configured ones.
+            fields = [field
+                      for field in CHECKSUM_FIELDS[self.checksum_algorithm]
+                      if field in self.stored_hashes]
+            if not fields:
+                fields = sorted(self.stored_hashes)
+                if 'crc32c' in fields:
+                    _warn_slow_crc32c()
+            self.checksum = GoogleChecksum(fields)
+        if offset != self._checksum_offset:
+            self._checksum_pending[offset] = len(content)
+            return
+        self.checksum.update(content)
+        self._checksum_offset += len(content)
+        while self._checksum_offset in self._checksum_pending:
+            start = self._checksum_offset
+            end = start + self._checksum_pending.pop(start)
+            self.checksum.update(memoryview(self.buffer)[start:end])
+            self._checksum_offset = end
 
-            if self._progress == self._total_size:
-                self._done = True
-            return (http.MediaDownloadProgress(self._progress,
-                    self._total_size), self._done)
+    def check_hashes(self):
+        """Raise InvalidBackup if the object does not match its hashes."""
+        if self.checksum is None:
+            return
+        for field, value in sorted(self.checksum.hashes().items()):
+            if value != self.stored_hashes[field]:
+                err = _('%(field)s of object: %(uri)s downloaded: '
+                        '%(hash)s and stored: %(stored)s is not same.') % {
+                    'field': field, 'uri': self._uri, 'hash': value,
+                    'stored': self.stored_hashes[field], }
+                raise exception.InvalidBackup(reason=err)
 
-        else:
+    def _fetch(self, start, end, gcs_http=None):
+        gcs_http = gcs_http or self._request.http
+        headers = {'range': 'bytes=%d-%d' % (start, end)}
+        resp, content = gcs_http.request(self._uri, headers=headers)
+        if resp.status not in [200, 206]:
             raise http.HttpError(resp, content, uri=self._uri)
+        self._record_hashes(resp)
+        return resp, content
+
+    def _record_hashes(self, resp):
+        if 'x-goog-hash' in resp:
+            self.stored_hashes = _parse_goog_hash(resp['x-goog-hash'])
+
+    def fetch_range(self, start, end, gcs_http=None, num_retries=0):
+        """Request bytes start to end, inclusive, of the object."""
+        retry_policy = self.retry_policy or GoogleRetryPolicy(num_retries)
+        return retry_policy.call(self._fetch, start, end, gcs_http)
+
+    def fetch_all(self, num_retries=0):
+        """Download the whole object with one plain GET.
+
+        The body is returned as received, without copying it into a
+        download buffer.
+        """
+        def _get():
+            resp, content = self._request.http.request(self._uri)
+            if resp.status != 200:
+                raise http.HttpError(resp, content, uri=self._uri)
+            self._record_hashes(resp)
+            return content
+
+        retry_policy = self.retry_policy or GoogleRetryPolicy(num_retries)
+        content = retry_policy.call(_get)
+        self._update_checksum(0, content)
+        self._progress = self._total_size = len(content)
+        self._done = True
+        return content
+
+    def _fetch_next(self):
+        if self.chunk_sizer is not None:
+            self._chunksize = self.chunk_sizer.chunk_size
+        start = time.time()
+        try:
+            resp, content = self._fetch(self._progress,
+                                        self._progress + self._chunksize - 1)
+        except Exception:
+            if self.chunk_sizer is not None:
+                self.chunk_sizer.shrink()
+            raise
+        if self.chunk_sizer is not None:
+            self.chunk_sizer.update(len(content), time.time() - start)
+        return resp, content
+
+    @http.util.positional(1)
+    def next_chunk(self, num_retries=None):
+        retry_policy = self.retry_policy or GoogleRetryPolicy(
+            num_retries or 0)
+        resp, content = retry_policy.call(self._fetch_next)
+        if 'content-location' in resp and (
+                resp['content-location'] != self._uri):
+            self._uri = resp['content-location']
+
+        if 'content-range' in resp:
+            content_range = resp['content-range']
+            length = content_range.rsplit('/', 1)[1]
+            self._total_size = int(length)
+        elif 'content-length' in resp:
+            self._total_size = int(resp['content-length'])
+
+        self.write(self._progress, content)
+        self._progress += len(content)
+
+        if self._progress == self._total_size:
+            self._done = True
+        return (http.MediaDownloadProgress(self._progress,
+                self._total_size), self._done)
 
 
 def get_backup_driver(context):
@@ -0,0 +1,598 @@
+# Copyright (C) 2016 Google Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Asyncio transport for the Google Cloud Storage backup driver.
+
+Requests are sent with aiohttp from an asyncio event loop running in its
+own native thread, so a single cinder-backup thread can keep hundreds of
+GCS requests in flight without an httplib2 connection and greenthread for
+each of them. GoogleAsyncioTransport is the synchronous facade used by
+GoogleBackupDriver when backup_gcs_transport is asyncio; callers wait for
+results in an eventlet tpool thread so other greenthreads keep running.
+
+This module needs Python 3 and aiohttp.
+"""
+
+import asyncio
+import json
+import sys
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from eventlet import patcher
+from eventlet import tpool
+from oauth2client import client
+from oslo_log import log as logging
+from oslo_utils import encodeutils
+from six.moves import urllib
+
+from cinder.backup.drivers import google as google_dr
+from cinder import exception
+from cinder.i18n import _, _LW
+
+LOG = logging.getLogger(__name__)
+
+# cinder-backup monkey patches threading, and green locks cannot be
+# released from the event loop's native thread, so results are handed
+# back with native ones.
+_threading = patcher.original('threading')
+
+GCS_ROOT_URL = 'https://www.googleapis.com/'
+
+
+class GoogleAsyncioHttpError(Exception):
+    """A GCS request returned an unexpected HTTP status."""
+
+    def __init__(self, status, headers, content, uri):
+        self.status = status
+        self.headers = headers
+        # Named like apiclient's HttpError.resp for _get_retry_after.
+        self.resp = headers
+        self.content = content
+        self.uri = uri
+        super(GoogleAsyncioHttpError, self).__init__(
+            'HTTP %s requesting %s: %s' % (status, uri, content[:200]))
+
+
+class GoogleAsyncioRetryPolicy(google_dr.GoogleRetryPolicy):
+    """GoogleRetryPolicy for coroutines."""
+
+    def is_retryable(self, err):
+        if isinstance(err, GoogleAsyncioHttpError):
+            return err.status >= 500 or (
+                str(err.status) in self.error_codes)
+        return isinstance(err, (aiohttp.ClientError, asyncio.TimeoutError,
+                                OSError))
+
+    async def call_async(self, func, *args, **kwargs):
+        """Await func(), retrying it on retryable errors."""
+        delay = self.base_delay
+        retry_num = 0
+        while True:
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as err:
+                if (retry_num >= self.num_retries or
+                        not self.is_retryable(err) or not self._spend()):
+                    raise
+                retry_num += 1
+                delay = self._backoff(delay)
+                wait = max(delay, google_dr._get_retry_after(err))
+                LOG.warning(_LW('Retrying GCS request in %(wait).1f seconds '
+                                'after error: %(err)s'),
+                            {'wait': wait, 'err': err})
+                await asyncio.sleep(wait)
+            else:
+                self._earn()
+                return result
+
+
+class GoogleAsyncioResult(object):
+    """Result of a coroutine run on the transport's event loop.
+
+    It is set from the loop thread and result() waits for it in an
+    eventlet tpool thread, so other greenthreads keep running.
+    """
+
+    def __init__(self, on_done=None):
+        self._event = _threading.Event()
+        self._on_done = on_done
+        self._result = None
+        self._error = None
+
+    def _set(self, task):
+        """Take the result of task, called in the loop thread."""
+        if task.cancelled():
+            self._error = asyncio.CancelledError()
+        else:
+            self._error = task.exception()
+            if self._error is None:
+                self._result = task.result()
+        self._event.set()
+        if self._on_done is not None:
+            self._on_done()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self):
+        """Wait for the coroutine and return its result or raise its error."""
+        if not self._event.is_set():
+            tpool.execute(self._event.wait)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class GoogleAsyncioTransport(object):
+    """Sends GCS requests from an asyncio event loop in its own thread.
+
+    Each public method runs its requests on the loop and waits for the
+    result, mapping errors to the GCS exceptions raised by the apiclient
+    transport. Requests are capped at concurrency in flight. The access
+    token is refreshed by the callers before their requests are scheduled,
+    so the loop never waits for the token server.
+    """
+
+    def __init__(self, credentials, project_id, num_retries, retry_budget=0,
+                 concurrency=64, root_url=GCS_ROOT_URL, user_agent=None):
+        if aiohttp is None:
+            msg = _('backup_gcs_transport asyncio requires aiohttp.')
+            raise exception.BackupDriverException(message=msg)
+        self.credentials = credentials
+        self.project_id = project_id
+        self.retry_policy = GoogleAsyncioRetryPolicy(num_retries,
+                                                     retry_budget)
+        self.concurrency = concurrency
+        self.api_url = root_url.rstrip('/') + '/storage/v1'
+        self.upload_url = root_url.rstrip('/') + '/upload/storage/v1'
+        self.user_agent = user_agent
+        self._token = None
+        self._token_expiry = 0
+        self._session = None
+        self._semaphore = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = _threading.Thread(target=self._loop.run_forever,
+                                         name='gcs-asyncio')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_object_writer(self, bucket, object_name, checksum_algorithm,
+                          stored_hash=None, upload_pool=None, chunk_size=-1,
+                          resumable_threshold=0):
+        return GoogleAsyncioObjectWriter(self, bucket, object_name,
+                                         checksum_algorithm, stored_hash,
+                                         upload_pool, chunk_size,
+                                         resumable_threshold)
+
+    def get_object_reader(self, bucket, object_name, reader_chunk_size,
+                          checksum_algorithm):
+        return GoogleAsyncioObjectReader(self, bucket, object_name,
+                                         reader_chunk_size, checksum_algorithm)
+
+    def get_upload_pool(self, workers):
+        return GoogleAsyncioUploadPool(self, workers)
+
+    def close(self):
+        """Close the HTTP session and stop the event loop thread."""
+        if self._loop.is_closed():
+            return
+        if self._session is not None:
+            self._wait(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        tpool.execute(self._thread.join)
+        self._loop.close()
+
+    def _submit(self, coro, on_done=None):
+        """Schedule coro on the event loop and return its result.
+
+        on_done is called in the loop thread once the result is set.
+        """
+        result = GoogleAsyncioResult(on_done)
+        self._loop.call_soon_threadsafe(self._start, coro, result)
+        return result
+
+    def _start(self, coro, result):
+        self._loop.create_task(coro).add_done_callback(result._set)
+
+    def _wait(self, coro):
+        return self._submit(coro).result()
+
+    def _schedule(self, coro, bucket=None, on_done=None):
+        """Schedule GCS requests on the event loop, see _mapped()."""
+        self._refresh_token()
+        return self._submit(self._mapped(coro, bucket), on_done)
+
+    def _run(self, coro, bucket=None):
+        """Run GCS requests on the event loop and return their result."""
+        return self._schedule(coro, bucket).result()
+
+    async def _mapped(self, coro, bucket=None):
+        """Await coro, mapping its errors to the GCS exceptions.
+
+        A 404 makes the driver check the bucket again, like
+        google._check_bucket.
+        """
+        try:
+            return await coro
+        except GoogleAsyncioHttpError as err:
+            if err.status == 404 and bucket is not None:
+                google_dr._buckets.pop(bucket, None)
+            raise exception.GCSApiFailure(reason=err)
+        except client.Error as err:
+            raise exception.GCSOAuth2Failure(reason=err)
+        except exception.InvalidBackup:
+            raise
+        except Exception as err:
+            raise exception.GCSConnectionFailure(reason=err)
+
+    async def _get_session(self):
+        if self._session is None:
+            headers = {}
+            if self.user_agent:
+                headers['User-Agent'] = self.user_agent
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers=headers)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    def _refresh_token(self):
+        """Get a new access token if it expires within five minutes.
+
+        Runs in the caller's greenthread, as getting a token blocks.
+        """
+        if self._token is None or time.time() >= self._token_expiry:
+            token = self.credentials.get_access_token()
+            self._token = token.access_token
+            self._token_expiry = (time.time() +
+                                  (token.expires_in or 3600) - 300)
+
+    async def _send(self, method, url, params=None, data=None, headers=None,
+                    ok=(200,)):
+        """Send a request once and return status, headers, body."""
+        session = await self._get_session()
+        request_headers = dict(headers or {})
+        request_headers['Authorization'] = 'Bearer %s' % self._token
+        async with self._semaphore:
+            async with session.request(method, url, params=params,
+                                       data=data,
+                                       headers=request_headers) as resp:
+                content = await resp.read()
+        if resp.status not in ok:
+            raise GoogleAsyncioHttpError(resp.status, resp.headers, content,
+                                         url)
+        return resp.status, resp.headers, content
+
+    async def _request(self, method, url, params=None, data=None,
+                       headers=None, ok=(200,)):
+        """Send a request, retrying it, and return status, headers, body."""
+        return await self.retry_policy.call_async(self._send, method, url,
+                                                  params, data, headers, ok)
+
+    def _object_url(self, bucket, object_name):
+        return '%s/b/%s/o/%s' % (self.api_url, urllib.parse.quote(bucket),
+                                 urllib.parse.quote(object_name, safe=''))
+
+    async def _put_container(self, bucket, location, storage_class):
+        url = '%s/b/%s' % (self.api_url, urllib.parse.quote(bucket))
+        try:
+            await self._request('GET', url, params={'fields': 'name'})
+        except GoogleAsyncioHttpError as err:
+            if err.status != 404:
+                raise
+            body = json.dumps({'name': bucket, 'location': location,
+                               'storageClass': storage_class})
+            await self._request('POST', '%s/b' % self.api_url,
+                                params={'project': self.project_id},
+                                data=body,
+                                headers={'Content-Type': 'application/json'})
+
+    def put_container(self, bucket, location, storage_class):
+        """Create the bucket if it does not exist."""
+        self._run(self._put_container(bucket, location, storage_class),
+                  bucket)
+
+    async def _list_page(self, url, params):
+        status, headers, content = await self._request('GET', url,
+                                                       params=params)
+        return json.loads(content.decode('utf-8'))
+
+    def list_objects(self, bucket, prefix, fields='name', page_size=1000):
+        """Yield the requested fields of each object under prefix.
+
+        Pages are requested as the caller gets to them.
+        """
+        url = '%s/b/%s/o' % (self.api_url, urllib.parse.quote(bucket))
+        params = {'fields': 'items(%s),nextPageToken' % fields,
+                  'maxResults': str(page_size)}
+        if prefix:
+            params['prefix'] = prefix
+        while True:
+            page = self._run(self._list_page(url, params), bucket)
+            for obj_dict in page.get('items', []):
+                yield obj_dict
+            if not page.get('nextPageToken'):
+                return
+            params['pageToken'] = page['nextPageToken']
+
+    async def _delete_objects(self, bucket, object_names, missing_ok):
+        ok = (200, 204, 404) if missing_ok else (200, 204)
+        await asyncio.gather(*[
+            self._request('DELETE', self._object_url(bucket, object_name),
+                          ok=ok)
+            for object_name in object_names])
+
+    def delete_object(self, bucket, object_name):
+        """Delete an object."""
+        self._run(self._delete_objects(bucket, [object_name], False),
+                  bucket)
+
+    def delete_objects(self, bucket, object_names):
+        """Delete objects concurrently; missing objects count as deleted."""
+        self._run(self._delete_objects(bucket, object_names, True), bucket)
+
+    async def _write_object(self, bucket, object_name, data):
+        url = '%s/b/%s/o' % (self.upload_url, urllib.parse.quote(bucket))
+        status, headers, content = await self._request(
+            'POST', url,
+            params={'uploadType': 'media', 'name': object_name},
+            data=data,
+            headers={'Content-Type': 'application/octet-stream'})
+        return json.loads(content.decode('utf-8'))
+
+    async def _write_object_resumable(self, bucket, object_name, data,
+                                      chunk_size):
+        """Upload data in chunks through a resumable upload session.
+
+        After a failed request GCS is asked which bytes it received, and
+        the upload continues from there.
+        """
+        url = '%s/b/%s/o' % (self.upload_url, urllib.parse.quote(bucket))
+        size = len(data)
+        status, headers, content = await self._request(
+            'POST', url,
+            params={'uploadType': 'resumable', 'name': object_name},
+            headers={'X-Upload-Content-Type': 'application/octet-stream',
+                     'X-Upload-Content-Length': str(size)})
+        session_uri = headers['Location']
+        view = memoryview(data)
+        progress = {'offset': 0, 'failed': False}
+
+        async def _send_chunk():
+            if progress['failed']:
+                status, headers, content = await self._send(
+                    'PUT', session_uri,
+                    headers={'Content-Range': 'bytes */%d' % size},
+                    ok=(200, 201, 308))
+                if status != 308:
+                    return status, headers, content
+                progress['offset'] = _received(headers)
+            offset = progress['offset']
+            end = min(offset + chunk_size, size)
+            progress['failed'] = True
+            response = await self._send(
+                'PUT', session_uri, data=view[offset:end],
+                headers={'Content-Range': 'bytes %d-%d/%d' % (
+                    offset, end - 1, size)},
+                ok=(200, 201, 308))
+            progress['failed'] = False
+            return response
+
+        while True:
+            status, headers, content = await self.retry_policy.call_async(
+                _send_chunk)
+            if status != 308:
+                return json.loads(content.decode('utf-8'))
+            progress['offset'] = _received(headers)
+
+    def write_object(self, bucket, object_name, data):
+        """Upload data as an object and return the object resource."""
+        return self._run(self._write_object(bucket, object_name, data),
+                         bucket)
+
+    async def _read_range(self, url, start, end):
+        return await self._request(
+            'GET', url, params={'alt': 'media'},
+            headers={'Range': 'bytes=%d-%d' % (start, end)}, ok=(200, 206))
+
+    async def _read_object(self, bucket, object_name, chunk_size):
+        url = self._object_url(bucket, object_name)
+        status, headers, content = await self._read_range(url, 0,
+                                                          chunk_size - 1)
+        goog_hash = google_dr._parse_goog_hash(
+            ','.join(headers.getall('x-goog-hash', [])))
+        if status == 200 or 'Content-Range' not in headers:
+            return [content], goog_hash
+        total_size = int(headers['Content-Range'].rsplit('/', 1)[1])
+        ranges = await asyncio.gather(*[
+            self._read_range(url, start,
+                             min(start + chunk_size, total_size) - 1)
+            for start in range(len(content), total_size, chunk_size)])
+        return [content] + [body for _s, _h, body in ranges], goog_hash
+
+    def read_object(self, bucket, object_name, chunk_size):
+        """Download an object with concurrent range requests.
+
+        Returns the ranges in order and the hashes GCS stores for the
+        object, from the x-goog-hash header.
+        """
+        return self._run(self._read_object(bucket, object_name, chunk_size),
+                         bucket)
+
+
+def _received(headers):
+    """Return how many bytes of an upload GCS has, from a 308 response."""
+    received = headers.get('Range')
+    if not received:
+        return 0
+    return int(received.rsplit('-', 1)[1]) + 1
+
+
+class GoogleAsyncioUploadPool(object):
+    """Uploads objects concurrently on the transport's event loop.
+
+    Like GoogleWorkerPool, spawn() returns once the upload is scheduled
+    and blocks while workers uploads are pending, which bounds the number
+    of finished objects waiting in memory for upload.
+    """
+
+    def __init__(self, transport, workers):
+        self.transport = transport
+        self.workers = workers
+        self._results = []
+        # Released by the loop thread as each upload finishes.
+        self._finished = _threading.Semaphore(0)
+        self._error = None
+
+    def _collect(self):
+        """Wait for an upload to finish and keep the first error."""
+        tpool.execute(self._finished.acquire)
+        pending = []
+        for result in self._results:
+            if not result.done():
+                pending.append(result)
+                continue
+            try:
+                result.result()
+            except Exception:
+                if self._error is None:
+                    self._error = sys.exc_info()[1]
+        self._results = pending
+
+    def _reraise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def spawn(self, coro, bucket=None):
+        """Run coro on the event loop once fewer than workers are pending."""
+        self._reraise()
+        while len(self._results) >= self.workers:
+            self._collect()
+        self._results.append(self.transport._schedule(
+            coro, bucket, self._finished.release))
+
+    def wait(self):
+        """Wait for all uploads and raise the first error, if any."""
+        while self._results:
+            self._collect()
+        self._reraise()
+
+
+class GoogleAsyncioObjectWriter(object):
+    """Object writer for GoogleAsyncioTransport, checked like uploads."""
+
+    def __init__(self, transport, bucket, object_name,
+                 checksum_algorithm='md5', stored_hash=None,
+                 upload_pool=None, chunk_size=-1, resumable_threshold=0):
+        self.transport = transport
+        self.bucket = bucket
+        self.object_name = object_name
+        self.data = bytearray()
+        self.checksum = google_dr.GoogleChecksum(
+            google_dr.CHECKSUM_FIELDS[checksum_algorithm])
+        self.stored_hash = stored_hash
+        self.upload_pool = upload_pool
+        # Objects larger than resumable_threshold are sent in chunks of
+        # chunk_size through a resumable upload, unless it is -1.
+        self.chunk_size = chunk_size
+        self.resumable_threshold = resumable_threshold
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data):
+        self.checksum.update(data)
+        self.data += data
+
+    def close(self):
+        hashes = self.checksum.hashes()
+        object_hash = hashes[self.checksum.fields[0]]
+        if (self.stored_hash is not None and
+                encodeutils.safe_encode(self.stored_hash) == object_hash):
+            return object_hash
+        if self.upload_pool is not None:
+            self.upload_pool.spawn(self._upload(hashes), self.bucket)
+            return object_hash
+        return self.transport._run(self._upload(hashes), self.bucket)
+
+    async def _upload(self, hashes):
+        if self.chunk_size > 0 and len(self.data) > self.resumable_threshold:
+            resp = await self.transport._write_object_resumable(
+                self.bucket, self.object_name, self.data, self.chunk_size)
+        else:
+            resp = await self.transport._write_object(
+                self.bucket, self.object_name, self.data)
+        for field, value in sorted(hashes.items()):
+            etag = encodeutils.safe_encode(resp.get(field, ''))
+            if etag != value:
+                err = _('%(field)s of object: %(object_name)s before: '
+                        '%(hash)s and after: %(etag)s is not same.') % {
+                    'field': field, 'object_name': self.object_name,
+                    'hash': value, 'etag': etag, }
+                raise exception.InvalidBackup(reason=err)
+        return hashes[self.checksum.fields[0]]
+
+
+class GoogleAsyncioObjectReader(object):
+    """Object reader for GoogleAsyncioTransport.
+
+    The ranges are downloaded concurrently, then hashed in order and
+    checked against x-goog-hash before the object is returned.
+    """
+
+    def __init__(self, transport, bucket, object_name, reader_chunk_size,
+                 checksum_algorithm='md5'):
+        self.transport = transport
+        self.bucket = bucket
+        self.object_name = object_name
+        self.chunk_size = reader_chunk_size
+        self.checksum_algorithm = checksum_algorithm
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def read(self):
+        ranges, stored_hashes = self.transport.read_object(
+            self.bucket, self.object_name, self.chunk_size)
+        fields = [field
+                  for field in google_dr.CHECKSUM_FIELDS[
+                      self.checksum_algorithm]
+                  if field in stored_hashes] or sorted(stored_hashes)
+        checksum = google_dr.GoogleChecksum(fields)
+        for content in ranges:
+            checksum.update(content)
+        for field, value in sorted(checksum.hashes().items()):
+            if value != stored_hashes[field]:
+                err = _('%(field)s of object: %(object_name)s downloaded: '
+                        '%(hash)s and stored: %(stored)s is not same.') % {
+                    'field': field, 'object_name': self.object_name,
+                    'hash': value, 'stored': stored_hashes[field], }
+                raise exception.InvalidBackup(reason=err)
+        return b''.join(ranges)
+
+    def read_iter(self):
+        yield self.read()
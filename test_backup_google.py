@@ -19,15 +19,24 @@ Tests for Google Backup code.
 
 """
 
+import base64
 import bz2
+import collections
 import filecmp
 import hashlib
+import json
 import os
 import shutil
+import socket
+import struct
 import tempfile
+import unittest
 import zlib
 
+from apiclient import model
+import httplib2
 import mock
+from oslo_utils import timeutils
 from oslo_utils import units
 
 from cinder.backup.drivers import google as google_dr
@@ -39,12 +48,16 @@ from cinder import objects
 from cinder import test
 from cinder.tests.unit.backup import fake_google_client
 from cinder.tests.unit.backup import fake_google_client2
+from cinder.tests.unit.backup import fake_google_server
 
 
 class FakeMD5(object):
     def __init__(self, *args, **kwargs):
         pass
 
+    def update(self, data):
+        pass
+
     @classmethod
     def digest(self):
         return 'gcscindermd5'
@@ -67,8 +80,10 @@ class FakeObjectName(object):
 def gcs_client(func):
     @mock.patch.object(google_dr.client, 'GoogleCredentials',
                        fake_google_client.FakeGoogleCredentials)
-    @mock.patch.object(google_dr.discovery, 'build',
+    @mock.patch.object(google_dr.discovery, 'build_from_document',
                        fake_google_client.FakeGoogleDiscovery.Build)
+    @mock.patch.object(google_dr, '_get_discovery_document',
+                       mock.Mock(return_value='{}'))
     @mock.patch.object(google_dr, 'GoogleMediaIoBaseDownload',
                        fake_google_client.FakeGoogleMediaIoBaseDownload)
     @mock.patch.object(hashlib, 'md5', FakeMD5)
@@ -81,8 +96,10 @@ def gcs_client(func):
 def gcs_client2(func):
     @mock.patch.object(google_dr.client, 'GoogleCredentials',
                        fake_google_client2.FakeGoogleCredentials)
-    @mock.patch.object(google_dr.discovery, 'build',
+    @mock.patch.object(google_dr.discovery, 'build_from_document',
                        fake_google_client2.FakeGoogleDiscovery.Build)
+    @mock.patch.object(google_dr, '_get_discovery_document',
+                       mock.Mock(return_value='{}'))
     @mock.patch.object(google_dr, 'GoogleMediaIoBaseDownload',
                        fake_google_client2.FakeGoogleMediaIoBaseDownload)
     @mock.patch.object(google_dr.GoogleBackupDriver,
@@ -152,6 +169,13 @@ class GoogleBackupDriverTestCase(test.TestCase):
         self.addCleanup(self.volume_file.close)
         # Remove tempdir.
         self.addCleanup(shutil.rmtree, self.temp_dir)
+        buckets = mock.patch.object(google_dr, '_buckets', {})
+        buckets.start()
+        self.addCleanup(buckets.stop)
+        sessions = mock.patch.object(google_dr, '_upload_sessions',
+                                     collections.OrderedDict())
+        sessions.start()
+        self.addCleanup(sessions.stop)
         for _i in range(0, 64):
             self.volume_file.write(os.urandom(units.Ki))
 
@@ -166,6 +190,72 @@ class GoogleBackupDriverTestCase(test.TestCase):
         result = service.backup(backup, self.volume_file)
         self.assertIsNone(result)
 
+    @gcs_client
+    def test_backup_resume(self):
+        self.flags(backup_gcs_resume=True)
+        self.flags(backup_gcs_object_size=32 * units.Ki)
+        self.flags(backup_gcs_block_size=units.Ki)
+        volume_id = 'b09b1ad4-5f0e-4d3f-8b9e-0000004f5ec3'
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container='test-bucket',
+                                              service_metadata='old/prefix')
+        inserted = []
+
+        def _insert(*args, **kwargs):
+            inserted.append(kwargs['name'])
+            return fake_google_client.FakeGoogleObjectInsertExecute(**kwargs)
+
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        stored_md5 = base64.b64encode(b'gcscindermd5').decode('utf-8')
+        self.volume_file.seek(0)
+        with mock.patch.object(
+                service, '_get_object_hashes',
+                return_value={'old/prefix-00001': stored_md5}) as hashes, \
+                mock.patch.object(fake_google_client.FakeGoogleObject,
+                                  'insert', side_effect=_insert):
+            service.backup(backup, self.volume_file)
+
+        hashes.assert_called_once_with('test-bucket', 'old/prefix')
+        self.assertEqual('old/prefix', backup.service_metadata)
+        self.assertNotIn('old/prefix-00001', inserted)
+        self.assertIn('old/prefix-00002', inserted)
+        self.assertEqual({}, service.stored_hashes)
+
+    def test_writer_skips_stored_object(self):
+        data = os.urandom(units.Ki)
+        md5_hash = base64.b64encode(hashlib.md5(data).digest())
+        conn = mock.Mock()
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 3, True,
+                                              stored_hash=md5_hash)
+        writer.write(data)
+
+        self.assertEqual(md5_hash, writer.close())
+        self.assertFalse(conn.objects.called)
+
+        insert = conn.objects.return_value.insert
+        insert.return_value.next_chunk.return_value = (
+            None, {'md5Hash': md5_hash.decode('utf-8')})
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 3, True,
+                                              stored_hash='c3RhbGU=')
+        writer.write(data)
+        self.assertEqual(md5_hash, writer.close())
+        self.assertTrue(insert.called)
+
+    @gcs_client
+    def test_get_object_hashes(self):
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.conn = mock.Mock()
+        objects = service.conn.objects.return_value
+        objects.list.return_value.execute.return_value = {
+            'items': [{'name': 'prefix-00001', 'md5Hash': 'bWQ1'}]}
+
+        self.assertEqual({'prefix-00001': 'bWQ1'},
+                         service._get_object_hashes('gcsbucket', 'prefix'))
+        self.assertEqual('items(name,md5Hash),nextPageToken',
+                         objects.list.call_args[1]['fields'])
+
     @gcs_client
     def test_backup_uncompressed(self):
         volume_id = '2b9f10a3-42b4-4fdf-b316-000000ceb039'
@@ -380,6 +470,89 @@ class GoogleBackupDriverTestCase(test.TestCase):
         self.assertNotEqual(content1['sha256s'][16], content2['sha256s'][16])
         self.assertNotEqual(content1['sha256s'][20], content2['sha256s'][20])
 
+    @gcs_client2
+    def test_restore_upload_workers(self):
+        volume_id = '5d0a2d3e-7d42-4d6f-9a51-000000c4c6a1'
+        self.flags(backup_gcs_object_size=8 * units.Ki)
+        self.flags(backup_gcs_block_size=units.Ki)
+        self.flags(backup_gcs_upload_workers=4)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container=container_name)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        service.backup(backup, self.volume_file)
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    @gcs_client
+    def test_create_backup_fail_upload_workers(self):
+        self.flags(backup_gcs_upload_workers=4)
+        volume_id = 'b09b1ad4-5f0e-4d3f-8b9e-0000004f5ec2'
+        container_name = 'gcs_api_failure'
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container=container_name)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        self.assertRaises(exception.GCSApiFailure,
+                          service.backup,
+                          backup, self.volume_file)
+
+    @gcs_client
+    def test_backup_waits_for_uploads_on_error(self):
+        self.flags(backup_gcs_object_size=8 * units.Ki)
+        self.flags(backup_gcs_block_size=units.Ki)
+        self.flags(backup_gcs_upload_workers=4)
+        backup = self._create_backup_db_entry()
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.upload_pool = mock.Mock()
+        service.upload_pool.wait.side_effect = exception.GCSApiFailure(
+            reason='upload')
+        volume_file = mock.Mock()
+        volume_file.tell.return_value = 0
+        volume_file.read.side_effect = [os.urandom(8 * units.Ki),
+                                        IOError('read')]
+
+        self.assertRaises(IOError, service.backup, backup, volume_file)
+        self.assertEqual(1, service.upload_pool.spawn.call_count)
+        service.upload_pool.wait.assert_called_once_with()
+
+    @gcs_client
+    def test_backup_progress_end_waits_for_uploads(self):
+        self.flags(backup_gcs_upload_workers=4)
+        backup = self._create_backup_db_entry()
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        calls = mock.Mock()
+        calls.wait.side_effect = service.upload_pool.wait
+        service.upload_pool.wait = calls.wait
+        self.volume_file.seek(0)
+
+        with mock.patch.object(google_dr.chunkeddriver.ChunkedBackupDriver,
+                               '_send_progress_end',
+                               calls.send_progress_end):
+            service.backup(backup, self.volume_file)
+        self.assertEqual(['wait', 'send_progress_end'],
+                         [name for name, args, kwargs
+                          in calls.mock_calls][:2])
+
+    def test_upload_pool_reuses_http(self):
+        http_factory = mock.Mock(side_effect=[mock.sentinel.http1,
+                                              mock.sentinel.http2])
+        pool = google_dr.GoogleWorkerPool(
+            2, google_dr.GoogleHttpPool(2, http_factory))
+        upload = mock.Mock()
+
+        for _i in range(5):
+            pool.spawn(upload)
+        pool.wait()
+
+        self.assertEqual(5, upload.call_count)
+        self.assertLessEqual(http_factory.call_count, 2)
+
     @gcs_client
     def test_create_backup_fail(self):
         volume_id = 'b09b1ad4-5f0e-4d3f-8b9e-0000004f5ec2'
@@ -501,6 +674,826 @@ class GoogleBackupDriverTestCase(test.TestCase):
             self.assertTrue(filecmp.cmp(self.volume_file.name,
                             restored_file.name))
 
+    @gcs_client2
+    def test_restore_streaming_writer(self):
+        volume_id = 'f1a5e4b0-0d3c-4c5e-a8a7-0000009b3e2f'
+        self.flags(backup_gcs_object_size=8 * units.Ki)
+        self.flags(backup_gcs_block_size=units.Ki)
+        self.flags(backup_gcs_writer_chunk_size=units.Ki)
+        self.flags(backup_gcs_writer_streaming=True)
+        self.flags(backup_compression_algorithm='none')
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container=container_name)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        service.backup(backup, self.volume_file)
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    def test_streaming_writer_uploads_while_writing(self):
+        request = mock.Mock(resumable_progress=0)
+
+        def _fake_next_chunk(http=None, num_retries=None):
+            request.resumable_progress += units.Ki
+            return None, None
+
+        request.next_chunk.side_effect = _fake_next_chunk
+        conn = mock.Mock()
+        conn.objects.return_value.insert.return_value = request
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 3, True,
+                                              streaming=True)
+
+        writer.write(b'\0' * units.Ki)
+        self.assertFalse(request.next_chunk.called)
+        writer.write(b'\0' * units.Ki)
+        request.next_chunk.assert_called_once_with(http=None)
+        self.assertEqual(units.Ki, writer.media.buffered())
+
+        writer.write(b'\0' * (units.Ki + 1))
+        self.assertEqual(3, request.next_chunk.call_count)
+        self.assertEqual(1, writer.media.buffered())
+        self.assertEqual(b'\0', writer.media.getbytes(3 * units.Ki, units.Ki))
+
+    def test_streaming_writer_buffers_only_tail(self):
+        request = mock.Mock(resumable_progress=0)
+        chunks = []
+
+        def _fake_next_chunk(http=None):
+            chunks.append(writer.media.getbytes(request.resumable_progress,
+                                                units.Ki))
+            request.resumable_progress += units.Ki
+            return None, None
+
+        request.next_chunk.side_effect = _fake_next_chunk
+        conn = mock.Mock()
+        conn.objects.return_value.insert.return_value = request
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 3, True,
+                                              streaming=True)
+        data = os.urandom(units.Ki // 2 + 4 * units.Ki)
+        writer.write(data[:units.Ki // 2])
+        writer.write(data[units.Ki // 2:])
+
+        # Full chunks are sent from the written data, only the rest is kept.
+        self.assertEqual(4, len(chunks))
+        self.assertEqual(units.Ki // 2, len(writer.media._buffer))
+        self.assertEqual(0, len(writer.media._pending))
+        self.assertEqual(data, b''.join(chunks) + writer.media._buffer)
+
+    def test_http_pool_reuses_connections(self):
+        http_factory = mock.Mock(side_effect=[mock.sentinel.http1,
+                                              mock.sentinel.http2,
+                                              mock.sentinel.http3])
+        http_pool = google_dr.GoogleHttpPool(1, http_factory)
+
+        with http_pool.get() as http1:
+            with http_pool.get() as http2:
+                self.assertNotEqual(http1, http2)
+        with http_pool.get() as http3:
+            self.assertEqual(http2, http3)
+        self.assertEqual(2, http_factory.call_count)
+
+    @gcs_client
+    def test_http_pool_shared_by_drivers(self):
+        service1 = google_dr.GoogleBackupDriver(self.ctxt)
+        service2 = google_dr.GoogleBackupDriver(self.ctxt)
+        self.assertIs(service1.http_pool, service2.http_pool)
+
+    @gcs_client
+    def test_put_container_creates_missing_bucket(self):
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.conn = mock.Mock()
+        buckets = service.conn.buckets.return_value
+        buckets.get.return_value.execute.side_effect = (
+            google_dr.errors.HttpError(
+                fake_google_client.FakeGoogleResponse(404), b''))
+
+        service.put_container('gcsbucket')
+
+        buckets.get.assert_called_once_with(bucket='gcsbucket',
+                                            fields='name')
+        self.assertEqual('gcsbucket',
+                         buckets.insert.call_args[1]['body']['name'])
+
+    @gcs_client
+    def test_put_container_cached(self):
+        self.flags(backup_gcs_bucket_cache_ttl=60)
+        self.addCleanup(timeutils.clear_time_override)
+        timeutils.set_time_override()
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.conn = mock.Mock()
+        buckets = service.conn.buckets.return_value
+
+        service.put_container('gcsbucket')
+        service.put_container('gcsbucket')
+        self.assertEqual(1, buckets.get.call_count)
+
+        timeutils.advance_time_seconds(61)
+        service.put_container('gcsbucket')
+        self.assertEqual(2, buckets.get.call_count)
+        self.assertFalse(buckets.insert.called)
+
+    @gcs_client
+    def test_put_container_cache_disabled(self):
+        self.flags(backup_gcs_bucket_cache_ttl=0)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.conn = mock.Mock()
+
+        service.put_container('gcsbucket')
+        service.put_container('gcsbucket')
+
+        self.assertEqual(2, service.conn.buckets.return_value.get.call_count)
+
+    @gcs_client
+    def test_get_container_entries_pages(self):
+        self.flags(backup_gcs_list_page_size=2)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.conn = mock.Mock()
+        objects = service.conn.objects.return_value
+        objects.list.return_value.execute.side_effect = [
+            {'items': [{'name': 'backup_001'}, {'name': 'backup_002'}],
+             'nextPageToken': 'token'},
+            {'items': [{'name': 'backup_003'}]},
+        ]
+
+        entries = service.get_container_entries('gcsbucket', 'backup')
+        self.assertEqual('backup_001', next(entries))
+        self.assertEqual(1, objects.list.call_count)
+        self.assertEqual(['backup_002', 'backup_003'], list(entries))
+
+        objects.list.assert_called_with(
+            bucket='gcsbucket', fields='items(name),nextPageToken',
+            maxResults=2, pageToken='token', prefix='backup')
+        self.assertIsNone(objects.list.call_args_list[0][1]['pageToken'])
+
+    @gcs_client
+    def test_get_container_entries_failure(self):
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        entries = service.get_container_entries('gcs_connection_failure',
+                                                'backup')
+        self.assertRaises(exception.GCSConnectionFailure, list, entries)
+
+    @gcs_client
+    def test_writer_not_found_forgets_bucket(self):
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.put_container('gcsbucket')
+        self.assertIn('gcsbucket', google_dr._buckets)
+        service.conn = mock.Mock()
+        insert = service.conn.objects.return_value.insert.return_value
+        insert.execute.side_effect = google_dr.errors.HttpError(
+            fake_google_client.FakeGoogleResponse(404), b'')
+
+        writer = service.get_object_writer('gcsbucket', 'object')
+        writer.write(b'data')
+        self.assertRaises(exception.GCSApiFailure, writer.close)
+        self.assertNotIn('gcsbucket', google_dr._buckets)
+
+    @mock.patch.object(google_dr, '_discovery_document', None)
+    def test_discovery_document_fetched_once(self):
+        gcs_http = mock.Mock()
+        gcs_http.request.return_value = (
+            fake_google_client.FakeGoogleResponse(200), b'{"name": "storage"}')
+
+        google_dr._get_discovery_document(gcs_http)
+        document = google_dr._get_discovery_document(gcs_http)
+
+        self.assertEqual('{"name": "storage"}', document)
+        gcs_http.request.assert_called_once_with(google_dr.GCS_DISCOVERY_URI)
+
+    @mock.patch.object(google_dr, '_discovery_document', None)
+    def test_discovery_document_from_file(self):
+        discovery_file = os.path.join(self.temp_dir, 'storage-v1.json')
+        with open(discovery_file, 'w') as f:
+            f.write('{"name": "storage"}')
+        self.flags(backup_gcs_discovery_file=discovery_file)
+        gcs_http = mock.Mock()
+
+        document = google_dr._get_discovery_document(gcs_http)
+
+        self.assertEqual('{"name": "storage"}', document)
+        self.assertFalse(gcs_http.request.called)
+
+    @mock.patch.object(google_dr, '_credentials', {})
+    @mock.patch.object(google_dr.client.GoogleCredentials, 'from_stream')
+    def test_credentials_cached_by_mtime(self, from_stream):
+        from_stream.return_value.create_scoped_required.return_value = False
+        credential_file = os.path.join(self.temp_dir, 'credentials.json')
+        with open(credential_file, 'w') as f:
+            f.write('{}')
+
+        credentials, http_pool = google_dr._get_credentials(credential_file)
+        self.assertEqual((credentials, http_pool),
+                         google_dr._get_credentials(credential_file))
+        self.assertEqual(1, from_stream.call_count)
+
+        os.utime(credential_file, (0, 0))
+        google_dr._get_credentials(credential_file)
+        self.assertEqual(2, from_stream.call_count)
+
+    def test_writer_md5_computed_on_write(self):
+        data = os.urandom(units.Ki)
+        md5_hash = base64.b64encode(hashlib.md5(data).digest())
+        conn = mock.Mock()
+        insert = conn.objects.return_value.insert
+        insert.return_value.next_chunk.return_value = (
+            None, {'md5Hash': md5_hash.decode('utf-8')})
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 3, True)
+
+        writer.write(data[:100])
+        writer.write(data[100:])
+
+        self.assertEqual(hashlib.md5(data).hexdigest(),
+                         writer.checksum.md5.hexdigest())
+        self.assertEqual(md5_hash, writer.close())
+
+    def _composite_conn(self, data, crc32c=None):
+        conn = mock.Mock()
+        # Kept in case a test mocks the hash functions.
+        crc32c_func = google_dr._crc32c
+        md5_func = hashlib.md5
+
+        def insert(bucket, name, body, media_body):
+            part = media_body.getbytes(0, media_body.size())
+            request = mock.Mock()
+            request.execute.return_value = {
+                'md5Hash': base64.b64encode(
+                    md5_func(part).digest()).decode('utf-8'),
+                'crc32c': google_dr._encode_crc32c(
+                    crc32c_func(part)).decode('utf-8')}
+            return request
+
+        if crc32c is None:
+            crc32c = struct.pack('>I', google_dr._crc32c(data))
+        objects = conn.objects.return_value
+        objects.insert.side_effect = insert
+        objects.compose.return_value.execute.return_value = {
+            'crc32c': base64.b64encode(crc32c).decode('utf-8')}
+        return conn
+
+    def test_writer_composite_upload(self):
+        data = os.urandom(10 * units.Ki)
+        conn = self._composite_conn(data)
+        writer = google_dr.GoogleObjectWriter(
+            'bucket', 'object', conn, units.Ki, 3, True,
+            resumable_threshold=units.Mi, composite_parts=4,
+            composite_threshold=units.Ki)
+        writer.write(data)
+
+        self.assertEqual(base64.b64encode(hashlib.md5(data).digest()),
+                         writer.close())
+        objects = conn.objects.return_value
+        part_names = ['object.part-%02d' % i for i in range(4)]
+        self.assertEqual(part_names,
+                         sorted(kwargs['name'] for _args, kwargs
+                                in objects.insert.call_args_list))
+        compose_body = objects.compose.call_args[1]['body']
+        self.assertEqual([{'name': name} for name in part_names],
+                         compose_body['sourceObjects'])
+        self.assertEqual(part_names,
+                         [kwargs['object'] for _args, kwargs
+                          in objects.delete.call_args_list])
+
+    def test_writer_composite_crc32c_computed_on_write(self):
+        data = os.urandom(10 * units.Ki)
+        conn = self._composite_conn(data)
+        writer = google_dr.GoogleObjectWriter(
+            'bucket', 'object', conn, units.Ki, 3, True,
+            resumable_threshold=units.Mi, composite_parts=4,
+            composite_threshold=units.Ki)
+        writer.write(data[:units.Ki])
+        writer.write(data[units.Ki:])
+
+        # Neither the object nor its parts are hashed while closing.
+        with mock.patch.object(google_dr, '_crc32c') as mock_crc32c, \
+                mock.patch.object(google_dr.hashlib, 'md5') as mock_md5:
+            writer.close()
+        self.assertFalse(mock_crc32c.called)
+        self.assertFalse(mock_md5.called)
+
+    @mock.patch.object(google_dr, 'google_crc32c', None)
+    @mock.patch.object(google_dr, '_warnings', set())
+    @mock.patch.object(google_dr.LOG, 'warning')
+    @gcs_client
+    def test_composite_disabled_without_google_crc32c(self, mock_warning):
+        self.flags(backup_gcs_writer_composite_parts=4)
+
+        self.assertEqual(1, google_dr.GoogleBackupDriver(
+            self.ctxt).composite_parts)
+        google_dr.GoogleBackupDriver(self.ctxt)
+        self.assertEqual(1, mock_warning.call_count)
+
+    @mock.patch.object(google_dr, 'google_crc32c', None)
+    @mock.patch.object(google_dr, '_warnings', set())
+    @mock.patch.object(google_dr.LOG, 'warning')
+    @gcs_client
+    def test_crc32c_checksum_warns_without_google_crc32c(self, mock_warning):
+        self.flags(backup_gcs_checksum_algorithm='crc32c')
+
+        google_dr.GoogleBackupDriver(self.ctxt)
+        google_dr.GoogleBackupDriver(self.ctxt)
+        self.assertEqual(1, mock_warning.call_count)
+
+    def test_writer_composite_crc32c_mismatch(self):
+        data = os.urandom(10 * units.Ki)
+        conn = self._composite_conn(data, crc32c=b'\0\0\0\0')
+        writer = google_dr.GoogleObjectWriter(
+            'bucket', 'object', conn, units.Ki, 3, True,
+            resumable_threshold=units.Mi, composite_parts=4,
+            composite_threshold=units.Ki)
+        writer.write(data)
+
+        self.assertRaises(exception.GCSConnectionFailure, writer.close)
+        self.assertEqual(4, conn.objects.return_value.delete.call_count)
+
+    @unittest.skipIf(google_dr.google_crc32c is None,
+                     'google-crc32c is not installed')
+    def test_writer_composite_upload_crc32c(self):
+        data = os.urandom(10 * units.Ki)
+        conn = self._composite_conn(data)
+        writer = google_dr.GoogleObjectWriter(
+            'bucket', 'object', conn, units.Ki, 3, True,
+            resumable_threshold=units.Mi, composite_parts=4,
+            composite_threshold=units.Ki, checksum_algorithm='crc32c')
+        writer.write(data)
+
+        self.assertEqual(google_dr._encode_crc32c(google_dr._crc32c(data)),
+                         writer.close())
+        self.assertEqual(4, conn.objects.return_value.delete.call_count)
+
+    def test_writer_composite_deletes_uploaded_parts(self):
+        data = os.urandom(10 * units.Ki)
+        conn = self._composite_conn(data)
+        objects = conn.objects.return_value
+        insert = objects.insert.side_effect
+        part_names = []
+
+        def _insert(**kwargs):
+            part_names.append(kwargs['name'])
+            if len(part_names) == 3:
+                raise exception.GCSApiFailure(reason='insert')
+            return insert(**kwargs)
+
+        objects.insert.side_effect = _insert
+        writer = google_dr.GoogleObjectWriter(
+            'bucket', 'object', conn, units.Ki, 3, True,
+            resumable_threshold=units.Mi, composite_parts=4,
+            composite_threshold=units.Ki)
+        writer.write(data)
+
+        self.assertRaises(exception.GCSApiFailure, writer.close)
+        self.assertEqual(3, objects.delete.call_count)
+
+    def test_writer_composite_below_threshold(self):
+        data = os.urandom(units.Ki)
+        conn = self._composite_conn(data)
+        writer = google_dr.GoogleObjectWriter(
+            'bucket', 'object', conn, units.Ki, 3, True,
+            resumable_threshold=units.Mi, composite_parts=4,
+            composite_threshold=units.Ki)
+        writer.write(data)
+
+        writer.close()
+        self.assertEqual(1, conn.objects.return_value.insert.call_count)
+        self.assertFalse(conn.objects.return_value.compose.called)
+
+    @mock.patch.object(google_dr, 'google_crc32c', None)
+    def test_crc32c(self):
+        self.assertEqual(0xE3069283, google_dr._crc32c(b'123456789'))
+        self.assertEqual(0xE3069283, google_dr._crc32c(
+            b'56789', google_dr._crc32c(b'1234')))
+        self.assertEqual(0, google_dr._crc32c(b''))
+
+    def _upload_resumable(self, size, streaming=False):
+        data = os.urandom(size)
+        md5_hash = base64.b64encode(hashlib.md5(data).digest())
+        conn = mock.Mock()
+        insert = conn.objects.return_value.insert
+        resp = {'md5Hash': md5_hash.decode('utf-8')}
+        insert.return_value.execute.return_value = resp
+        insert.return_value.next_chunk.return_value = (None, resp)
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 3, True,
+                                              streaming=streaming,
+                                              resumable_threshold=units.Ki)
+        writer.write(data)
+        writer.close()
+        return insert.call_args[1]['media_body'].resumable()
+
+    def test_writer_resumable_threshold(self):
+        self.assertFalse(self._upload_resumable(units.Ki))
+        self.assertTrue(self._upload_resumable(units.Ki + 1))
+
+    def test_streaming_writer_small_object_multipart(self):
+        self.assertFalse(self._upload_resumable(100, streaming=True))
+
+    @mock.patch.object(google_dr.eventlet, 'sleep')
+    def test_writer_resumes_upload_session(self, mock_sleep):
+        data = os.urandom(3 * units.Ki)
+        md5_hash = base64.b64encode(hashlib.md5(data).digest())
+        response = fake_google_client.FakeGoogleResponse
+        gcs_http = fake_google_client.FakeGoogleSequenceHttp([
+            (response(200, {'location': 'https://upload/session'}), b''),
+            (response(308, {'range': 'bytes=0-1023'}), b''),
+            socket.error('connection reset'),
+            (response(308, {'range': 'bytes=0-1535'}), b''),
+            (response(308, {'range': 'bytes=0-2559'}), b''),
+            (response(200), json.dumps(
+                {'md5Hash': md5_hash.decode('utf-8')}).encode('utf-8')),
+        ])
+
+        def _insert(bucket, name, body, media_body):
+            return google_dr.http.HttpRequest(
+                gcs_http, model.JsonModel().response,
+                'https://upload/b/bucket/o?uploadType=resumable',
+                method='POST', resumable=media_body)
+
+        conn = mock.Mock()
+        conn.objects.return_value.insert.side_effect = _insert
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 0, True)
+        writer.write(data)
+
+        # The connection drops and no retries are left.
+        self.assertRaises(exception.GCSConnectionFailure, writer.close)
+        # The next attempt at the backup continues the session.
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 0, True)
+        writer.write(data)
+        self.assertEqual(md5_hash, writer.close())
+
+        headers = [h for _m, h in gcs_http.requests]
+        self.assertEqual('PUT', gcs_http.requests[3][0])
+        self.assertEqual('bytes */3072', headers[3]['Content-Range'])
+        self.assertEqual('bytes 1536-2559/3072', headers[4]['Content-Range'])
+        self.assertEqual('bytes 2560-3071/3072', headers[5]['Content-Range'])
+        self.assertEqual({}, google_dr._upload_sessions)
+
+    def test_writer_upload_session_complete_or_expired(self):
+        data = os.urandom(3 * units.Ki)
+        md5_hash = base64.b64encode(hashlib.md5(data).digest())
+        resource = json.dumps({'md5Hash': md5_hash.decode('utf-8')})
+        response = fake_google_client.FakeGoogleResponse
+        conn = mock.Mock()
+        insert = conn.objects.return_value.insert
+        insert.return_value.next_chunk.return_value = (
+            None, json.loads(resource))
+        for status, uploads in ((200, 0), (404, 1)):
+            gcs_http = fake_google_client.FakeGoogleSequenceHttp([
+                (response(status), resource.encode('utf-8'))])
+            insert.return_value.http = gcs_http
+            insert.return_value.next_chunk.reset_mock()
+            google_dr._upload_sessions['bucket', 'object'] = (
+                'https://upload/session', md5_hash, len(data))
+            writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                                  units.Ki, 0, True)
+            writer.write(data)
+
+            self.assertEqual(md5_hash, writer.close())
+            self.assertEqual(1, len(gcs_http.requests))
+            self.assertEqual(uploads,
+                             insert.return_value.next_chunk.call_count)
+
+    def _range_reader(self, gcs_http, chunk_size=64, **kwargs):
+        """Return a GoogleObjectReader downloading from gcs_http."""
+        conn = mock.Mock()
+        conn.objects.return_value.get_media.return_value = (
+            fake_google_client.FakeGoogleMediaRequest(gcs_http))
+        return google_dr.GoogleObjectReader('bucket', 'backup_001', conn,
+                                            chunk_size, 3, **kwargs)
+
+    def test_reader_parallel_ranges(self):
+        data = os.urandom(10 * units.Ki + 100)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(data)
+        http_pool = google_dr.GoogleHttpPool(4, lambda: gcs_http)
+        reader = self._range_reader(gcs_http, units.Ki, download_workers=4,
+                                    http_pool=http_pool)
+
+        self.assertEqual(data, reader.read())
+        # First chunk learns the size, the rest is fetched by range.
+        self.assertEqual(11, len(gcs_http.requests))
+
+    def test_reader_ranges_align_to_chunk_size(self):
+        data = os.urandom(3 * units.Ki)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(data)
+        reader = self._range_reader(gcs_http, units.Ki)
+
+        self.assertEqual(data, reader.read())
+        self.assertEqual(['bytes=0-1023', 'bytes=1024-2047',
+                          'bytes=2048-3071'],
+                         [h['range'] for h in gcs_http.requests])
+
+    @mock.patch.object(google_dr.time, 'time')
+    def test_reader_adaptive_chunk_size(self, mock_time):
+        # Every request takes a second, so throughput grows with the size.
+        mock_time.side_effect = range(100)
+        data = os.urandom(10 * units.Ki)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(data)
+        chunk_sizer = google_dr.GoogleChunkSizer(units.Ki, 3 * units.Ki)
+        reader = self._range_reader(gcs_http, units.Ki,
+                                    chunk_sizer=chunk_sizer)
+
+        self.assertEqual(data, reader.read())
+        self.assertEqual(['bytes=0-1023', 'bytes=1024-3071',
+                          'bytes=3072-6143', 'bytes=6144-9215',
+                          'bytes=9216-12287'],
+                         [h['range'] for h in gcs_http.requests])
+
+    def test_chunk_sizer(self):
+        chunk_sizer = google_dr.GoogleChunkSizer(units.Mi, 4 * units.Mi)
+        chunk_sizer.update(units.Mi, 1.0)
+        self.assertEqual(2 * units.Mi, chunk_sizer.chunk_size)
+        # Slower than the previous request: keep the size.
+        chunk_sizer.update(2 * units.Mi, 4.0)
+        self.assertEqual(2 * units.Mi, chunk_sizer.chunk_size)
+        chunk_sizer.update(2 * units.Mi, 1.0)
+        chunk_sizer.update(3 * units.Mi, 1.0)
+        chunk_sizer.update(4 * units.Mi, 1.0)
+        self.assertEqual(4 * units.Mi, chunk_sizer.chunk_size)
+
+        chunk_sizer.shrink()
+        self.assertEqual(2 * units.Mi, chunk_sizer.chunk_size)
+        for _i in range(5):
+            chunk_sizer.shrink()
+        self.assertEqual(256 * units.Ki, chunk_sizer.chunk_size)
+
+    @mock.patch.object(google_dr.eventlet, 'sleep')
+    def test_reader_adaptive_chunk_size_shrinks_on_error(self, mock_sleep):
+        data = os.urandom(units.Mi)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(data)
+        request = gcs_http.request
+        gcs_http.request = mock.Mock(side_effect=[
+            (fake_google_client.FakeGoogleResponse(503), b''),
+            request('uri', headers={'range': 'bytes=0-524287'})])
+        downloader = google_dr.GoogleMediaIoBaseDownload(
+            None, fake_google_client.FakeGoogleMediaRequest(gcs_http),
+            units.Mi)
+        downloader.chunk_sizer = google_dr.GoogleChunkSizer(units.Mi,
+                                                            4 * units.Mi)
+
+        downloader.next_chunk(num_retries=1)
+
+        self.assertEqual(
+            'bytes=0-524287',
+            gcs_http.request.call_args_list[1][1]['headers']['range'])
+
+    def test_reader_small_object_single_get(self):
+        data = os.urandom(100)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(data)
+        reader = self._range_reader(gcs_http, units.Ki, object_size=200)
+
+        self.assertEqual(data, reader.read())
+        self.assertEqual([{}], gcs_http.requests)
+        self.assertEqual([data], list(reader.read_iter()))
+
+    def test_reader_large_object_ranged_get(self):
+        data = os.urandom(100)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(data)
+        reader = self._range_reader(gcs_http, object_size=100)
+
+        self.assertEqual(data, reader.read())
+        self.assertEqual(['bytes=0-63', 'bytes=64-127'],
+                         [h['range'] for h in gcs_http.requests])
+
+    def _goog_hash(self, data):
+        return 'crc32c=%s,md5=%s' % (
+            google_dr._encode_crc32c(google_dr._crc32c(data)).decode('utf-8'),
+            base64.b64encode(hashlib.md5(data).digest()).decode('utf-8'))
+
+    def test_reader_checks_goog_hash(self):
+        data = os.urandom(100)
+        for algorithm in ('md5', 'crc32c', 'both'):
+            gcs_http = fake_google_client.FakeGoogleRangeHttp(
+                data, self._goog_hash(data))
+            reader = self._range_reader(gcs_http,
+                                        checksum_algorithm=algorithm)
+            self.assertEqual(data, reader.read())
+
+            gcs_http = fake_google_client.FakeGoogleRangeHttp(
+                data, self._goog_hash(b'corrupt'))
+            reader = self._range_reader(gcs_http,
+                                        checksum_algorithm=algorithm)
+            self.assertRaises(exception.InvalidBackup, reader.read)
+
+    def test_reader_composite_object_checks_crc32c(self):
+        data = os.urandom(100)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(
+            data, 'crc32c=%s' % google_dr._encode_crc32c(
+                google_dr._crc32c(b'corrupt')).decode('utf-8'))
+        reader = self._range_reader(gcs_http, object_size=50)
+        self.assertRaises(exception.InvalidBackup, reader.read)
+
+    def test_reader_parallel_ranges_check_hash(self):
+        data = os.urandom(1000)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(
+            data, self._goog_hash(data))
+        reader = self._range_reader(gcs_http, checksum_algorithm='both',
+                                    download_workers=4)
+        self.assertEqual(data, reader.read())
+
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(
+            data, self._goog_hash(data[:-1] + b'x'))
+        reader = self._range_reader(gcs_http, checksum_algorithm='both',
+                                    download_workers=4)
+        self.assertRaises(exception.InvalidBackup, reader.read)
+
+    def test_downloader_hashes_out_of_order_ranges(self):
+        data = os.urandom(300)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(
+            data, self._goog_hash(data))
+        downloader = google_dr.GoogleMediaIoBaseDownload(
+            None, fake_google_client.FakeGoogleMediaRequest(gcs_http), 100)
+        downloader.checksum_algorithm = 'crc32c'
+        downloader.next_chunk()
+        self.assertEqual(google_dr._crc32c(data[:100]),
+                         downloader.checksum.crc32c)
+
+        resp, content = downloader.fetch_range(200, 299)
+        downloader.write(200, content)
+        self.assertEqual(google_dr._crc32c(data[:100]),
+                         downloader.checksum.crc32c)
+        resp, content = downloader.fetch_range(100, 199)
+        downloader.write(100, content)
+        self.assertEqual(google_dr._crc32c(data),
+                         downloader.checksum.crc32c)
+        downloader.check_hashes()
+
+    def test_reader_read_iter_holds_back_corrupt_chunk(self):
+        data = os.urandom(200)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(
+            data, self._goog_hash(b'corrupt'))
+        reader = self._range_reader(gcs_http)
+        chunks = reader.read_iter()
+
+        self.assertEqual(data[:64], next(chunks))
+        self.assertEqual(data[64:128], next(chunks))
+        self.assertEqual(data[128:192], next(chunks))
+        self.assertRaises(exception.InvalidBackup, next, chunks)
+
+    def test_writer_crc32c(self):
+        data = os.urandom(units.Ki)
+        crc32c = google_dr._encode_crc32c(google_dr._crc32c(data))
+        md5_hash = base64.b64encode(hashlib.md5(data).digest())
+        conn = mock.Mock()
+        insert = conn.objects.return_value.insert
+        insert.return_value.next_chunk.return_value = (
+            None, {'md5Hash': 'c3RhbGU=', 'crc32c': crc32c.decode('utf-8')})
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 3, True,
+                                              checksum_algorithm='crc32c')
+        writer.write(data)
+        self.assertIsNone(writer.checksum.md5)
+        self.assertEqual(crc32c, writer.close())
+
+        writer = google_dr.GoogleObjectWriter('bucket', 'object', conn,
+                                              units.Ki, 3, True,
+                                              checksum_algorithm='both')
+        writer.write(data)
+        self.assertRaises(exception.GCSConnectionFailure, writer.close)
+
+        insert.return_value.next_chunk.return_value = (
+            None, {'md5Hash': md5_hash.decode('utf-8'),
+                   'crc32c': crc32c.decode('utf-8')})
+        self.assertEqual(md5_hash, writer.close())
+
+    @gcs_client
+    def test_get_object_hashes_crc32c(self):
+        self.flags(backup_gcs_checksum_algorithm='crc32c')
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.conn = mock.Mock()
+        objects = service.conn.objects.return_value
+        objects.list.return_value.execute.return_value = {
+            'items': [{'name': 'prefix-00001', 'crc32c': 'AAAAAA=='}]}
+
+        self.assertEqual({'prefix-00001': 'AAAAAA=='},
+                         service._get_object_hashes('bucket', 'prefix'))
+        self.assertEqual('items(name,crc32c),nextPageToken',
+                         objects.list.call_args[1]['fields'])
+
+    @gcs_client
+    def test_get_object_reader_object_size(self):
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.object_sizes = {'backup_001': 10}
+        reader = service.get_object_reader('gcscinderbucket', 'backup_001')
+        self.assertEqual(10, reader.object_size)
+        reader = service.get_object_reader('gcscinderbucket', 'backup_002')
+        self.assertIsNone(reader.object_size)
+
+    def test_reader_read_view(self):
+        data = os.urandom(3 * units.Ki)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(data)
+        reader = self._range_reader(gcs_http, units.Ki)
+
+        view = reader.read_view()
+
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(data, view.tobytes())
+
+    def test_reader_read_iter(self):
+        data = os.urandom(3 * units.Ki)
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(data)
+        reader = self._range_reader(gcs_http, units.Ki)
+
+        chunks = list(reader.read_iter())
+
+        self.assertEqual(len(gcs_http.requests), len(chunks))
+        self.assertEqual(data, b''.join(chunks))
+
+    @gcs_client2
+    def test_restore_reader_streaming(self):
+        volume_id = '3c6f3a0e-1f2b-4c3d-8e4f-000000a7b9c1'
+        self.flags(backup_gcs_object_size=8 * units.Ki)
+        self.flags(backup_gcs_block_size=units.Ki)
+        self.flags(backup_gcs_reader_streaming=True)
+        self.flags(backup_compression_algorithm='bz2')
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container=container_name)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        service.backup(backup, self.volume_file)
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    def test_streaming_decompressor_writes_chunks(self):
+        data = os.urandom(4 * units.Ki) + b'\0' * (4 * units.Ki)
+        compressed = zlib.compress(data)
+        chunks = [compressed[i:i + 512]
+                  for i in range(0, len(compressed), 512)]
+        volume_file = mock.Mock()
+        decompressor = google_dr.GoogleStreamingDecompressor(zlib)
+
+        google_dr.GoogleStreamingVolumeFile(volume_file).write(
+            decompressor.decompress(google_dr.GoogleStreamedData(chunks)))
+
+        self.assertEqual(len(chunks) + 1, volume_file.write.call_count)
+        self.assertEqual(data, b''.join(call[0][0] for call in
+                                        volume_file.write.call_args_list))
+
+    @gcs_client2
+    def test_restore_prefetch(self):
+        volume_id = '8e3f1c52-91a4-4b8e-a1f0-00000072d1b4'
+        self.flags(backup_gcs_object_size=8 * units.Ki)
+        self.flags(backup_gcs_block_size=units.Ki)
+        self.flags(backup_gcs_prefetch_objects=3)
+        self.flags(backup_gcs_prefetch_max_bytes=16 * units.Ki)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container=container_name)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        service.backup(backup, self.volume_file)
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+        self.assertIsNone(service.prefetcher)
+
+    def test_prefetcher_memory_cap(self):
+        download = mock.Mock(side_effect=lambda name, gcs_http: name)
+        objects = [('backup_001', 10), ('backup_002', 10), ('backup_003', 10)]
+        http_pool = google_dr.GoogleHttpPool(1, mock.Mock())
+        prefetcher = google_dr.GoogleObjectPrefetcher(download, objects, 3,
+                                                      20, http_pool)
+        self.assertEqual(['backup_001', 'backup_002'],
+                         list(prefetcher._fetching))
+
+        self.assertEqual('backup_001', prefetcher.get('backup_001'))
+        self.assertEqual(['backup_002', 'backup_003'],
+                         list(prefetcher._fetching))
+        self.assertIsNone(prefetcher.get('backup_004'))
+        prefetcher.close()
+
+    def test_prefetcher_close_waits_for_running_fetches(self):
+        finished = []
+
+        def _download(name, gcs_http):
+            google_dr.eventlet.sleep(0.01)
+            finished.append(name)
+
+        objects = [('backup_001', 10), ('backup_002', 10)]
+        http_pool = google_dr.GoogleHttpPool(2, mock.Mock())
+        prefetcher = google_dr.GoogleObjectPrefetcher(_download, objects, 2,
+                                                      20, http_pool)
+        google_dr.eventlet.sleep(0)
+        prefetcher.close()
+
+        # The started fetches ran to the end and returned their connections.
+        self.assertEqual(['backup_001', 'backup_002'], finished)
+        self.assertEqual(2, len(http_pool._idle))
+
     @gcs_client
     def test_delete(self):
         volume_id = '9ab256c8-3175-4ad8-baa1-0000007f9d31'
@@ -519,6 +1512,211 @@ class GoogleBackupDriverTestCase(test.TestCase):
         service = google_dr.GoogleBackupDriver(self.ctxt)
         service.delete(backup)
 
+    def _list_then_fail(self, bucket, prefix):
+        yield 'backup_001'
+        yield 'backup_002'
+        raise exception.GCSApiFailure(reason='listing failed')
+
+    @gcs_client
+    @mock.patch.object(google_dr.GoogleBackupDriver, 'delete_object',
+                       autospec=True)
+    def test_delete_continues_after_listing_error(self, delete_object):
+        backup = self._create_backup_db_entry(container='gcscinderbucket',
+                                              service_metadata='backup')
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.get_container_entries = self._list_then_fail
+
+        service.delete(backup)
+        self.assertEqual(['backup_001', 'backup_002'],
+                         [c[0][2] for c in delete_object.call_args_list])
+
+        # Listing errors still fail restores.
+        self.assertRaises(exception.GCSApiFailure, list,
+                          service._generate_object_names(backup))
+
+    @gcs_client
+    @mock.patch.object(google_dr.GoogleBackupDriver, 'delete_objects',
+                       autospec=True)
+    def test_delete_batched_continues_after_listing_error(self,
+                                                          delete_objects):
+        self.flags(backup_gcs_delete_batch_size=2)
+        self.flags(backup_gcs_delete_workers=2)
+        backup = self._create_backup_db_entry(container='gcscinderbucket',
+                                              service_metadata='backup')
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.get_container_entries = self._list_then_fail
+
+        service.delete(backup)
+        delete_objects.assert_called_once_with(
+            service, 'gcscinderbucket', ['backup_001', 'backup_002'],
+            mock.ANY)
+
+    @gcs_client
+    @mock.patch.object(google_dr.GoogleBackupDriver, 'delete_objects',
+                       autospec=True)
+    def test_delete_batched(self, delete_objects):
+        self.flags(backup_gcs_delete_batch_size=2)
+        self.flags(backup_gcs_delete_workers=2)
+        volume_id = 'c1f5b2a0-54f4-4f52-8f3a-000000f1b2c3'
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container='gcscinderbucket',
+                                              service_metadata='backup')
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.delete(backup)
+
+        batches = sorted(c[0][2] for c in delete_objects.call_args_list)
+        self.assertEqual([['backup_001', 'backup_002'], ['backup_003']],
+                         batches)
+
+    @gcs_client
+    @mock.patch.object(google_dr.volume_utils, 'notify_about_backup_usage')
+    @mock.patch.object(google_dr.GoogleBackupDriver, 'delete_object',
+                       autospec=True)
+    def test_delete_parallel_progress(self, delete_object, mock_notify):
+        self.flags(backup_gcs_delete_workers=3)
+        self.flags(backup_object_number_per_notification=2)
+        self.flags(backup_gcs_enable_progress_timer=False)
+        volume_id = 'c1f5b2a0-54f4-4f52-8f3a-000000f1b2c5'
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container='gcscinderbucket',
+                                              service_metadata='backup')
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.delete(backup)
+
+        self.assertEqual(['backup_001', 'backup_002', 'backup_003'],
+                         sorted(c[0][2] for c in delete_object.call_args_list))
+        self.assertEqual(2, mock_notify.call_count)
+        mock_notify.assert_called_with(
+            self.ctxt, backup, 'deleteprogress',
+            extra_usage_info={'objects_deleted': 3, 'objects_total': 3,
+                              'delete_percent': 100})
+
+    @mock.patch.object(google_dr.eventlet, 'sleep')
+    @mock.patch.object(google_dr.random, 'uniform', lambda a, b: b)
+    def test_retry_policy_backoff(self, mock_sleep):
+        self.flags(backup_gcs_retry_max_delay=8)
+        response = fake_google_client.FakeGoogleResponse
+        func = mock.Mock(side_effect=[
+            google_dr.errors.HttpError(response(503), b''),
+            google_dr.errors.HttpError(response(429), b''),
+            google_dr.errors.HttpError(
+                response(429, {'retry-after': '20'}), b''),
+            'done'])
+        retry_policy = google_dr.GoogleRetryPolicy(3)
+
+        self.assertEqual('done', retry_policy.call(func, 'arg', key='value'))
+
+        func.assert_called_with('arg', key='value')
+        self.assertEqual([3, 8, 20],
+                         [c[0][0] for c in mock_sleep.call_args_list])
+
+    @mock.patch.object(google_dr.eventlet, 'sleep')
+    def test_retry_policy_not_retryable(self, mock_sleep):
+        func = mock.Mock(side_effect=google_dr.errors.HttpError(
+            fake_google_client.FakeGoogleResponse(404), b''))
+        retry_policy = google_dr.GoogleRetryPolicy(3)
+
+        self.assertRaises(google_dr.errors.HttpError, retry_policy.call, func)
+        self.assertEqual(1, func.call_count)
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch.object(google_dr.eventlet, 'sleep')
+    def test_retry_policy_budget(self, mock_sleep):
+        error = google_dr.errors.HttpError(
+            fake_google_client.FakeGoogleResponse(503), b'')
+        retry_policy = google_dr.GoogleRetryPolicy(3, budget=1)
+
+        func = mock.Mock(side_effect=[error, 'done'])
+        self.assertEqual('done', retry_policy.call(func))
+        func = mock.Mock(side_effect=[error, 'done'])
+        self.assertRaises(google_dr.errors.HttpError, retry_policy.call, func)
+        self.assertEqual(1, mock_sleep.call_count)
+
+    @mock.patch.object(google_dr.eventlet, 'sleep')
+    def test_reader_retries_range(self, mock_sleep):
+        gcs_http = fake_google_client.FakeGoogleRangeHttp(b'x' * 100)
+        request = fake_google_client.FakeGoogleMediaRequest(gcs_http,
+                                                            'http://object')
+        downloader = google_dr.GoogleMediaIoBaseDownload(None, request, 10)
+        gcs_http.request = mock.Mock(side_effect=[
+            (fake_google_client.FakeGoogleResponse(503), b''),
+            gcs_http.request('http://object', headers={'range': 'bytes=0-9'})])
+
+        resp, content = downloader.fetch_range(0, 9, num_retries=1)
+
+        self.assertEqual(b'x' * 10, content)
+        self.assertEqual(1, mock_sleep.call_count)
+
+    @mock.patch.object(google_dr.eventlet, 'sleep')
+    @mock.patch.object(google_dr.time, 'time', return_value=100.0)
+    def test_rate_limiter(self, mock_time, mock_sleep):
+        rate_limiter = google_dr.GoogleRateLimiter(10)
+        rate_limiter.acquire()
+        self.assertFalse(mock_sleep.called)
+        rate_limiter.acquire(5)
+        rate_limiter.acquire()
+        self.assertEqual(2, mock_sleep.call_count)
+        self.assertAlmostEqual(0.1, mock_sleep.call_args_list[0][0][0])
+        self.assertAlmostEqual(0.6, mock_sleep.call_args_list[1][0][0])
+
+    @gcs_client
+    def test_delete_batched_failure(self):
+        self.flags(backup_gcs_delete_batch_size=2)
+        volume_id = 'c1f5b2a0-54f4-4f52-8f3a-000000f1b2c4'
+        backup = self._create_backup_db_entry(volume_id=volume_id,
+                                              container='gcs_api_failure',
+                                              service_metadata='backup')
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        self.assertRaises(exception.GCSApiFailure, service.delete, backup)
+
+    @gcs_client
+    @mock.patch.object(google_dr.eventlet, 'sleep')
+    def test_delete_objects_retries_failed_deletes(self, mock_sleep):
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.conn = mock.Mock()
+        batches = []
+
+        def _new_batch(callback=None):
+            batch = fake_google_client.FakeGoogleBatchHttpRequest(callback)
+            batches.append(batch)
+            return batch
+
+        def _delete(bucket, object):
+            request = mock.Mock()
+            if object == 'backup_002' and len(batches) == 1:
+                request.execute.side_effect = google_dr.errors.HttpError(
+                    fake_google_client.FakeGoogleResponse(503), b'')
+            elif object == 'backup_003':
+                request.execute.side_effect = google_dr.errors.HttpError(
+                    fake_google_client.FakeGoogleResponse(404), b'')
+            return request
+
+        service.conn.new_batch_http_request.side_effect = _new_batch
+        service.conn.objects.return_value.delete.side_effect = _delete
+
+        service.delete_objects('gcsbucket',
+                               ['backup_001', 'backup_002', 'backup_003'])
+
+        self.assertEqual(2, len(batches))
+        self.assertEqual(['backup_002'],
+                         [request_id for request_id, _r
+                          in batches[1].requests])
+        self.assertEqual(1, mock_sleep.call_count)
+
+    @gcs_client
+    def test_delete_objects_fails_without_retry(self):
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.conn = mock.Mock()
+        service.conn.new_batch_http_request.side_effect = (
+            fake_google_client.FakeGoogleBatchHttpRequest)
+        delete = service.conn.objects.return_value.delete
+        delete.return_value.execute.side_effect = google_dr.errors.HttpError(
+            fake_google_client.FakeGoogleResponse(403), b'')
+
+        self.assertRaises(exception.GCSApiFailure, service.delete_objects,
+                          'gcsbucket', ['backup_001'])
+        self.assertEqual(1, service.conn.new_batch_http_request.call_count)
+
     @gcs_client
     def test_get_compressor(self):
         service = google_dr.GoogleBackupDriver(self.ctxt)
@@ -565,3 +1763,140 @@ class GoogleBackupDriverTestCase(test.TestCase):
 
         self.assertEqual('none', result[0])
         self.assertEqual(already_compressed_data, result[1])
+
+    def _start_server(self, storage=None):
+        """Point the driver at a local GCS server through apiclient."""
+        server = fake_google_server.FakeGoogleServer(storage).start()
+        self.addCleanup(server.stop)
+        discovery_file = os.path.join(self.temp_dir, 'storage-v1.json')
+        with open(discovery_file, 'w') as f:
+            f.write(server.discovery_document())
+        self.flags(backup_gcs_discovery_file=discovery_file,
+                   backup_gcs_retry_base_delay=0.01)
+        for name, value in (('_discovery_document', None),
+                            ('_credentials', {})):
+            patcher = mock.patch.object(google_dr, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(google_dr.client, 'GoogleCredentials',
+                                    fake_google_client.FakeGoogleCredentials)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return server.storage
+
+    def test_server_backup_restore_delete(self):
+        storage = self._start_server()
+        self.flags(backup_gcs_object_size=32 * units.Ki,
+                   backup_gcs_block_size=8 * units.Ki,
+                   backup_gcs_delete_batch_size=2)
+        volume_id = '5a2bf4ef-d5d8-4b1e-a1f6-00000000e2e0'
+        backup = self._create_backup_db_entry(volume_id=volume_id)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        service.backup(backup, self.volume_file)
+
+        objects = storage.buckets['gcscinderbucket']
+        # Two data objects plus the metadata and sha256 files.
+        self.assertEqual(4, len(objects))
+        self.assertEqual(4, storage.requests['objects.insert.multipart'])
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, volume_id, restored_file)
+            restored_file.flush()
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                                        restored_file.name, shallow=False))
+
+        service.delete(backup)
+        self.assertEqual({}, objects)
+        self.assertEqual(2, storage.requests['batch'])
+
+    def test_server_disk_store(self):
+        storage = fake_google_server.FakeGoogleStorage(store='disk')
+        self.addCleanup(storage.close)
+        self._start_server(storage)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.put_container('gcscinderbucket')
+        data = os.urandom(units.Ki)
+
+        with service.get_object_writer('gcscinderbucket', 'object') as writer:
+            writer.write(data)
+        self.assertEqual(1, len(os.listdir(storage.directory)))
+        self.assertEqual(data, service.get_object_reader(
+            'gcscinderbucket', 'object').read())
+        service.delete_object('gcscinderbucket', 'object')
+        self.assertEqual([], os.listdir(storage.directory))
+
+        directory = storage.directory
+        storage.close()
+        self.assertFalse(os.path.exists(directory))
+
+    def test_server_discard_store(self):
+        storage = self._start_server(
+            fake_google_server.FakeGoogleStorage(store='discard'))
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.put_container('gcscinderbucket')
+
+        with service.get_object_writer('gcscinderbucket', 'object') as writer:
+            writer.write(os.urandom(units.Ki))
+        resource, stored = storage.buckets['gcscinderbucket']['object']
+        self.assertEqual(units.Ki, len(stored))
+        self.assertEqual(str(units.Ki), resource['size'])
+        reader = service.get_object_reader('gcscinderbucket', 'object')
+        self.assertRaises(exception.GCSApiFailure, reader.read)
+
+    def test_server_batch_keeps_content_id(self):
+        storage = fake_google_server.FakeGoogleStorage()
+        body = ('--boundary\r\nContent-Type: application/http\r\n'
+                'Content-ID: <9f2c0c56-c1b6-4b3b-a1c9-3f2b6a0c5b1e\r\n'
+                ' + 1>\r\n\r\n'
+                'DELETE /storage/v1/b/bucket/o/object HTTP/1.1\r\n\r\n'
+                '--boundary--\r\n')
+
+        status, headers, response = storage.handle(
+            'POST', '/batch/storage/v1',
+            {}, {'content-type': 'multipart/mixed; boundary="boundary"'},
+            body.encode('utf-8'))
+
+        self.assertEqual(200, status)
+        self.assertIn('Content-ID: <response-9f2c0c56-c1b6-4b3b-a1c9-'
+                      '3f2b6a0c5b1e + 1>', response)
+
+    def test_server_resumable_upload_retries(self):
+        storage = self._start_server()
+        self.flags(backup_gcs_writer_resumable_threshold=0)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.put_container('gcscinderbucket')
+        storage.fail_next(503, 503)
+        data = os.urandom(units.Ki)
+
+        with service.get_object_writer('gcscinderbucket', 'object') as writer:
+            writer.write(data)
+
+        resource, stored = storage.buckets['gcscinderbucket']['object']
+        self.assertEqual(data, stored)
+        self.assertEqual(3, storage.requests['objects.insert.resumable'])
+        self.assertEqual(data, service.get_object_reader(
+            'gcscinderbucket', 'object').read())
+
+    def test_server_list_pages(self):
+        storage = self._start_server()
+        self.flags(backup_gcs_list_page_size=2)
+        service = google_dr.GoogleBackupDriver(self.ctxt)
+        service.put_container('gcscinderbucket')
+        names = ['backup/object-%05d' % i for i in range(5)]
+        for name in names + ['other']:
+            with service.get_object_writer('gcscinderbucket',
+                                           name) as writer:
+                writer.write(b'data')
+
+        self.assertEqual(names, list(service.get_container_entries(
+            'gcscinderbucket', 'backup/')))
+        self.assertEqual(3, storage.requests['objects.list'])
+
+    def test_build_http_does_not_follow_308(self):
+        if not hasattr(httplib2.Http(), 'redirect_codes'):
+            self.skipTest('httplib2 does not follow 308 redirects')
+        gcs_http = google_dr._build_http(
+            fake_google_client.FakeGoogleCredentials())
+
+        self.assertNotIn(308, gcs_http.redirect_codes)
@@ -0,0 +1,384 @@
+# Copyright (C) 2016 Google Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests for the asyncio transport of the Google Backup code.
+
+"""
+import base64
+import collections
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+
+import mock
+from oslo_utils import units
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+from cinder.backup.drivers import google as google_dr
+from cinder import exception
+from cinder import test
+
+if web is not None:
+    from cinder.backup.drivers import google_asyncio
+
+
+AccessToken = collections.namedtuple('AccessToken',
+                                     ['access_token', 'expires_in'])
+
+
+class FakeGCSApp(object):
+    """In-memory GCS serving the JSON API requests the transport sends."""
+
+    def __init__(self):
+        self.buckets = set()
+        self.objects = {}
+        self.requests = []
+        # Resumable upload sessions, the object name and data received.
+        self.uploads = {}
+        # HTTP statuses returned instead of handling the next requests,
+        # None to handle one.
+        self.errors = []
+        self.app = web.Application(middlewares=[self._record])
+        self.app.router.add_get('/storage/v1/b/{bucket}', self.get_bucket)
+        self.app.router.add_post('/storage/v1/b', self.insert_bucket)
+        self.app.router.add_get('/storage/v1/b/{bucket}/o', self.list)
+        self.app.router.add_post('/upload/storage/v1/b/{bucket}/o',
+                                 self.insert)
+        self.app.router.add_put('/upload/storage/v1/b/{bucket}/o',
+                                self.upload_chunk)
+        self.app.router.add_get('/storage/v1/b/{bucket}/o/{object}',
+                                self.get_media)
+        self.app.router.add_delete('/storage/v1/b/{bucket}/o/{object}',
+                                   self.delete)
+
+    @web.middleware
+    async def _record(self, request, handler):
+        self.requests.append((request.method, request.path,
+                              request.headers.get('Range')))
+        status = self.errors.pop(0) if self.errors else None
+        if status is not None:
+            return web.Response(status=status)
+        return await handler(request)
+
+    def _resource(self, name):
+        data = self.objects[name]
+        return {'name': name,
+                'md5Hash': base64.b64encode(
+                    hashlib.md5(data).digest()).decode('utf-8'),
+                'crc32c': google_dr._encode_crc32c(
+                    google_dr._crc32c(data)).decode('utf-8')}
+
+    async def get_bucket(self, request):
+        if request.match_info['bucket'] not in self.buckets:
+            return web.Response(status=404)
+        return web.json_response({'name': request.match_info['bucket']})
+
+    async def insert_bucket(self, request):
+        body = await request.json()
+        self.buckets.add(body['name'])
+        return web.json_response(body)
+
+    async def list(self, request):
+        names = sorted(name for name in self.objects
+                       if name.startswith(request.query.get('prefix', '')))
+        start = int(request.query.get('pageToken', 0))
+        end = start + int(request.query['maxResults'])
+        page = {'items': [{'name': name} for name in names[start:end]]}
+        if end < len(names):
+            page['nextPageToken'] = str(end)
+        return web.json_response(page)
+
+    async def insert(self, request):
+        if request.query.get('uploadType') == 'resumable':
+            upload_id = str(len(self.uploads))
+            self.uploads[upload_id] = (request.query['name'], bytearray())
+            location = request.url.with_query(upload_id=upload_id)
+            return web.Response(headers={'Location': str(location)})
+        self.objects[request.query['name']] = await request.read()
+        return web.json_response(self._resource(request.query['name']))
+
+    async def upload_chunk(self, request):
+        name, data = self.uploads[request.query['upload_id']]
+        content_range, size = request.headers['Content-Range'].split('/')
+        if not content_range.endswith('*'):
+            start = int(content_range.split()[1].split('-')[0])
+            del data[start:]
+            data += await request.read()
+        if len(data) < int(size):
+            headers = {}
+            if data:
+                headers['Range'] = 'bytes=0-%d' % (len(data) - 1)
+            return web.Response(status=308, headers=headers)
+        self.objects[name] = bytes(data)
+        return web.json_response(self._resource(name))
+
+    async def get_media(self, request):
+        name = request.match_info['object']
+        if name not in self.objects:
+            return web.Response(status=404)
+        data = self.objects[name]
+        resource = self._resource(name)
+        headers = {'x-goog-hash': 'crc32c=%s,md5=%s' % (
+            resource['crc32c'], resource['md5Hash'])}
+        start, end = request.headers['Range'].split('=')[1].split('-')
+        start, end = int(start), min(int(end), len(data) - 1)
+        headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, len(data))
+        return web.Response(status=206, body=data[start:end + 1],
+                            headers=headers)
+
+    async def delete(self, request):
+        if self.objects.pop(request.match_info['object'], None) is None:
+            return web.Response(status=404)
+        return web.Response(status=204)
+
+
+@unittest.skipIf(web is None, 'aiohttp is not installed')
+class GoogleAsyncioTransportTestCase(test.TestCase):
+    """Test Case for the asyncio transport against an in-memory GCS."""
+
+    def setUp(self):
+        super(GoogleAsyncioTransportTestCase, self).setUp()
+        self.flags(backup_gcs_retry_base_delay=0.01)
+        self.gcs = FakeGCSApp()
+        credentials = mock.Mock()
+        credentials.get_access_token.return_value = AccessToken('token',
+                                                                3600)
+        # The port is only known once serving, so set the URLs after.
+        self.transport = google_asyncio.GoogleAsyncioTransport(
+            credentials, 'test-gcs', 3, concurrency=8)
+        self.addCleanup(self.transport.close)
+        self.runner = web.AppRunner(self.gcs.app)
+        self.transport._wait(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.transport._wait(site.start())
+        self.addCleanup(self._stop_runner)
+        port = self.runner.addresses[0][1]
+        root_url = 'http://127.0.0.1:%d/' % port
+        self.transport.api_url = root_url + 'storage/v1'
+        self.transport.upload_url = root_url + 'upload/storage/v1'
+
+    def _stop_runner(self):
+        self.transport._wait(self.runner.cleanup())
+
+    def test_put_container(self):
+        self.transport.put_container('bucket', 'US', 'NEARLINE')
+        self.transport.put_container('bucket', 'US', 'NEARLINE')
+
+        self.assertEqual({'bucket'}, self.gcs.buckets)
+        self.assertEqual(['GET', 'POST', 'GET'],
+                         [method for method, path, range_header
+                          in self.gcs.requests])
+
+    def test_list_objects_pages(self):
+        names = ['prefix-%05d' % i for i in range(5)]
+        for name in names + ['other']:
+            self.gcs.objects[name] = b'data'
+
+        objects = self.transport.list_objects('bucket', 'prefix',
+                                              page_size=2)
+        self.assertEqual({'name': names[0]}, next(objects))
+        self.assertEqual(1, len(self.gcs.requests))
+        self.assertEqual([{'name': name} for name in names[1:]],
+                         list(objects))
+        self.assertEqual(3, len(self.gcs.requests))
+
+    def test_write_and_read_object(self):
+        data = os.urandom(10 * units.Ki)
+        for algorithm in ('md5', 'crc32c', 'both'):
+            with self.transport.get_object_writer(
+                    'bucket', 'object', algorithm) as writer:
+                writer.write(data)
+            reader = self.transport.get_object_reader('bucket', 'object',
+                                                      4 * units.Ki, algorithm)
+            self.assertEqual(data, reader.read())
+        self.assertEqual(['bytes=0-4095', 'bytes=4096-8191',
+                          'bytes=8192-10239'],
+                         sorted(range_header for method, path, range_header
+                                in self.gcs.requests[-3:]))
+
+    def test_write_object_resumable(self):
+        data = os.urandom(10 * units.Ki)
+        # The second chunk fails, so GCS is asked what it received.
+        self.gcs.errors = [None, None, 503]
+
+        writer = self.transport.get_object_writer(
+            'bucket', 'object', 'md5', chunk_size=4 * units.Ki,
+            resumable_threshold=units.Ki)
+        writer.write(data)
+        writer.close()
+
+        self.assertEqual(data, self.gcs.objects['object'])
+        self.assertEqual(['POST', 'PUT', 'PUT', 'PUT', 'PUT', 'PUT'],
+                         [method for method, path, range_header
+                          in self.gcs.requests])
+
+    def test_read_object_corrupt(self):
+        self.gcs.objects['object'] = b'data'
+        self.gcs._resource = mock.Mock(return_value={
+            'md5Hash': 'c3RhbGU=', 'crc32c': 'AAAAAA=='})
+
+        reader = self.transport.get_object_reader('bucket', 'object',
+                                                  units.Ki, 'md5')
+        self.assertRaises(exception.InvalidBackup, reader.read)
+
+    def test_write_skips_stored_object(self):
+        data = b'data'
+        md5_hash = base64.b64encode(hashlib.md5(data).digest())
+        writer = self.transport.get_object_writer('bucket', 'object', 'md5',
+                                                  md5_hash)
+        writer.write(data)
+
+        self.assertEqual(md5_hash, writer.close())
+        self.assertEqual([], self.gcs.requests)
+
+    def test_upload_pool(self):
+        upload_pool = self.transport.get_upload_pool(2)
+        for name in ('a', 'b', 'c'):
+            with self.transport.get_object_writer(
+                    'bucket', name, 'md5', upload_pool=upload_pool) as writer:
+                writer.write(name.encode('utf-8'))
+        upload_pool.wait()
+        self.assertEqual({'a': b'a', 'b': b'b', 'c': b'c'},
+                         self.gcs.objects)
+
+        self.gcs.errors = [403]
+        with self.transport.get_object_writer(
+                'bucket', 'd', 'md5', upload_pool=upload_pool) as writer:
+            writer.write(b'd')
+        self.assertRaises(exception.GCSApiFailure, upload_pool.wait)
+        upload_pool.wait()
+
+    @mock.patch.object(google_dr, '_buckets', {'bucket': 0})
+    def test_delete_objects(self):
+        self.gcs.objects.update({'a': b'a', 'b': b'b'})
+
+        self.transport.delete_objects('bucket', ['a', 'b', 'c'])
+        self.assertEqual({}, self.gcs.objects)
+        self.assertEqual({'bucket': 0}, google_dr._buckets)
+        self.assertRaises(exception.GCSApiFailure,
+                          self.transport.delete_object, 'bucket', 'a')
+        self.assertEqual({}, google_dr._buckets)
+
+    def test_refreshes_token_before_scheduling(self):
+        self.transport._token_expiry = 0
+        credentials = self.transport.credentials
+        credentials.get_access_token.reset_mock()
+
+        self.transport.put_container('bucket', 'US', 'NEARLINE')
+        self.transport.put_container('bucket', 'US', 'NEARLINE')
+        credentials.get_access_token.assert_called_once_with()
+
+    def test_retry(self):
+        self.gcs.objects['object'] = b'data'
+        self.gcs.errors = [503, 429]
+
+        self.transport.delete_object('bucket', 'object')
+        self.assertEqual(3, len(self.gcs.requests))
+
+        self.gcs.errors = [403]
+        self.assertRaises(exception.GCSApiFailure,
+                          self.transport.put_container, 'bucket', 'US',
+                          'NEARLINE')
+
+    @mock.patch.object(google_dr, '_transports', {})
+    @mock.patch('cinder.backup.drivers.google.'
+                'GoogleBackupDriver.check_gcs_options')
+    @mock.patch.object(google_dr, '_get_credentials')
+    @mock.patch.object(google_dr, '_get_discovery_document',
+                       return_value=json.dumps({'rootUrl': 'http://gcs/'}))
+    @mock.patch.object(google_dr.discovery, 'build_from_document')
+    def test_driver_uses_transport(self, mock_build, mock_document,
+                                   mock_credentials, mock_check):
+        self.flags(backup_gcs_transport='asyncio',
+                   backup_gcs_upload_workers=4)
+        mock_credentials.return_value = (mock.Mock(), mock.MagicMock())
+        service = google_dr.GoogleBackupDriver(None)
+        self.addCleanup(service.transport.close)
+
+        self.assertEqual('http://gcs/storage/v1', service.transport.api_url)
+        self.assertIs(service.transport,
+                      google_dr.GoogleBackupDriver(None).transport)
+        self.assertIsInstance(service.upload_pool,
+                              google_asyncio.GoogleAsyncioUploadPool)
+        writer = service.get_object_writer('bucket', 'object')
+        self.assertIsInstance(writer,
+                              google_asyncio.GoogleAsyncioObjectWriter)
+        self.assertIs(service.upload_pool, writer.upload_pool)
+        self.assertIsInstance(service.get_object_reader('bucket', 'object'),
+                              google_asyncio.GoogleAsyncioObjectReader)
+
+    @mock.patch('cinder.backup.drivers.google.'
+                'GoogleBackupDriver.check_gcs_options')
+    @mock.patch.object(google_dr, '_get_credentials')
+    @mock.patch.object(google_dr, '_get_discovery_document',
+                       return_value='{}')
+    @mock.patch.object(google_dr.discovery, 'build_from_document')
+    def test_driver_transport_errors(self, mock_build, mock_document,
+                                     mock_credentials, mock_check):
+        mock_credentials.return_value = (mock.Mock(), mock.MagicMock())
+        service = google_dr.GoogleBackupDriver(None)
+        service.transport = self.transport
+
+        self.gcs.errors = [403]
+        self.assertRaises(exception.GCSApiFailure,
+                          service.put_container, 'bucket')
+        self.gcs.errors = [403]
+        self.assertRaises(exception.GCSApiFailure,
+                          list, service.get_container_entries('bucket',
+                                                              'prefix'))
+        self.gcs.errors = [403]
+        self.assertRaises(exception.GCSApiFailure,
+                          service.delete_object, 'bucket', 'object')
+
+
+_MONKEY_PATCHED_ROUND_TRIP = textwrap.dedent('''
+    import eventlet
+    eventlet.monkey_patch()
+
+    from cinder.tests.unit.backup import test_backup_google_asyncio as test
+
+    case = test.GoogleAsyncioTransportTestCase('test_upload_pool')
+    result = case.defaultTestResult()
+    case.run(result)
+    assert result.wasSuccessful(), result.errors + result.failures
+    ''')
+
+
+@unittest.skipIf(web is None, 'aiohttp is not installed')
+class GoogleAsyncioMonkeyPatchTestCase(test.TestCase):
+    """Test Case for the asyncio transport in an eventlet patched process."""
+
+    def test_monkey_patched_round_trip(self):
+        # cinder-backup monkey patches threading, which the event loop
+        # thread must not wait on, so run the transport in a new process.
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        proc = subprocess.Popen([sys.executable, '-c',
+                                 _MONKEY_PATCHED_ROUND_TRIP],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, env=env)
+        try:
+            output = proc.communicate(timeout=60)[0]
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            output = proc.communicate()[0]
+        self.assertEqual(0, proc.returncode, output)